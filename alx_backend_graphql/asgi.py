@@ -13,4 +13,11 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up: the schema pulls in the CRM models.
+from alx_backend_graphql.schema import schema  # noqa: E402
+from crm.websocket import GraphQLWebSocketApp  # noqa: E402
+
+# WebSocket connections to /graphql serve subscriptions; the rest is Django.
+application = GraphQLWebSocketApp(django_application, schema, path="/graphql")
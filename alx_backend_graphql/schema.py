@@ -1,5 +1,10 @@
 import graphene
-from crm.schema import Query as CRMQuery, Mutation as CRMMutation
+from crm.encoding import install_fast_paths
+from crm.schema import (
+    Query as CRMQuery,
+    Mutation as CRMMutation,
+    Subscription as CRMSubscription,
+)
 
 class Query(CRMQuery, graphene.ObjectType):
     hello = graphene.String(default_value="Hello, GraphQL!")
@@ -7,5 +12,9 @@ class Query(CRMQuery, graphene.ObjectType):
 class Mutation(CRMMutation, graphene.ObjectType):
     pass
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+class Subscription(CRMSubscription, graphene.ObjectType):
+    pass
+
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
+install_fast_paths(schema, ("CustomerNode", "ProductNode", "OrderNode"))
 
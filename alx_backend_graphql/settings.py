@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,12 +41,12 @@ INSTALLED_APPS = [
     # Third-party
     "graphene_django",
     "django_filters",
-    "django_crontab",
     # Local apps
     "crm",
 ]
 
 MIDDLEWARE = [
+    "crm.middleware.RequestLatencyMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -78,13 +79,261 @@ WSGI_APPLICATION = "alx_backend_graphql.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite profiles, picked with CRM_SQLITE_PROFILE ("default" is stock Django).
+# "production" is for the web tier, cron jobs and Celery workers sharing one
+# database file:
+# - WAL, so readers and the single writer stop blocking each other, with
+#   synchronous=NORMAL (durable at checkpoints; still safe from corruption)
+# - a 256 MB memory map and a 64 MB page cache per connection
+# - busy_timeout: a writer waits up to 5 s for the lock instead of failing
+# - persistent connections, checked before reuse
+# Under either profile the write paths begin with BEGIN IMMEDIATE
+# (crm.sqlite.write_transaction); other transactions stay deferred.
+SQLITE_PROFILES = {
+    "default": {},
+    "production": {
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA mmap_size=268435456;"
+                "PRAGMA cache_size=-65536;"
+                "PRAGMA busy_timeout=5000;"
+            ),
+        },
+    },
+}
+CRM_SQLITE_PROFILE = os.environ.get("CRM_SQLITE_PROFILE", "default")
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        **SQLITE_PROFILES[CRM_SQLITE_PROFILE],
+    },
+    # Local stand-in for a read replica, enabled through CRM_READ_REPLICAS.
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.replica.sqlite3",
+        **SQLITE_PROFILES[CRM_SQLITE_PROFILE],
+    },
+}
+
+DATABASE_ROUTERS = ["crm.routers.ReplicaRouter"]
+
+# Aliases that serve GraphQL query operations, e.g. CRM_READ_REPLICAS=replica
+CRM_READ_REPLICAS = [
+    alias for alias in os.environ.get("CRM_READ_REPLICAS", "").split(",") if alias
+]
+
+# Seconds a client keeps reading from the primary after a mutation
+CRM_READ_YOUR_WRITES_SECONDS = 5
+
+# totalCount on connections: "exact", "cached" or "estimated"
+CRM_COUNT_MODE = "exact"
+CRM_COUNT_CACHE_SECONDS = 300
+CRM_COUNT_SAMPLE_SIZE = 1000
+
+# Pub/sub behind GraphQL subscriptions. For several nodes on one host use
+# {"BACKEND": "crm.pubsub.SQLiteLogBroker", "OPTIONS": {"path": BASE_DIR / "events.sqlite3"}}
+CRM_PUBSUB = {
+    "BACKEND": "crm.pubsub.InMemoryBroker",
+    "OPTIONS": {"queue_size": 100},
+}
+CRM_SUBSCRIPTIONS_PER_CONNECTION = 10
+
+# Low-stock queue: restocks are applied in batches by the drain worker
+CRM_LOW_STOCK_BATCH_SIZE = 100
+CRM_RESTOCK_AMOUNT = 10
+
+# Batched GraphQL requests (a JSON array of operations in one POST)
+CRM_GRAPHQL_MAX_BATCH_SIZE = 10
+CRM_GRAPHQL_BATCH_PARALLEL = False
+CRM_GRAPHQL_BATCH_WORKERS = 4
+
+# Order archive: orders older than this many days move to the archive tables
+# (crm.tasks.archive_old_orders, or manage.py archive_orders), in batches.
+CRM_ORDER_ARCHIVE_DAYS = 365
+CRM_ORDER_ARCHIVE_BATCH_SIZE = 1000
+
+# HTTP caching of GET queries: Cache-Control by operation name ("default" for
+# the rest; the ETag always allows revalidation), and compression of GraphQL
+# responses above this size (brotli when installed, otherwise gzip).
+CRM_GRAPHQL_CACHE_CONTROL = {
+    "default": "no-cache",
+    "TopProducts": "public, max-age=300",
+}
+CRM_GRAPHQL_COMPRESS_MIN_BYTES = 1024
+
+# Encoding of GraphQL responses (crm.encoding): BACKEND "auto" uses orjson when
+# installed, otherwise the json module ("json", "orjson" or a dotted path pick
+# one). A result with a list of STREAM_MIN_ITEMS or more (a large page of edges)
+# is streamed, STREAM_CHUNK_ITEMS items at a time; 0 turns streaming off.
+CRM_GRAPHQL_ENCODER = {
+    "BACKEND": "auto",
+    "STREAM_MIN_ITEMS": 1000,
+    "STREAM_CHUNK_ITEMS": 500,
+}
+
+# On-demand profiling of /graphql requests: send a signed X-CRM-Profile header
+# (python manage.py profile_token) or sample a fraction of requests. Captures
+# are listed at /admin/crm/profiles/ for staff users.
+CRM_PROFILING = {
+    "SAMPLE_RATE": 0.0,
+    "DIR": "/tmp/crm_profiles",
+    "MAX_CAPTURES": 50,
+    "TOKEN_MAX_AGE": 3600,
+}
+
+# Admission control on /graphql: concurrency pools per operation type, each
+# with a bounded wait queue, and a per-client token bucket (RATE per second,
+# bursts up to BURST). Pool usage is exported at /metrics.
+CRM_ADMISSION = {
+    "POOLS": {
+        "mutation": {"size": 4, "queue": 16, "timeout": 2.0},
+        "query": {"size": 8, "queue": 32, "timeout": 2.0},
+    },
+    "RATE": 20.0,
+    "BURST": 100,
+}
+
+# Write-behind order ingestion (crm.ingest): createOrder queues orders in a
+# local SQLite file and returns a provisional id (see the orderStatus query).
+# Queued orders are written in batches of BATCH_SIZE, at most MAX_LATENCY
+# seconds after they arrive, by a thread in each web process, or with
+# FLUSH_IN_PROCESS off by `python manage.py flush_order_queue --loop`.
+CRM_ORDER_INGEST = {
+    "ENABLED": False,
+    "PATH": BASE_DIR / "order_queue.sqlite3",
+    "BATCH_SIZE": 100,
+    "MAX_LATENCY": 0.05,
+    "CLAIM_TIMEOUT": 30.0,
+    "RETAIN": 86400,
+    "FLUSH_IN_PROCESS": True,
 }
 
+# bulkUpdateProducts / manage.py bulk_update_products: changes per UPDATE
+# (capped by the database's query parameter limit)
+CRM_PRODUCT_UPDATE_BATCH_SIZE = 500
+
+# Process-local product catalog (crm.catalog) for order pricing and other
+# lookups by id; allProducts always queries the database. The database logs
+# each product write; a process more than MAX_INCREMENTAL writes behind
+# reloads everything. The nightly archive_old_orders job trims the log to its
+# last CHANGE_LOG_SIZE entries.
+CRM_CATALOG_CACHE = True
+CRM_CATALOG_MAX_INCREMENTAL = 1000
+CRM_CATALOG_CHANGE_LOG_SIZE = 10000
+
+# generate_crm_report: seconds the aggregate of a closed partition stays
+# cached. Its key holds the data versions of orders and customers, so any
+# write makes the next report recompute it; an edit or delete also makes the
+# order snapshot rebuild before it is read.
+CRM_REPORT_CACHE_SECONDS = 7 * 86400
+
+# Columnar order snapshot (crm.snapshot) read with NumPy by generate_crm_report
+# and orderStats. Refreshed incrementally on read, and rebuilt on read once
+# orders were edited or deleted (as well as nightly by beat). DIR is outside
+# the source tree; point CRM_ORDER_SNAPSHOT_DIR at persistent storage.
+CRM_ORDER_SNAPSHOT = {
+    "ENABLED": True,
+    "DIR": os.environ.get("CRM_ORDER_SNAPSHOT_DIR", "/tmp/crm_order_snapshot"),
+    "CHUNK_SIZE": 10000,
+}
+
+# Job log files (crm.joblog): lines are buffered and written in batches every
+# FLUSH_INTERVAL seconds (or BUFFER_LINES lines); files rotate at MAX_BYTES.
+# JobRun rows older than RETAIN_DAYS are deleted by the nightly archive job.
+CRM_JOB_LOG = {
+    "MAX_BYTES": 10 * 1024 * 1024,
+    "BACKUP_COUNT": 5,
+    "FLUSH_INTERVAL": 1.0,
+    "BUFFER_LINES": 1000,
+    "RETAIN_DAYS": 90,
+}
+
+# Scheduled jobs, all sent by Celery beat (crm.scheduling). SCHEDULE is a cron
+# expression; a run starts up to JITTER seconds late, is stopped after TIMEOUT
+# seconds, and holds a lock on the job meanwhile. A run that finds the previous
+# one still going is dropped (OVERLAP "skip") or folded into one more run after
+# it ("coalesce").
+CRM_JOBS = {
+    "log_crm_heartbeat": {
+        "TASK": "crm.cron.log_crm_heartbeat",
+        "SCHEDULE": "*/5 * * * *",
+        "TIMEOUT": 60,
+        "JITTER": 15,
+    },
+    # Restocks the products queued as their stock fell below the threshold.
+    "drain_low_stock_queue": {
+        "TASK": "crm.tasks.drain_low_stock_queue",
+        "SCHEDULE": "* * * * *",
+        "TIMEOUT": 50,
+    },
+    # Re-queues the products the event path missed.
+    "update_low_stock": {
+        "TASK": "crm.cron.update_low_stock",
+        "SCHEDULE": "0 */12 * * *",
+        "TIMEOUT": 1800,
+        "JITTER": 300,
+        "OVERLAP": "coalesce",
+    },
+    "clean_inactive_customers": {
+        "TASK": "crm.cron.clean_inactive_customers",
+        "SCHEDULE": "0 2 * * 0",
+        "TIMEOUT": 1800,
+        "JITTER": 300,
+    },
+    "archive_old_orders": {
+        "TASK": "crm.tasks.archive_old_orders",
+        "SCHEDULE": "30 3 * * *",
+        "TIMEOUT": 3600,
+        "JITTER": 300,
+    },
+    # Picks up edited and deleted orders, which incremental refreshes miss.
+    "rebuild_order_snapshot": {
+        "TASK": "crm.tasks.refresh_order_snapshot",
+        "KWARGS": {"rebuild": True},
+        "SCHEDULE": "0 4 * * *",
+        "TIMEOUT": 1800,
+        "JITTER": 300,
+    },
+    # Holds its lock until the merge step of the report has run.
+    "generate_crm_report": {
+        "TASK": "crm.tasks.generate_crm_report",
+        "SCHEDULE": "0 6 * * mon",
+        "TIMEOUT": 3600,
+        "JITTER": 600,
+        "OVERLAP": "coalesce",
+        "HOLDS_LOCK": True,
+    },
+    "send_order_reminders": {
+        "TASK": "crm.cron.send_order_reminders",
+        "SCHEDULE": "0 8 * * *",
+        "TIMEOUT": 600,
+        "JITTER": 300,
+    },
+}
+
+# Celery (crm.celery reads every CELERY_* setting). /readyz reports the
+# broker as a non-blocking check ("degraded" when down); set CELERY_BROKER_URL
+# empty to leave it out. The redis client comes with celery[redis].
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = os.environ.get(
+    "CELERY_RESULT_BACKEND", "redis://localhost:6379/0"
+)
+CELERY_ACCEPT_CONTENT = ["json"]
+CELERY_TASK_SERIALIZER = "json"
+CELERY_RESULT_SERIALIZER = "json"
+CELERY_TIMEZONE = "UTC"
+
+# Health probes: dependency checks are cached and bounded in time
+CRM_HEALTH_CACHE_SECONDS = 2.0
+CRM_HEALTH_CHECK_TIMEOUT = 1.0
+CRM_HEALTH_URL = "http://localhost:8000/readyz"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -121,9 +370,3 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = "static/"
-
-# Cron Jobs Configuration
-CRONJOBS = [
-    ("*/5 * * * *", "crm.cron.log_crm_heartbeat"),
-    ("0 */12 * * *", "crm.cron.update_low_stock"),
-]
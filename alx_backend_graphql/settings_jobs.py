@@ -0,0 +1,15 @@
+"""
+Settings for short-lived job processes (crm.jobs).
+
+Only the apps the jobs need are installed, so starting a job does not pull
+in the admin, GraphQL or filtering stacks.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    "django.contrib.contenttypes",
+    "crm",
+]
+
+MIDDLEWARE = []
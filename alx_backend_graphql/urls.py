@@ -16,11 +16,27 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
 from alx_backend_graphql.schema import schema
+from crm.views import (
+    CRMGraphQLView,
+    healthz,
+    metrics,
+    profile_capture_download,
+    profile_captures,
+    readyz,
+)
 
 urlpatterns = [
+    path("admin/crm/profiles/", profile_captures, name="crm-profile-captures"),
+    path(
+        "admin/crm/profiles/<str:capture_id>.<str:kind>",
+        profile_capture_download,
+        name="crm-profile-capture",
+    ),
     path("admin/", admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True, schema=schema))),
+    path("healthz", healthz, name="healthz"),
+    path("readyz", readyz, name="readyz"),
+    path("metrics", metrics, name="metrics"),
 ]
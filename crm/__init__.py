@@ -1,5 +1,14 @@
-# This will make sure the app is always imported when Django starts so that
-# shared_task will use this app.
-from .celery import app as celery_app
+# The Celery app is loaded on first use rather than at import, so processes
+# that never touch Celery (cron jobs, the job runner) don't pay for importing
+# it. crm.tasks imports it directly, which binds shared_task to this app.
+
+
+def __getattr__(name):
+    if name == "celery_app":
+        from .celery import app
+
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ("celery_app",)
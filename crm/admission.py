@@ -0,0 +1,209 @@
+"""
+Admission control for the GraphQL endpoint.
+
+Every request first takes a token from its client's bucket (API key, or IP
+address), then a slot in the pool for its operation type. Mutations and
+queries have separate pools, so a flood of slow reports cannot hold every
+worker thread while ``createOrder`` waits. When a pool is full, the request
+waits in a bounded queue for a limited time. If that queue is full or the
+wait times out, the request is turned away with a 429.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+
+DEFAULT_POOLS = {
+    "mutation": {"size": 4, "queue": 16, "timeout": 2.0},
+    "query": {"size": 8, "queue": 32, "timeout": 2.0},
+}
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(reason)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Take a token; return 0 on success, else the seconds until one is free."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class ClientLimiter:
+    """Token buckets for the most recently seen ``max_clients`` clients."""
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def take(self, client_key):
+        with self._lock:
+            bucket = self._buckets.pop(client_key, None)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[client_key] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            wait = bucket.take()
+            if wait:
+                self.rejected += 1
+            return wait
+
+
+class Pool:
+    """At most ``size`` requests at once, with up to ``queue`` more waiting."""
+
+    def __init__(self, name, size, queue, timeout):
+        self.name = name
+        self.size = size
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            if self.active >= self.size:
+                if self.waiting >= self.queue:
+                    self.rejected["queue_full"] += 1
+                    raise Rejected(f"The {self.name} queue is full", self.timeout)
+                self.waiting += 1
+                try:
+                    admitted = self._condition.wait_for(
+                        lambda: self.active < self.size, self.timeout
+                    )
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self.rejected["timeout"] += 1
+                    raise Rejected(
+                        f"Timed out waiting for a {self.name} slot", self.timeout
+                    )
+            self.active += 1
+            self.admitted += 1
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+
+class AdmissionController:
+    def __init__(self, pools=None, rate=None, burst=None):
+        self.pools = {
+            name: Pool(name, **options)
+            for name, options in (pools or DEFAULT_POOLS).items()
+        }
+        self.limiter = ClientLimiter(rate, burst or rate) if rate else None
+
+    @contextmanager
+    def admit(self, operation, client_key):
+        """Hold a slot of the ``operation`` pool for the duration of the block."""
+        if self.limiter is not None:
+            wait = self.limiter.take(client_key)
+            if wait:
+                raise Rejected("Rate limit exceeded", wait)
+        pool = self.pools["mutation" if operation == "mutation" else "query"]
+        pool.acquire()
+        try:
+            yield
+        finally:
+            pool.release()
+
+    def metrics(self):
+        """Pool usage and rejection counts in the Prometheus text format."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        pools = self.pools.values()
+        metric(
+            "crm_admission_pool_size",
+            "gauge",
+            "Concurrent requests allowed per pool.",
+            [({"pool": p.name}, p.size) for p in pools],
+        )
+        metric(
+            "crm_admission_pool_active",
+            "gauge",
+            "Requests currently holding a pool slot.",
+            [({"pool": p.name}, p.active) for p in pools],
+        )
+        metric(
+            "crm_admission_queue_depth",
+            "gauge",
+            "Requests waiting for a pool slot.",
+            [({"pool": p.name}, p.waiting) for p in pools],
+        )
+        metric(
+            "crm_admission_queue_size",
+            "gauge",
+            "Maximum requests that may wait for a pool slot.",
+            [({"pool": p.name}, p.queue) for p in pools],
+        )
+        metric(
+            "crm_admission_admitted_total",
+            "counter",
+            "Requests admitted to a pool.",
+            [({"pool": p.name}, p.admitted) for p in pools],
+        )
+        rejected = [
+            ({"pool": p.name, "reason": reason}, count)
+            for p in pools
+            for reason, count in p.rejected.items()
+        ]
+        if self.limiter is not None:
+            rejected.append(
+                ({"pool": "", "reason": "rate_limit"}, self.limiter.rejected)
+            )
+        metric(
+            "crm_admission_rejected_total",
+            "counter",
+            "Requests turned away with a 429.",
+            rejected,
+        )
+        return "\n".join(lines) + "\n"
+
+
+@lru_cache(maxsize=None)
+def get_admission_controller():
+    config = getattr(settings, "CRM_ADMISSION", {})
+    return AdmissionController(
+        pools=config.get("POOLS"), rate=config.get("RATE"), burst=config.get("BURST")
+    )
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
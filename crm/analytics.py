@@ -0,0 +1,192 @@
+"""
+Vectorized order analytics over the columnar snapshot (``crm.snapshot``).
+
+The snapshot columns are memory-mapped NumPy arrays, so a report over
+millions of orders is a handful of array operations rather than a loop over
+model instances, and nothing here touches the ORM. Money stays in integer
+cents until the result is turned back into Decimals.
+
+NumPy is optional: without it ``load_snapshot`` returns None and callers
+fall back to the database.
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .snapshot import (
+    LINK_COLUMNS,
+    ORDER_COLUMNS,
+    column_path,
+    from_micros,
+    get_config,
+    read_meta,
+    refresh_snapshot,
+    to_micros,
+)
+
+try:
+    import numpy as np
+except ImportError:  # optional: analytics fall back to the database
+    np = None
+
+CENTS = Decimal("0.01")
+
+
+class OrderSnapshot:
+    """The snapshot columns as read-only int64 arrays."""
+
+    def __init__(self, directory, meta):
+        self.meta = meta
+        self.scale = meta["scale"]
+        for column in ORDER_COLUMNS:
+            setattr(self, column, _column(directory, meta, column, meta["orders"]))
+        for column in LINK_COLUMNS:
+            setattr(self, column, _column(directory, meta, column, meta["links"]))
+
+    def __len__(self):
+        return len(self.order_id)
+
+    def money(self, cents):
+        return (Decimal(int(cents)) / self.scale).quantize(CENTS)
+
+
+def _column(directory, meta, column, rows):
+    if not rows:
+        return np.zeros(0, dtype=np.int64)
+    path = column_path(directory, meta, column)
+    return np.memmap(path, dtype=np.int64, mode="r", shape=(rows,))
+
+
+def load_snapshot(refresh=True):
+    """
+    The order snapshot, brought up to date first unless ``refresh`` is off;
+    None when NumPy is missing or the snapshot is disabled.
+    """
+    config = get_config()
+    if np is None or not config["ENABLED"]:
+        return None
+    if refresh:
+        meta = refresh_snapshot()
+    else:
+        meta = read_meta()
+        if meta is None:
+            return None
+    try:
+        return OrderSnapshot(config["DIR"], meta)
+    except FileNotFoundError:
+        # Replaced by a rebuild between reading meta.json and the columns.
+        return OrderSnapshot(config["DIR"], read_meta())
+
+
+def _window(snapshot, start=None, end=None):
+    """Boolean mask of the orders placed in [start, end)."""
+    mask = np.ones(len(snapshot), dtype=bool)
+    if start is not None:
+        mask &= snapshot.order_date >= to_micros(start)
+    if end is not None:
+        mask &= snapshot.order_date < to_micros(end)
+    return mask
+
+
+def window_totals(snapshot, start=None, end=None):
+    """``(orders, revenue)`` of the orders placed in [start, end)."""
+    cents = snapshot.total_cents[_window(snapshot, start, end)]
+    return int(cents.size), snapshot.money(cents.sum())
+
+
+def orders_by_day(snapshot, start=None, end=None):
+    """Orders and revenue per local day, for the days that had orders."""
+    mask = _window(snapshot, start, end)
+    dates, cents = snapshot.order_date[mask], snapshot.total_cents[mask]
+    if not dates.size:
+        return []
+
+    # Local midnights, so days follow the current time zone across DST.
+    first = timezone.localdate(from_micros(dates.min()))
+    last = timezone.localdate(from_micros(dates.max()))
+    days = [first + timedelta(days=n) for n in range((last - first).days + 1)]
+    midnights = np.array(
+        [to_micros(timezone.make_aware(datetime.combine(d, time.min))) for d in days],
+        dtype=np.int64,
+    )
+    day_index = np.searchsorted(midnights, dates, side="right") - 1
+
+    counts = np.bincount(day_index, minlength=len(days))
+    revenue = np.zeros(len(days), dtype=np.int64)
+    np.add.at(revenue, day_index, cents)
+    return [
+        {"day": day, "orders": int(count), "revenue": snapshot.money(total)}
+        for day, count, total in zip(days, counts, revenue)
+        if count
+    ]
+
+
+def customer_totals(snapshot, start=None, end=None, limit=None):
+    """Orders and revenue per customer, highest revenue first."""
+    mask = _window(snapshot, start, end)
+    customer_ids, inverse = np.unique(
+        snapshot.customer_id[mask], return_inverse=True
+    )
+    counts = np.bincount(inverse, minlength=len(customer_ids))
+    revenue = np.zeros(len(customer_ids), dtype=np.int64)
+    np.add.at(revenue, inverse, snapshot.total_cents[mask])
+
+    ranked = np.lexsort((customer_ids, -revenue))[:limit]
+    return [
+        {
+            "customer_id": int(customer_ids[i]),
+            "orders": int(counts[i]),
+            "revenue": snapshot.money(revenue[i]),
+        }
+        for i in ranked
+    ]
+
+
+def order_value_percentiles(snapshot, percentiles=(50, 90, 99), start=None, end=None):
+    """Order value at each percentile (linear interpolation), as Decimals."""
+    cents = snapshot.total_cents[_window(snapshot, start, end)]
+    if not cents.size:
+        return {p: None for p in percentiles}
+    values = np.percentile(cents, percentiles)
+    return {
+        p: (Decimal(repr(float(v))) / snapshot.scale).quantize(CENTS)
+        for p, v in zip(percentiles, values)
+    }
+
+
+def product_units(snapshot, start=None, end=None):
+    """{product id: units} over the orders placed in [start, end)."""
+    # Order ids are written in ascending order, so links map back by bisection.
+    rows = np.searchsorted(snapshot.order_id, snapshot.link_order_id)
+    in_window = _window(snapshot, start, end)[rows]
+    product_ids, units = np.unique(
+        snapshot.link_product_id[in_window], return_counts=True
+    )
+    return dict(zip(product_ids.tolist(), units.tolist()))
+
+
+def order_stats(snapshot, first_day, last_day, top_customers=10, percentiles=()):
+    """The ``orderStats`` answer over the orders placed on [first_day, last_day]."""
+    from .models import Customer
+    from .sales import _day_bounds
+
+    start, end = _day_bounds(first_day, last_day)
+    orders, revenue = window_totals(snapshot, start, end)
+    customers = customer_totals(snapshot, start, end, limit=top_customers)
+    by_pk = Customer.objects.in_bulk([row["customer_id"] for row in customers])
+    return {
+        "orders": orders,
+        "revenue": revenue,
+        "percentiles": [
+            {"percentile": p, "value": value}
+            for p, value in order_value_percentiles(
+                snapshot, percentiles, start, end
+            ).items()
+        ],
+        "by_day": orders_by_day(snapshot, start, end),
+        "top_customers": [
+            {**row, "customer": by_pk.get(row["customer_id"])} for row in customers
+        ],
+    }
@@ -0,0 +1,163 @@
+"""
+Order archive.
+
+Orders older than ``CRM_ORDER_ARCHIVE_DAYS`` are moved, along with their
+product links, from ``Order`` into ``ArchivedOrder``. Orders have no status,
+so any order past the horizon counts as closed. Each batch is copied and
+deleted in one transaction, so an interrupted run loses nothing and the next
+run picks up where it stopped.
+
+``orders_queryset`` builds the ``allOrders`` queryset. It adds the archive,
+via UNION ALL, only when the requested ``orderDateGte`` reaches back to the
+newest archived order. A union can only be ordered by the columns it selects,
+so other ``orderBy`` fields (e.g. ``customer__name``) are selected on both
+sides; ``crm.counting`` counts the two sides separately.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import BooleanField, F, Max, Value
+from django.utils import timezone
+
+from .filters import compiled_archived_order_filter, compiled_order_filter
+from .models import ArchivedOrder, ArchivedOrderProduct, Order, Product
+from .sqlite import write_transaction
+from .versions import get_data_version
+
+ORDER_FIELDS = ("id", "customer_id", "total_amount", "order_date", "provisional_id")
+
+
+def archive_cutoff(horizon_days=None):
+    days = horizon_days or getattr(settings, "CRM_ORDER_ARCHIVE_DAYS", 365)
+    return timezone.now() - timedelta(days=days)
+
+
+def _delete_rows(model, column, values, using):
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(model._meta.db_table)} "
+            f"WHERE {quote(column)} IN ({placeholders})",
+            values,
+        )
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to ``batch_size`` orders placed before ``cutoff``; returns how many."""
+    using = router.db_for_write(Order)
+    Link = Order.products.through
+    with write_transaction(using=using):
+        orders = list(
+            Order.objects.using(using)
+            .select_for_update()
+            .filter(order_date__lt=cutoff)
+            .order_by("pk")
+            .values_list(*ORDER_FIELDS)[:batch_size]
+        )
+        if not orders:
+            return 0
+        pks = [order[0] for order in orders]
+        links = Link.objects.using(using).filter(order_id__in=pks)
+
+        ArchivedOrder.objects.using(using).bulk_create(
+            [ArchivedOrder(**dict(zip(ORDER_FIELDS, order))) for order in orders],
+            ignore_conflicts=True,
+        )
+        ArchivedOrderProduct.objects.using(using).bulk_create(
+            [
+                ArchivedOrderProduct(archived_order_id=order_id, product_id=product_id)
+                for order_id, product_id in links.values_list("order_id", "product_id")
+            ],
+            ignore_conflicts=True,
+        )
+        # Plain DELETEs: going through the ORM would send a post_delete signal
+        # once per order.
+        _delete_rows(Link, "order_id", pks, using)
+        _delete_rows(Order, "id", pks, using)
+    return len(orders)
+
+
+def archive_orders(horizon_days=None, batch_size=None, max_batches=None):
+    """
+    Archive every order older than the horizon, batch by batch.
+
+    Returns the number of orders archived. ``max_batches`` bounds one run.
+    """
+    cutoff = archive_cutoff(horizon_days)
+    batch_size = batch_size or getattr(settings, "CRM_ORDER_ARCHIVE_BATCH_SIZE", 1000)
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        archived += moved
+        batches += 1
+    return archived
+
+
+def newest_archived_order_date():
+    """The order date of the newest archived order (None for an empty archive)."""
+    key = f"crm:order-archive:newest:{get_data_version(ArchivedOrder)}"
+    newest = cache.get(key)
+    if newest is None:
+        newest = ArchivedOrder.objects.aggregate(newest=Max("order_date"))["newest"]
+        cache.set(key, newest or "", timeout=None)
+    return newest or None
+
+
+def archive_reached(date_gte):
+    """Whether orders since ``date_gte`` (None: all time) include archived ones."""
+    newest = newest_archived_order_date()
+    return newest is not None and (date_gte is None or date_gte <= newest)
+
+
+def orders_queryset(data=None, order_by=None):
+    """
+    Orders matching the ``allOrders`` filter input, with archived orders
+    included (and flagged ``is_archived``) when the date range reaches them.
+    """
+    live = compiled_order_filter.filter(Order.objects.all(), data)
+    date_gte = compiled_order_filter.cleaned_value(data, "orderDateGte")
+    if not archive_reached(date_gte):
+        return live.order_by(*order_by) if order_by else live
+
+    archived = compiled_archived_order_filter.filter(
+        ArchivedOrder.objects.all(), data
+    ).values_list(*ORDER_FIELDS)
+    # Order the union so LIMIT/OFFSET pages are stable.
+    ordering, order_keys = _union_ordering(order_by or ["id"])
+    combined = live.annotate(
+        is_archived=Value(False, output_field=BooleanField()), **order_keys
+    ).union(
+        archived.annotate(
+            is_archived=Value(True, output_field=BooleanField()), **order_keys
+        ),
+        all=True,
+    )
+    return combined.order_by(*ordering)
+
+
+def _union_ordering(order_by):
+    """
+    The union's ORDER BY terms, and the expressions to select on both sides
+    for the fields it does not already select.
+    """
+    ordering, order_keys = [], {}
+    for n, term in enumerate(order_by):
+        descending, field = term.startswith("-"), term.lstrip("-")
+        field = "id" if field == "pk" else field
+        if field not in ORDER_FIELDS:
+            order_keys[f"order_key_{n}"] = F(field)
+            field = f"order_key_{n}"
+        ordering.append(f"-{field}" if descending else field)
+    return ordering, order_keys
+
+
+def archived_products(order_id):
+    return Product.objects.filter(archivedorderproduct__archived_order_id=order_id)
+
@@ -0,0 +1,98 @@
+"""
+Benchmark of bulk product updates: one CASE UPDATE per chunk vs. save().
+
+    python -m crm.benchmarks.bulk_update [--products 20000] [--batch-size 500]
+
+Builds a throwaway test database with random products, then reprices every
+product (and adjusts the stock of every other one) with ``update_products``,
+and times a sample of the same changes applied with one ``save()`` each.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+
+def seed(products):
+    from crm.models import Product
+
+    rng = random.Random(42)
+    Product.objects.bulk_create(
+        (
+            Product(
+                name=f"Product {i}",
+                price=Decimal(rng.randint(100, 50000)) / 100,
+                stock=rng.randint(20, 500),
+            )
+            for i in range(products)
+        ),
+        batch_size=1000,
+    )
+    return list(Product.objects.values_list("pk", flat=True))
+
+
+def price_feed(product_ids, rng):
+    for i, pk in enumerate(product_ids):
+        row = {"id": pk, "price": str(Decimal(rng.randint(100, 50000)) / 100)}
+        if i % 2:
+            row["stock_delta"] = rng.randint(-10, 10)
+        yield row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--save-sample", type=int, default=1000, help="Rows timed with save()."
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+    import django
+
+    django.setup()
+    from django.db import connection
+    from django.db.models import F
+
+    from crm.models import Product
+    from crm.product_updates import update_products
+
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        product_ids = seed(args.products)
+        rng = random.Random(7)
+
+        started = time.perf_counter()
+        updated, errors = update_products(
+            price_feed(product_ids, rng), batch_size=args.batch_size
+        )
+        bulk = time.perf_counter() - started
+        assert updated == len(product_ids) and not errors, errors[:5]
+
+        sample = product_ids[: args.save_sample]
+        started = time.perf_counter()
+        for row in price_feed(sample, rng):
+            product = Product.objects.get(pk=row["id"])
+            product.price = Decimal(row["price"])
+            if "stock_delta" in row:
+                product.stock = F("stock") + row["stock_delta"]
+            product.save()
+        per_row = time.perf_counter() - started
+
+        print(f"{args.products} products, batch size {args.batch_size}")
+        print(f"  update_products  {updated / bulk:10.0f} rows/s ({bulk:.2f} s)")
+        print(
+            f"  save() per row   {len(sample) / per_row:10.0f} rows/s "
+            f"(~{per_row / len(sample) * args.products:.1f} s for all)"
+        )
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Benchmark of GraphQL response encoding on large (10k-edge) pages.
+
+    python -m crm.benchmarks.graphql_encoding [--edges 10000] [--buyers 500]
+        [--repeat 5]
+
+Builds a throwaway test database with ``--edges`` customers, products and
+orders (placed by the first ``--buyers`` customers), then for one page of
+each of allOrders, allProducts and allCustomers reports:
+
+- execute: ``schema.execute`` on a plain schema vs. the shipped one, with the
+  Decimal/DateTime fast paths of ``crm.encoding``;
+- encode: the result encoded whole and streamed, with the json module and
+  with orjson (when installed), and the peak memory of each (tracemalloc);
+- request: the whole POST through ``CRMGraphQLView``, before (plain schema,
+  json, no streaming) and after (the shipped schema and settings).
+
+Times are the best of ``--repeat`` runs, each with a fresh request (so the
+per-request customer cache starts empty). graphene-django's debug middleware
+(on when DEBUG is) is left out, as in production.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+QUERIES = {
+    "allOrders": (
+        "{ allOrders(first: %d) { edges { node { id totalAmount orderDate "
+        "customer { id name email createdAt } } } } }"
+    ),
+    "allProducts": (
+        "{ allProducts(first: %d) { edges { node { id name price stock } } } }"
+    ),
+    "allCustomers": (
+        "{ allCustomers(first: %d) { edges { node { id name email phone "
+        "createdAt } } } }"
+    ),
+}
+
+
+def seed(count, buyers):
+    from crm.models import Customer, Order, Product
+
+    customers = Customer.objects.bulk_create(
+        (
+            Customer(name=f"Customer {i}", email=f"customer{i}@example.com")
+            for i in range(count)
+        ),
+        batch_size=1000,
+    )
+    Product.objects.bulk_create(
+        (
+            Product(name=f"Product {i}", price=Decimal(100 + i) / 100, stock=i % 50)
+            for i in range(count)
+        ),
+        batch_size=1000,
+    )
+    Order.objects.bulk_create(
+        (
+            Order(
+                customer=customers[i % buyers],
+                total_amount=Decimal(1000 + i) / 100,
+            )
+            for i in range(count)
+        ),
+        batch_size=1000,
+    )
+
+
+def timed(func, repeat):
+    """Best time in seconds of ``repeat`` calls, and the last result."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return min(times), result
+
+
+def peak_memory(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def consume(chunks):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--edges", type=int, default=10000)
+    parser.add_argument("--buyers", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+    import django
+
+    django.setup()
+    import graphene
+    from django.db import connection
+    from django.test import RequestFactory, override_settings
+
+    from alx_backend_graphql.schema import Mutation, Query, schema
+    from crm import encoding
+    from crm.views import CRMGraphQLView
+
+    plain = graphene.Schema(query=Query, mutation=Mutation)
+    encoders = [encoding.JSONEncoder()]
+    if encoding.orjson is not None:
+        encoders.append(encoding.OrjsonEncoder())
+    stream_config = {**encoding.get_config(), "STREAM_MIN_ITEMS": 1000}
+    factory = RequestFactory()
+    before_view = CRMGraphQLView.as_view(schema=plain, middleware=[])
+    after_view = CRMGraphQLView.as_view(schema=schema, middleware=[])
+
+    def post(view, query):
+        request = factory.post(
+            "/graphql", json.dumps({"query": query}), content_type="application/json"
+        )
+        return consume(view(request))
+
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        seed(args.edges, min(args.buyers, args.edges))
+        if encoding.orjson is None:
+            print("orjson is not installed: json module only")
+        for name, template in QUERIES.items():
+            query = template % args.edges
+
+            plain_s, _ = timed(
+                lambda: plain.execute(query, context_value=factory.get("/graphql")),
+                args.repeat,
+            )
+            fast_s, result = timed(
+                lambda: schema.execute(query, context_value=factory.get("/graphql")),
+                args.repeat,
+            )
+            assert not result.errors, result.errors
+            data = {"data": result.data}
+            size = len(encoders[0].dumps(data))
+            edges = len(result.data[name]["edges"])
+            print(f"{name} ({edges} edges, {size / 1e6:.1f} MB)")
+            print(
+                f"  execute  plain {plain_s * 1000:8.1f} ms"
+                f"   fast paths {fast_s * 1000:8.1f} ms"
+            )
+
+            for encoder in encoders:
+                whole_s, _ = timed(lambda: encoder.dumps(data), args.repeat)
+                streamed_s, _ = timed(
+                    lambda: consume(encoding.iter_encode(data, encoder, stream_config)),
+                    args.repeat,
+                )
+                whole_peak = peak_memory(lambda: encoder.dumps(data))
+                streamed_peak = peak_memory(
+                    lambda: consume(encoding.iter_encode(data, encoder, stream_config))
+                )
+                print(
+                    f"  encode   {encoder.name:6} {whole_s * 1000:7.1f} ms "
+                    f"(peak {whole_peak / 1e6:5.2f} MB)   streamed "
+                    f"{streamed_s * 1000:7.1f} ms (peak {streamed_peak / 1e6:5.2f} MB)"
+                )
+
+            with override_settings(CRM_READ_REPLICAS=[]):
+                with override_settings(
+                    CRM_GRAPHQL_ENCODER={"BACKEND": "json", "STREAM_MIN_ITEMS": 0}
+                ):
+                    before_s, _ = timed(lambda: post(before_view, query), args.repeat)
+                after_s, _ = timed(lambda: post(after_view, query), args.repeat)
+            print(
+                f"  request  before {before_s * 1000:7.1f} ms"
+                f"   after {after_s * 1000:7.1f} ms"
+                f" ({encoding.get_encoder().name}, streamed)"
+            )
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
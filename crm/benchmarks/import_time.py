@@ -0,0 +1,114 @@
+"""
+Import-time benchmark for CRM job processes.
+
+    python -m crm.benchmarks.import_time
+
+Starts fresh interpreters under ``-X importtime`` and compares the imports
+paid by the job runner (``crm.jobs``) with a full web-process setup. Modules
+the interpreter imports on its own (``site`` and friends) are left out.
+Exits non-zero when the job startup goes over ``IMPORT_BUDGET_MS`` or pulls
+in one of ``HEAVY_MODULES``.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+JOB_STARTUP = "from crm.jobs import setup; setup()"
+WEB_STARTUP = (
+    "import os; "
+    "os.environ['DJANGO_SETTINGS_MODULE'] = 'alx_backend_graphql.settings'; "
+    "import django; django.setup(); import crm.tasks, alx_backend_graphql.urls"
+)
+
+IMPORT_BUDGET_MS = int(os.environ.get("CRM_IMPORT_BUDGET_MS", 600))
+
+# Modules a job process should never pay for at startup.
+HEAVY_MODULES = (
+    "celery",
+    "gql",
+    "graphene",
+    "graphene_django",
+    "graphql",
+    "requests",
+    "django_filters",
+    "django.contrib.admin",
+)
+
+
+def measure(code):
+    """
+    Return {"total_ms", "modules", "slowest"} for the imports ``code`` triggers.
+    """
+    baseline = set(_parse(_run("pass")))
+    entries = _parse(_run(code))
+    top_level = [
+        (cumulative, name)
+        for name, (cumulative, depth) in entries.items()
+        if depth == 0 and name not in baseline
+    ]
+    return {
+        "total_ms": round(sum(us for us, _ in top_level) / 1000, 1),
+        "modules": set(entries) - baseline,
+        "slowest": [
+            (round(us / 1000, 1), name) for us, name in sorted(top_level)[:-11:-1]
+        ],
+    }
+
+
+def _run(code):
+    env = {k: v for k, v in os.environ.items() if k != "DJANGO_SETTINGS_MODULE"}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return completed.stderr
+
+
+def _parse(output):
+    """Map module name -> (cumulative microseconds, nesting depth)."""
+    entries = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries[name.strip()] = (int(cumulative), depth)
+    return entries
+
+
+def heavy_imports(modules):
+    return sorted(
+        module
+        for module in modules
+        if any(
+            module == heavy or module.startswith(heavy + ".") for heavy in HEAVY_MODULES
+        )
+    )
+
+
+def main():
+    job = measure(JOB_STARTUP)
+    web = measure(WEB_STARTUP)
+    print(f"web process startup: {web['total_ms']} ms ({len(web['modules'])} modules)")
+    print(f"job process startup: {job['total_ms']} ms ({len(job['modules'])} modules)")
+    print(f"budget:              {IMPORT_BUDGET_MS} ms")
+    print("slowest job imports:")
+    for ms, name in job["slowest"]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    heavy = heavy_imports(job["modules"])
+    if heavy:
+        print(f"heavy modules imported by jobs: {', '.join(heavy)}")
+    return 1 if heavy or job["total_ms"] > IMPORT_BUDGET_MS else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,746 @@
+"""
+Load generator for the GraphQL endpoint.
+
+    python -m crm.benchmarks.load [--app wsgi|asgi | --url URL]
+        [--concurrency 8] [--rps 200] [--duration 30]
+        [--mix list_orders=3,create_order=1,...] [--save results.json]
+    python -m crm.benchmarks.load --compare wsgi.json asgi.json
+
+Drives ``alx_backend_graphql.wsgi.application`` (one thread per worker) or
+``asgi.application`` (one task per worker) in this process, or a running
+server at ``--url`` over a local socket. In process, a throwaway test
+database is seeded first (``--customers``, ``--products``, ``--orders``);
+a server at ``--url`` is loaded with the data it already has.
+
+The loop is closed: each of ``--concurrency`` workers waits for its response
+before sending the next request. With ``--rps`` the requests are also paced
+to a fixed schedule, and latency is measured from the scheduled start, so
+time spent waiting for a free worker counts against the server.
+
+Per operation of the mix it reports throughput, error rate (transport
+errors, non-200 responses and GraphQL errors), latency percentiles and a
+histogram, and, in process, SQL statements per request. ``--save`` writes
+the results as JSON; ``--compare`` lines up saved runs, e.g. WSGI vs ASGI,
+or the same mix with ``DJANGO_SETTINGS_MODULE`` pointing at SQLite and at a
+local Postgres.
+"""
+
+import argparse
+import asyncio
+import bisect
+import contextvars
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+PATH = "/graphql"
+# Upper bounds (ms) of the latency histogram buckets; the last one is open.
+BUCKETS = tuple(2**n / 4 for n in range(17))  # 0.25 ms .. 16 s
+
+# ``variables(rng, fixture, serial)`` builds the variables of one request.
+Operation = namedtuple("Operation", "query variables")
+
+CUSTOMER_ID = "{ allCustomers(first: 500) { edges { node { id } } } }"
+PRODUCT_ID = "{ allProducts(first: 500) { edges { node { id } } } }"
+ORDER_COUNT = "{ allOrders(first: 1, countMode: EXACT) { totalCount } }"
+
+
+def _page_offset(rng, fixture, deep=False):
+    orders = fixture["orders"]
+    if not deep or orders <= 40:
+        return 0
+    return rng.randint(orders // 2, orders - 20)
+
+
+def _cursor(offset):
+    from graphql_relay import offset_to_cursor
+
+    return offset_to_cursor(offset - 1) if offset else None
+
+
+OPERATIONS = {
+    "list_customers": Operation(
+        "query ($filter: CustomerFilterInput) { allCustomers(first: 20, "
+        'filter: $filter, orderBy: ["name"]) { edges { node { id name email } } } }',
+        lambda rng, fixture, serial: {
+            "filter": {"nameIcontains": f"customer {rng.randint(0, 9)}"}
+        },
+    ),
+    "list_products": Operation(
+        "query ($filter: ProductFilterInput) { allProducts(first: 20, "
+        'filter: $filter, orderBy: ["price"]) { edges { node { id name price '
+        "stock } } } }",
+        lambda rng, fixture, serial: {
+            "filter": {"priceGte": rng.randint(1, 400), "stockGte": 1}
+        },
+    ),
+    "list_orders": Operation(
+        "query ($filter: OrderFilterInput) { allOrders(first: 20, "
+        'filter: $filter, orderBy: ["-order_date"]) { edges { node { id '
+        "totalAmount orderDate customer { name } products { name } } } } }",
+        lambda rng, fixture, serial: {
+            "filter": {"totalAmountGte": rng.randint(1, 1000)}
+        },
+    ),
+    "deep_page": Operation(
+        "query ($after: String) { allOrders(first: 20, after: $after, "
+        'orderBy: ["id"]) { edges { cursor node { id totalAmount } } '
+        "pageInfo { hasNextPage } } }",
+        lambda rng, fixture, serial: {
+            "after": _cursor(_page_offset(rng, fixture, deep=True))
+        },
+    ),
+    "create_order": Operation(
+        "mutation ($input: OrderInput!) { createOrder(input: $input) { "
+        "order { id totalAmount } provisionalId errors } }",
+        lambda rng, fixture, serial: {
+            "input": {
+                "customerId": rng.choice(fixture["customers"]),
+                "productIds": rng.sample(
+                    fixture["products"], min(len(fixture["products"]), 3)
+                ),
+            }
+        },
+    ),
+    "bulk_create_customers": Operation(
+        "mutation ($input: [CustomerInput]!) { bulkCreateCustomers(input: $input) "
+        "{ customers { id } errors } }",
+        lambda rng, fixture, serial: {
+            "input": [
+                {
+                    "name": f"Load {serial}-{i}",
+                    "email": f"load-{fixture['run']}-{serial}-{i}@example.com",
+                }
+                for i in range(10)
+            ]
+        },
+    ),
+    "bulk_update_products": Operation(
+        "mutation ($input: [ProductUpdateInput]!) { bulkUpdateProducts("
+        "input: $input) { updatedCount errors } }",
+        lambda rng, fixture, serial: {
+            "input": [
+                {"id": pk, "stockDelta": 1}
+                for pk in rng.sample(
+                    fixture["products"], min(len(fixture["products"]), 20)
+                )
+            ]
+        },
+    ),
+}
+
+DEFAULT_MIX = (
+    "list_customers=3,list_products=3,list_orders=3,deep_page=1,"
+    "create_order=2,bulk_create_customers=1,bulk_update_products=1"
+)
+
+
+def parse_mix(value):
+    """Parse "name=weight,..." into {name: weight}."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in value.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}: {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    if not mix or not any(mix.values()):
+        raise ValueError("The mix is empty")
+    return mix
+
+
+# SQL statements run on behalf of the current request (in process only).
+_sql_count = contextvars.ContextVar("crm_load_sql_count", default=None)
+
+
+def _count_sql(execute, sql, params, many, context):
+    counter = _sql_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_sql_counter(connection, **kwargs):
+    if _count_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_sql)
+
+
+@contextmanager
+def count_sql():
+    """Count the SQL statements of in-process requests, on every connection."""
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(_install_sql_counter)
+    for alias in connections:
+        _install_sql_counter(connections[alias])
+    try:
+        yield
+    finally:
+        # Connections of other threads keep the wrapper; unset, it only counts
+        # nothing.
+        connection_created.disconnect(_install_sql_counter)
+        for alias in connections:
+            if _count_sql in connections[alias].execute_wrappers:
+                connections[alias].execute_wrappers.remove(_count_sql)
+
+
+def _request_body(name, rng, fixture, serial):
+    operation = OPERATIONS[name]
+    return json.dumps(
+        {
+            "query": operation.query,
+            "variables": operation.variables(rng, fixture, serial),
+        }
+    ).encode()
+
+
+def _failed(status, body):
+    if status != 200:
+        return f"HTTP {status}"
+    try:
+        errors = json.loads(body).get("errors")
+    except (ValueError, AttributeError):
+        return "invalid JSON"
+    return errors[0].get("message", "GraphQL error") if errors else None
+
+
+class WSGITransport:
+    def __init__(self, application=None):
+        if application is None:
+            from alx_backend_graphql.wsgi import application
+        self.application = application
+        self.label = "wsgi"
+
+    def request(self, body, client):
+        import io
+
+        status = []
+        environ = {
+            "REQUEST_METHOD": "POST",
+            "PATH_INFO": PATH,
+            "SCRIPT_NAME": "",
+            "QUERY_STRING": "",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": "127.0.0.1",
+            "HTTP_HOST": "localhost",
+            "HTTP_X_API_KEY": client,
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.url_scheme": "http",
+            "wsgi.version": (1, 0),
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        response = self.application(
+            environ, lambda s, headers, exc_info=None: status.append(s)
+        )
+        try:
+            content = b"".join(response)
+        finally:
+            if hasattr(response, "close"):
+                response.close()  # fires request_finished
+        return int(status[0].split()[0]), content
+
+
+class ASGITransport:
+    def __init__(self, application=None):
+        if application is None:
+            from alx_backend_graphql.asgi import application
+        self.application = application
+        self.label = "asgi"
+
+    async def request(self, body, client):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": PATH,
+            "raw_path": PATH.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [
+                (b"host", b"localhost"),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-api-key", client.encode()),
+            ],
+            "client": ("127.0.0.1", 0),
+            "server": ("localhost", 80),
+        }
+        messages = iter([{"type": "http.request", "body": body, "more_body": False}])
+        disconnected = asyncio.Event()
+        status, chunks = [], []
+
+        async def receive():
+            message = next(messages, None)
+            if message is None:
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            return message
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body"):
+                    disconnected.set()
+
+        await self.application(scope, receive, send)
+        return status[0], b"".join(chunks)
+
+
+class HTTPTransport:
+    """A server at ``url``; one keep-alive connection per worker thread."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.path = parts.path or PATH
+        self.label = url
+        self._local = threading.local()
+
+    def request(self, body, client):
+        headers = {"Content-Type": "application/json", "X-Api-Key": client}
+        for attempt in (1, 2):
+            connection = getattr(self._local, "connection", None)
+            if connection is None:
+                connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=30
+                )
+                self._local.connection = connection
+            try:
+                connection.request("POST", self.path, body, headers)
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (ConnectionError, http.client.HTTPException):
+                connection.close()
+                self._local.connection = None
+                if attempt == 2:
+                    raise
+
+
+class Recorder:
+    """Latencies, errors and SQL counts of one operation."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.sql = []
+        self.messages = {}
+
+    def add(self, latency_ms, error, sql):
+        self.latencies.append(latency_ms)
+        if error:
+            self.errors += 1
+            self.messages[error] = self.messages.get(error, 0) + 1
+        if sql is not None:
+            self.sql.append(sql)
+
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        histogram = [0] * (len(BUCKETS) + 1)
+        for value in latencies:
+            histogram[bisect.bisect_left(BUCKETS, value)] += 1
+        return {
+            "count": count,
+            "throughput": count / elapsed if elapsed else 0.0,
+            "errors": self.errors,
+            "error_rate": self.errors / count if count else 0.0,
+            "error_messages": dict(
+                sorted(self.messages.items(), key=lambda item: -item[1])[:5]
+            ),
+            "mean_ms": sum(latencies) / count if count else None,
+            **{
+                f"p{p}_ms": _percentile(latencies, p) if count else None
+                for p in (50, 90, 99)
+            },
+            "max_ms": latencies[-1] if count else None,
+            "sql_per_request": sum(self.sql) / len(self.sql) if self.sql else None,
+            "histogram": histogram,
+        }
+
+
+def _percentile(ordered, p):
+    # Nearest rank.
+    return ordered[max(0, -(-len(ordered) * p // 100) - 1)]
+
+
+class Schedule:
+    """Hands out requests: which operation, and when it is due."""
+
+    def __init__(self, mix, duration, rps=None, seed=0):
+        self.names, self.weights = list(mix), list(mix.values())
+        self.duration = duration
+        self.rps = rps
+        self.rng = random.Random(seed)
+        self._slots = itertools.count()
+        self._lock = threading.Lock()
+        self.started = None
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def next(self):
+        """``(operation name, due time, serial)``, or None once the run is over."""
+        with self._lock:
+            serial = next(self._slots)
+            name = self.rng.choices(self.names, self.weights)[0]
+        if self.rps:
+            due = self.started + serial / self.rps
+        else:
+            due = time.perf_counter()
+        if due - self.started >= self.duration:
+            return None
+        return name, due, serial
+
+
+def _record(recorders, name, due, outcome, sql):
+    latency_ms = (time.perf_counter() - due) * 1000
+    if isinstance(outcome, Exception):
+        error = type(outcome).__name__
+    else:
+        error = _failed(*outcome)
+    recorders[name].add(latency_ms, error, sql)
+
+
+def _run_threads(transport, schedule, fixture, concurrency, clients, recorders):
+    def worker(index):
+        rng = random.Random(f"{schedule.rng.random()}-{index}")
+        client = f"load-{index % clients}"
+        while (slot := schedule.next()) is not None:
+            name, due, serial = slot
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            body = _request_body(name, rng, fixture, serial)
+            counter = [0]
+            token = _sql_count.set(counter)
+            try:
+                outcome = transport.request(body, client)
+            except Exception as e:
+                outcome = e
+            finally:
+                _sql_count.reset(token)
+            sql = counter[0] if fixture["sql"] else None
+            _record(recorders, name, due, outcome, sql)
+
+    threads = [
+        threading.Thread(target=worker, args=(i,), name=f"crm-load-{i}")
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+async def _run_tasks(transport, schedule, fixture, concurrency, clients, recorders):
+    async def worker(index):
+        rng = random.Random(f"{schedule.rng.random()}-{index}")
+        client = f"load-{index % clients}"
+        while (slot := schedule.next()) is not None:
+            name, due, serial = slot
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            body = _request_body(name, rng, fixture, serial)
+            counter = [0]
+            _sql_count.set(counter)  # each task runs in its own context
+            try:
+                outcome = await transport.request(body, client)
+            except Exception as e:
+                outcome = e
+            _record(recorders, name, due, outcome, counter[0])
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+
+def run_load(
+    transport,
+    fixture,
+    mix,
+    concurrency=8,
+    duration=10.0,
+    rps=None,
+    clients=None,
+    seed=0,
+):
+    """
+    Run ``mix`` against ``transport`` for ``duration`` seconds; returns the
+    results (see the module docstring).
+    """
+    recorders = {name: Recorder() for name in mix}
+    schedule = Schedule(mix, duration, rps=rps, seed=seed)
+    clients = clients or concurrency
+    schedule.start()
+    if isinstance(transport, ASGITransport):
+        asyncio.run(
+            _run_tasks(transport, schedule, fixture, concurrency, clients, recorders)
+        )
+    else:
+        _run_threads(transport, schedule, fixture, concurrency, clients, recorders)
+    elapsed = time.perf_counter() - schedule.started
+
+    total = Recorder()
+    for recorder in recorders.values():
+        total.latencies.extend(recorder.latencies)
+        total.errors += recorder.errors
+        total.sql.extend(recorder.sql)
+        for message, count in recorder.messages.items():
+            total.messages[message] = total.messages.get(message, 0) + count
+    return {
+        "config": {
+            "target": transport.label,
+            "concurrency": concurrency,
+            "rps": rps,
+            "duration": duration,
+            "clients": clients,
+            "mix": mix,
+            "settings": os.environ.get("DJANGO_SETTINGS_MODULE"),
+            "database": fixture.get("database"),
+            "python": platform.python_version(),
+        },
+        "elapsed": elapsed,
+        "total": total.summary(elapsed),
+        "operations": {
+            name: recorder.summary(elapsed) for name, recorder in recorders.items()
+        },
+    }
+
+
+def seed(customers, products, orders):
+    from django.utils import timezone
+
+    from crm.models import Customer, Order, Product
+
+    rng = random.Random(42)
+    Customer.objects.bulk_create(
+        (
+            Customer(name=f"Customer {i}", email=f"customer{i}@example.com")
+            for i in range(customers)
+        ),
+        batch_size=1000,
+    )
+    Product.objects.bulk_create(
+        (
+            Product(
+                name=f"Product {i}",
+                price=Decimal(rng.randint(100, 50000)) / 100,
+                stock=1_000_000,
+            )
+            for i in range(products)
+        ),
+        batch_size=1000,
+    )
+    customer_ids = list(Customer.objects.values_list("pk", flat=True))
+    product_ids = list(Product.objects.values_list("pk", flat=True))
+    now = timezone.now()
+    created = Order.objects.bulk_create(
+        (
+            Order(
+                customer_id=rng.choice(customer_ids),
+                total_amount=Decimal(rng.randint(100, 200000)) / 100,
+                order_date=now - timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+            )
+            for _ in range(orders)
+        ),
+        batch_size=1000,
+    )
+    Link = Order.products.through
+    Link.objects.bulk_create(
+        (
+            Link(order_id=order.pk, product_id=product_id)
+            for order in created
+            for product_id in rng.sample(product_ids, rng.randint(1, 3))
+        ),
+        batch_size=1000,
+    )
+
+
+def discover(transport):
+    """The ids and order count the operations draw from, read through the API."""
+    from graphql_relay import from_global_id
+
+    def ask(query):
+        body = json.dumps({"query": query}).encode()
+        if isinstance(transport, ASGITransport):
+            status, content = asyncio.run(transport.request(body, "load-setup"))
+        else:
+            status, content = transport.request(body, "load-setup")
+        error = _failed(status, content)
+        if error:
+            raise RuntimeError(f"{query}: {error}")
+        return json.loads(content)["data"]
+
+    def ids(data, field):
+        return [from_global_id(e["node"]["id"])[1] for e in data[field]["edges"]]
+
+    fixture = {
+        "customers": ids(ask(CUSTOMER_ID), "allCustomers"),
+        "products": ids(ask(PRODUCT_ID), "allProducts"),
+        "orders": ask(ORDER_COUNT)["allOrders"]["totalCount"],
+        "run": secrets.token_hex(4),
+        "sql": not isinstance(transport, HTTPTransport),
+    }
+    if not fixture["customers"] or not fixture["products"]:
+        raise RuntimeError("The target has no customers or products to order")
+    return fixture
+
+
+def _ms(value):
+    return f"{value:8.1f}" if value is not None else f"{'-':>8}"
+
+
+def print_results(results, out=sys.stdout):
+    config, total = results["config"], results["total"]
+    pacing = f"{config['rps']} req/s target" if config["rps"] else "closed loop"
+    out.write(
+        f"{config['target']}, {config['database'] or 'remote database'}: "
+        f"{config['concurrency']} workers, {pacing}, {results['elapsed']:.1f} s\n"
+        f"{total['count']} requests, {total['throughput']:.1f} req/s, "
+        f"{total['error_rate']:.2%} errors\n\n"
+    )
+    out.write(
+        f"{'operation':24}{'count':>8}{'req/s':>9}{'err%':>7}"
+        f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'sql/req':>9}\n"
+    )
+    for name, op in [*results["operations"].items(), ("total", total)]:
+        out.write(
+            f"{name:24}{op['count']:8d}{op['throughput']:9.1f}"
+            f"{op['error_rate'] * 100:7.1f}{_ms(op['p50_ms']):>9}{_ms(op['p90_ms']):>9}"
+            f"{_ms(op['p99_ms']):>9}{_ms(op['max_ms']):>9}"
+            f"{_ms(op['sql_per_request']):>9}\n"
+        )
+    if total["error_messages"]:
+        out.write("\nerrors:\n")
+        for message, count in total["error_messages"].items():
+            out.write(f"  {count:6d}  {message[:100]}\n")
+
+    out.write("\nlatency (all operations):\n")
+    histogram = total["histogram"]
+    peak = max(histogram) or 1
+    lower = 0.0
+    for upper, count in zip([*BUCKETS, None], histogram):
+        if count:
+            label = f"< {upper:g} ms" if upper is not None else f">= {lower:g} ms"
+            out.write(f"  {label:>12} {count:7d} {'#' * round(40 * count / peak)}\n")
+        lower = upper if upper is not None else lower
+
+
+def print_comparison(runs, out=sys.stdout):
+    """Throughput and p99 per operation, one column pair per saved run."""
+    names = list(dict.fromkeys(n for run in runs for n in run["operations"]))
+    out.write(f"{'':24}" + "".join(f"{run['label'][:22]:>24}" for run in runs) + "\n")
+    out.write(f"{'operation':24}" + f"{'req/s':>12}{'p99 ms':>12}" * len(runs) + "\n")
+    for name in [*names, "total"]:
+        row = f"{name:24}"
+        for run in runs:
+            op = run["total"] if name == "total" else run["operations"].get(name)
+            if op is None:
+                row += f"{'-':>12}{'-':>12}"
+            else:
+                row += f"{op['throughput']:12.1f}{_ms(op['p99_ms']):>12}"
+        out.write(row + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--app", choices=("wsgi", "asgi"), default="wsgi")
+    target.add_argument(
+        "--url", help="Load a running server, e.g. http://127.0.0.1:8000/graphql"
+    )
+    target.add_argument(
+        "--compare", nargs="+", metavar="RESULTS", help="Compare saved runs."
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rps", type=float, help="Pace requests to this rate.")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument(
+        "--clients",
+        type=int,
+        help="Distinct X-Api-Key values (default: one per worker), which "
+        "admission control rate-limits separately.",
+    )
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        runs = []
+        for path in args.compare:
+            with open(path) as f:
+                runs.append({"label": os.path.basename(path), **json.load(f)})
+        print_comparison(runs)
+        return 0
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+    import django
+
+    django.setup()
+    from django.db import connection
+
+    with ExitStack() as stack:
+        if args.url:
+            transport = HTTPTransport(args.url)
+        else:
+            if connection.vendor == "sqlite":
+                # A file, as in production, rather than the in-memory default.
+                directory = stack.enter_context(tempfile.TemporaryDirectory())
+                connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                    directory, "load.sqlite3"
+                )
+            test_db = connection.creation.create_test_db(verbosity=0)
+            stack.callback(connection.creation.destroy_test_db, test_db, verbosity=0)
+            seed(args.customers, args.products, args.orders)
+            stack.enter_context(count_sql())
+            transport = WSGITransport() if args.app == "wsgi" else ASGITransport()
+        fixture = discover(transport)
+        fixture["database"] = (
+            None if args.url else f"{connection.vendor} ({connection.display_name})"
+        )
+        results = run_load(
+            transport,
+            fixture,
+            args.mix,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            rps=args.rps,
+            clients=args.clients,
+            seed=args.seed,
+        )
+    print_results(results)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
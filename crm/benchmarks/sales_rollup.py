@@ -0,0 +1,114 @@
+"""
+Benchmark of the sales analytics queries: rollup table vs. raw join.
+
+    python -m crm.benchmarks.sales_rollup [--orders 20000] [--products 500]
+
+Builds a throwaway test database, fills it with random orders spread over a
+year, then times ``top_products`` (last 30 days) and ``sales_by_day`` read
+from ``ProductDailySales`` against the same answers computed by joining
+every order to its products.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def seed(orders, products, days=365):
+    from django.utils import timezone
+
+    from crm.models import Customer, Order, Product
+    from crm.sales import rebuild_daily_sales
+
+    rng = random.Random(42)
+    Product.objects.bulk_create(
+        Product(name=f"Product {i}", price=Decimal(rng.randint(100, 50000)) / 100)
+        for i in range(products)
+    )
+    customer = Customer.objects.create(name="Bench", email="bench@example.com")
+    product_ids = list(Product.objects.values_list("pk", flat=True))
+    now = timezone.now()
+    created = Order.objects.bulk_create(
+        Order(
+            customer=customer,
+            total_amount=Decimal(0),
+            order_date=now - timedelta(minutes=rng.randint(0, days * 24 * 60)),
+        )
+        for _ in range(orders)
+    )
+    Link = Order.products.through
+    Link.objects.bulk_create(
+        Link(order_id=order.pk, product_id=product_id)
+        for order in created
+        for product_id in rng.sample(product_ids, rng.randint(1, 4))
+    )
+    rebuild_daily_sales()
+    return product_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--products", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+    import django
+
+    django.setup()
+    from django.db import connection
+    from django.utils import timezone
+
+    from crm.sales import raw_daily_sales, sales_by_day, top_products, top_products_raw
+
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        product_ids = seed(args.orders, args.products)
+        end = timezone.localdate()
+        start = end - timedelta(days=29)
+        product_id = product_ids[0]
+
+        rollup = top_products(start, end)
+        raw = top_products_raw(start, end)
+        assert [r["product_id"] for r in rollup] == [r["product_id"] for r in raw]
+
+        year_ago = end - timedelta(days=365)
+        results = [
+            ("topProducts (rollup)", best_of(lambda: top_products(start, end))),
+            ("topProducts (raw join)", best_of(lambda: top_products_raw(start, end))),
+            (
+                "salesByDay (rollup)",
+                best_of(lambda: sales_by_day(product_id, year_ago, end)),
+            ),
+            (
+                "salesByDay (raw join)",
+                best_of(
+                    lambda: list(
+                        raw_daily_sales(year_ago, end).filter(product_id=product_id)
+                    )
+                ),
+            ),
+        ]
+        print(f"{args.orders} orders, {args.products} products")
+        for label, ms in results:
+            print(f"  {label:24} {ms:8.2f} ms")
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Benchmark of SQLite under concurrent processes: default vs. production profile.
+
+    python -m crm.benchmarks.sqlite_concurrency [--processes 1,2,4,8]
+        [--duration 5] [--write-ratio 0.2] [--products 500]
+
+For each profile in ``SQLITE_PROFILES`` and each process count, a fresh
+database file is migrated and seeded, then every process runs a loop of
+requests for ``--duration`` seconds: reads list a page of filtered products,
+writes place an order (stock decrement, order, links) in one transaction.
+Each request ends like a web request does, with ``close_old_connections``,
+so the profile's persistent connections are reused and the default profile
+reconnects. Reports reads/s, writes/s and failed requests ("database is
+locked") per configuration.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+
+def _setup(profile, path):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+    import django
+
+    django.setup()
+    from django.conf import settings
+    from django.db import connections
+
+    settings_dict = connections["default"].settings_dict
+    settings_dict.update(
+        {
+            "NAME": path,
+            "CONN_MAX_AGE": 0,
+            "CONN_HEALTH_CHECKS": False,
+            "OPTIONS": {},
+        }
+    )
+    settings_dict.update(settings.SQLITE_PROFILES[profile])
+
+
+def seed(products, customers=100):
+    from django.core.management import call_command
+
+    from crm.models import Customer, Product
+
+    call_command("migrate", verbosity=0)
+    rng = random.Random(42)
+    Customer.objects.bulk_create(
+        Customer(name=f"Customer {i}", email=f"customer{i}@example.com")
+        for i in range(customers)
+    )
+    Product.objects.bulk_create(
+        Product(
+            name=f"Product {i}",
+            price=Decimal(rng.randint(100, 50000)) / 100,
+            stock=1_000_000,
+        )
+        for i in range(products)
+    )
+
+
+def _read(rng):
+    from crm.models import Product
+
+    low = rng.randint(1, 400)
+    return list(
+        Product.objects.filter(price__gte=low, stock__gte=1).order_by("price")[:20]
+    )
+
+
+def _write(rng, customer_ids, product_ids):
+    from crm.models import Order, Product
+    from crm.sqlite import write_transaction
+    from crm.stock import decrement_stock
+
+    chosen = rng.sample(product_ids, 3)
+    with write_transaction():
+        decrement_stock(chosen)
+        prices = Product.objects.filter(pk__in=chosen).values_list("price", flat=True)
+        order = Order.objects.create(
+            customer_id=rng.choice(customer_ids), total_amount=sum(prices)
+        )
+        order.products.set(chosen)
+
+
+def _worker(profile, path, duration, write_ratio, seed_, barrier, results):
+    _setup(profile, path)
+    from django.db import close_old_connections
+
+    from crm.models import Customer, Product
+
+    customer_ids = list(Customer.objects.values_list("pk", flat=True))
+    product_ids = list(Product.objects.values_list("pk", flat=True))
+    close_old_connections()
+    rng = random.Random(seed_)
+    counts = {"reads": 0, "writes": 0, "errors": 0, "read_s": 0.0, "write_s": 0.0}
+
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        write = rng.random() < write_ratio
+        started = time.perf_counter()
+        try:
+            if write:
+                _write(rng, customer_ids, product_ids)
+            else:
+                _read(rng)
+        except Exception:
+            counts["errors"] += 1
+        else:
+            kind = "write" if write else "read"
+            counts[f"{kind}s"] += 1
+            counts[f"{kind}_s"] += time.perf_counter() - started
+        finally:
+            close_old_connections()  # the end of a request
+    results.put(counts)
+
+
+def run(profile, processes, duration, write_ratio, products):
+    """Totals of one profile at one process count."""
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench.sqlite3")
+    try:
+        # Seed in a child as well, so this process never opens the database.
+        context = multiprocessing.get_context("spawn")
+        seeder = context.Process(target=_seed_worker, args=(profile, path, products))
+        seeder.start()
+        seeder.join()
+        if seeder.exitcode:
+            raise RuntimeError("Seeding the benchmark database failed")
+
+        barrier = context.Barrier(processes)
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=_worker,
+                args=(profile, path, duration, write_ratio, n, barrier, results),
+            )
+            for n in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        counts = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    total = {key: sum(c[key] for c in counts) for key in counts[0]}
+    return {
+        "reads_per_s": total["reads"] / duration,
+        "writes_per_s": total["writes"] / duration,
+        "errors": total["errors"],
+        "read_ms": 1000 * total["read_s"] / total["reads"] if total["reads"] else None,
+        "write_ms": (
+            1000 * total["write_s"] / total["writes"] if total["writes"] else None
+        ),
+    }
+
+
+def _seed_worker(profile, path, products):
+    _setup(profile, path)
+    seed(products)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--processes",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=[1, 2, 4, 8],
+    )
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument(
+        "--profiles", default="default,production", help="Profiles to compare."
+    )
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'profile':12}{'procs':>6}{'reads/s':>10}{'writes/s':>10}"
+        f"{'read ms':>9}{'write ms':>9}{'errors':>8}"
+    )
+    for profile in args.profiles.split(","):
+        for processes in args.processes:
+            result = run(
+                profile, processes, args.duration, args.write_ratio, args.products
+            )
+            read_ms, write_ms = result["read_ms"], result["write_ms"]
+            print(
+                f"{profile:12}{processes:6d}{result['reads_per_s']:10.0f}"
+                f"{result['writes_per_s']:10.0f}"
+                f"{read_ms if read_ms is not None else float('nan'):9.2f}"
+                f"{write_ms if write_ms is not None else float('nan'):9.2f}"
+                f"{result['errors']:8d}",
+                flush=True,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
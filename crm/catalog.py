@@ -0,0 +1,141 @@
+"""
+Process-local product catalog.
+
+Every worker process keeps the catalog as a compact ``{id: (price, stock,
+name)}`` map, loaded once and then kept current through the product data
+version (``crm.versions``). The database triggers that bump it also log each
+written product id under the version it made (``ProductChange``), so a
+process that falls behind reloads only those rows. When the log has a gap
+(pruned entries, a reset counter, a bulk load), the whole catalog is reloaded.
+The triggers fire once per written row; ``prune_product_changes`` trims the
+log from a scheduled job rather than on every write.
+
+Readers check the version first (one primary key lookup), so the catalog is
+never older than the last committed product write, whichever process or
+program made it. The stock it holds is for display and pricing only:
+``decrement_stock`` still takes stock in the database.
+
+The catalog answers lookups by id (order pricing, the products of a sales
+report). Filtered and paginated ``allProducts`` queries go to the database,
+which slices the page before building any instance.
+"""
+
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Product, ProductChange
+from .routers import PRIMARY_DB
+from .versions import get_data_version
+
+FIELDS = ("price", "stock", "name")
+
+CatalogEntry = namedtuple("CatalogEntry", FIELDS)
+
+
+def catalog_enabled():
+    return getattr(settings, "CRM_CATALOG_CACHE", True)
+
+
+def prune_product_changes(keep=None):
+    """
+    Drop all but the last ``keep`` (CRM_CATALOG_CHANGE_LOG_SIZE) entries of
+    the product change log; returns how many were deleted.
+    """
+    if keep is None:
+        keep = getattr(settings, "CRM_CATALOG_CHANGE_LOG_SIZE", 10000)
+    changes = ProductChange.objects.using(PRIMARY_DB)
+    last = changes.aggregate(last=Max("id"))["last"]
+    if last is None:
+        return 0
+    deleted, _ = changes.filter(id__lte=last - keep).delete()
+    return deleted
+
+
+def catalog_version():
+    return get_data_version(Product, using=PRIMARY_DB)
+
+
+class ProductCatalog:
+    def __init__(self):
+        self.version = None
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def _load(self, product_ids=None):
+        rows = Product.objects.using(PRIMARY_DB).values_list("pk", *FIELDS)
+        if product_ids is not None:
+            rows = rows.filter(pk__in=product_ids)
+        return {pk: CatalogEntry(*values) for pk, *values in rows}
+
+    def _changes_since(self, version, current):
+        """Ids written between two versions, or None when a full reload is due."""
+        max_writes = getattr(settings, "CRM_CATALOG_MAX_INCREMENTAL", 1000)
+        if not version:
+            return None
+        changes = list(
+            ProductChange.objects.using(PRIMARY_DB)
+            .filter(version__gte=version, version__lte=current)
+            .order_by("version")
+            .values_list("version", "product_id")[: max_writes + 2]
+        )
+        # The log starts at the write the catalog was loaded at, unless that
+        # write was pruned since (or rolled back): then it may have gaps.
+        if not changes or changes[0][0] != version or len(changes) > max_writes + 1:
+            return None
+        return {product_id for _, product_id in changes[1:]}
+
+    def refresh(self):
+        """Bring the catalog up to the product data version; returns the entries."""
+        current = catalog_version()
+        if current == self.version:
+            return self.entries
+        with self._lock:
+            if current == self.version:
+                return self.entries
+            # Rows are read after the version, so a write in between only
+            # makes the next refresh reload them again.
+            changed = self._changes_since(self.version, current)
+            if changed is None:
+                entries = self._load()
+            else:
+                entries = dict(self.entries)
+                for pk in changed:
+                    entries.pop(pk, None)
+                entries.update(self._load(changed))
+            self.entries, self.version = entries, current
+            return entries
+
+    def get_many(self, product_ids):
+        """{id: CatalogEntry} for the ids that exist, in the order given."""
+        if not catalog_enabled():
+            return self._load(product_ids)
+        entries = self.refresh()
+        return {pk: entries[pk] for pk in product_ids if pk in entries}
+
+    def products(self, product_ids=None):
+        """``Product`` instances built from the catalog, without a query."""
+        if product_ids is None:
+            entries = self.refresh() if catalog_enabled() else self._load()
+        else:
+            entries = self.get_many(product_ids)
+        return [_as_product(pk, entry) for pk, entry in entries.items()]
+
+    def clear(self):
+        with self._lock:
+            self.version = None
+            self.entries = {}
+
+
+def _as_product(pk, entry):
+    return Product.from_db(
+        PRIMARY_DB,
+        ["id", "name", "price", "stock"],
+        [pk, entry.name, entry.price, entry.stock],
+    )
+
+
+catalog = ProductCatalog()
+
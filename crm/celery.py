@@ -1,6 +1,6 @@
 import os
 from celery import Celery
-from django.conf import settings
+from celery.schedules import crontab
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
@@ -10,6 +10,24 @@ app = Celery("crm")
 # Load configuration from Django settings, all celery configuration should have a `CELERY_` prefix.
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
+
+def beat_schedule():
+    """A beat entry per job in CRM_JOBS, each sent to crm.tasks.run_scheduled_job."""
+    from crm.scheduling import get_jobs, parse_schedule, time_limits
+
+    return {
+        name.replace("_", "-"): {
+            "task": "crm.tasks.run_scheduled_job",
+            "schedule": crontab(**parse_schedule(job["SCHEDULE"])),
+            "args": (name,),
+            "options": time_limits(job),
+        }
+        for name, job in get_jobs().items()
+    }
+
+
+app.conf.beat_schedule = beat_schedule()
+
 # Auto-discover tasks from all registered Django app configs.
 app.autodiscover_tasks()
 
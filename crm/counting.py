@@ -0,0 +1,139 @@
+"""
+Row counts for the GraphQL connections.
+
+``count_queryset`` returns ``(count, is_estimate)`` for a filtered queryset
+using one of three modes:
+
+- exact: a plain ``COUNT(*)``
+- cached: the exact count, cached under the query's SQL and the data versions
+  of the CRM models, so any write invalidates it
+- estimated: the table's row estimate from the database statistics (or a
+  cheap ``MAX(pk)`` fallback), scaled by the match rate in a sample of rows
+  spread evenly over the primary key range
+
+A UNION ALL (live and archived orders) is counted one side at a time, since a
+union can be neither filtered nor estimated from one table.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Max, Min, QuerySet
+
+from .models import ArchivedOrder, Customer, Order, Product
+from .versions import get_data_versions
+
+COUNT_EXACT = "exact"
+COUNT_CACHED = "cached"
+COUNT_ESTIMATED = "estimated"
+
+COUNTED_MODELS = (Customer, Product, Order, ArchivedOrder)
+
+
+def exact_count(queryset):
+    return queryset.count(), False
+
+
+def cached_count(queryset):
+    sql, params = queryset.query.sql_with_params()
+    versions = get_data_versions(COUNTED_MODELS, using=queryset.db)
+    digest = hashlib.sha1(
+        repr((queryset.db, sql, params, sorted(versions.items()))).encode()
+    ).hexdigest()
+    key = f"crm:count:{queryset.model._meta.label_lower}:{digest}"
+
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(settings, "CRM_COUNT_CACHE_SECONDS", 300))
+    return count, False
+
+
+def table_row_estimate(model, using):
+    """
+    Estimate the number of rows in the model's table without scanning it.
+    """
+    table = model._meta.db_table
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table]
+            )
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+        elif connection.vendor == "sqlite":
+            # sqlite_stat1 only exists once ANALYZE has been run.
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            )
+            if cursor.fetchone():
+                cursor.execute(
+                    "SELECT stat FROM sqlite_stat1 WHERE tbl = %s AND idx IS NULL",
+                    [table],
+                )
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+    # Primary keys are auto-incrementing, so the highest one bounds the rows.
+    return model._default_manager.using(using).aggregate(top=Max("pk"))["top"] or 0
+
+
+def estimated_count(queryset):
+    sample_size = getattr(settings, "CRM_COUNT_SAMPLE_SIZE", 1000)
+    model = queryset.model
+    rows = table_row_estimate(model, queryset.db)
+    if rows <= sample_size:
+        return exact_count(queryset)
+
+    if not queryset.query.where:
+        return rows, True
+
+    # One primary key from the middle of each of sample_size equal strides,
+    # so old and new rows are sampled alike (a filter on dates is not skewed
+    # by where the sample falls). Each is a lookup on the primary key index.
+    table = model._default_manager.using(queryset.db)
+    bounds = table.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is None:
+        return exact_count(queryset)  # stale statistics of an emptied table
+    stride = (bounds["high"] - bounds["low"] + 1) / sample_size
+    sample = sorted(
+        {bounds["low"] + int(stride * (i + 0.5)) for i in range(sample_size)}
+    )
+    sampled = table.filter(pk__in=sample).count()
+    if not sampled:
+        return exact_count(queryset)
+    matched = queryset.filter(pk__in=sample).count()
+    return round(rows * matched / sampled), True
+
+
+COUNTERS = {
+    COUNT_EXACT: exact_count,
+    COUNT_CACHED: cached_count,
+    COUNT_ESTIMATED: estimated_count,
+}
+
+
+def union_parts(queryset):
+    """The querysets combined by a UNION ALL, or None for any other queryset."""
+    query = queryset.query
+    if query.combinator != "union" or not query.combinator_all:
+        return None
+    return [
+        QuerySet(model=part.model, query=part.clone(), using=queryset.db)
+        for part in query.combined_queries
+    ]
+
+
+def count_queryset(queryset, mode=None):
+    if not isinstance(queryset, QuerySet):
+        return len(queryset), False  # already in memory (e.g. from the catalog)
+    mode = mode or getattr(settings, "CRM_COUNT_MODE", COUNT_EXACT)
+    parts = union_parts(queryset)
+    if parts is None:
+        return COUNTERS[mode](queryset)
+    counts = [COUNTERS[mode](part) for part in parts]
+    return sum(count for count, _ in counts), any(estimate for _, estimate in counts)
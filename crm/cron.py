@@ -1,5 +1,8 @@
 """
 Cron jobs for the CRM application.
+
+They are scheduled by Celery beat through CRM_JOBS (see crm.scheduling), and
+can be run by hand with ``python -m crm.jobs crm.cron.<job>``.
 """
 
 from datetime import datetime
@@ -8,45 +11,50 @@ from datetime import datetime
 def log_crm_heartbeat():
     """
     Log a heartbeat message to confirm the CRM application is alive.
-    This function is called every 5 minutes by django-crontab.
+    This function is called every 5 minutes by Celery beat.
+
+    Probes the /readyz endpoint and records its response time together with
+    the server's own p50/p99 request latency.
     """
     timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-    message = f"{timestamp} CRM is alive\n"
-
     log_file = "/tmp/crm_heartbeat_log.txt"
 
     try:
-        with open(log_file, "a") as f:
-            f.write(message)
-
-        # Optionally query the GraphQL endpoint to verify it's responsive
-        try:
-            from gql import gql, Client
-            from gql.transport.requests import RequestsHTTPTransport
-
-            query_string = """
-                query {
-                    __schema {
-                        queryType {
-                            name
-                        }
-                    }
-                }
-            """
-
-            transport = RequestsHTTPTransport(url="http://localhost:8000/graphql")
-            client = Client(transport=transport, fetch_schema_from_transport=False)
-            query = gql(query_string)
-            result = client.execute(query)
-
-            if result:
-                print(
-                    f"[{timestamp}] Heartbeat logged - GraphQL endpoint is responsive"
+        import json
+        import time
+        from urllib.error import HTTPError
+        from urllib.request import urlopen
+
+        from django.conf import settings
+
+        from crm.joblog import record_job
+
+        url = getattr(settings, "CRM_HEALTH_URL", "http://localhost:8000/readyz")
+        with record_job("log_crm_heartbeat", log_file) as job:
+            started = time.perf_counter()
+            try:
+                try:
+                    with urlopen(url, timeout=5) as response:
+                        status_code, body = response.status, response.read()
+                except HTTPError as e:
+                    # A 503 from /readyz still carries the JSON report.
+                    status_code, body = e.code, e.read()
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                report = json.loads(body)
+                latency = report.get("latency_ms", {})
+                status = "alive" if status_code == 200 else "not ready"
+                if report.get("status") == "degraded":
+                    status = "degraded"
+                message = (
+                    f"{timestamp} CRM is {status} - readyz {status_code} "
+                    f"in {elapsed_ms:.1f}ms (p50 {latency.get('p50')}ms, "
+                    f"p99 {latency.get('p99')}ms)"
                 )
-        except Exception as e:
-            print(
-                f"[{timestamp}] Heartbeat logged - GraphQL endpoint check failed: {str(e)}"
-            )
+            except Exception as e:
+                message = f"{timestamp} CRM is unreachable - {str(e)}"
+                job.fail(str(e))
+            job.log(message)
+        print(f"[{timestamp}] Heartbeat logged - {message}")
 
     except Exception as e:
         print(f"Error logging heartbeat: {str(e)}")
@@ -54,60 +62,101 @@ def log_crm_heartbeat():
 
 def update_low_stock():
     """
-    Execute the UpdateLowStockProducts GraphQL mutation to restock low-stock products.
-    This function is called every 12 hours by django-crontab.
+    Reconciliation sweep for low-stock products.
+    This function is called every 12 hours by Celery beat.
+
+    Stock drops below the threshold are queued as they happen; this sweep
+    re-queues anything the event path missed (through the partial index on
+    low stock) and drains the queue.
     """
     timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
     log_file = "/tmp/low_stock_updates_log.txt"
 
+    from crm.joblog import get_sink, record_job
+
     try:
-        from gql import gql, Client
-        from gql.transport.requests import RequestsHTTPTransport
-
-        # GraphQL mutation to update low-stock products
-        mutation_string = """
-            mutation {
-                updateLowStockProducts {
-                    updatedProducts {
-                        id
-                        name
-                        stock
-                    }
-                    message
-                    errors
-                }
-            }
-        """
-
-        # Execute the mutation
-        transport = RequestsHTTPTransport(url="http://localhost:8000/graphql")
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        mutation = gql(mutation_string)
-        result = client.execute(mutation)
-
-        # Log the results
-        with open(log_file, "a") as f:
-            f.write(f"[{timestamp}] Low Stock Update Started\n")
-
-            update_result = result.get("updateLowStockProducts", {})
-            updated_products = update_result.get("updatedProducts", [])
-            message = update_result.get("message", "")
-            errors = update_result.get("errors", [])
-
-            if errors:
-                f.write(f"[{timestamp}] Errors: {', '.join(errors)}\n")
-            else:
-                f.write(f"[{timestamp}] {message}\n")
-                for product in updated_products:
-                    product_name = product.get("name", "N/A")
-                    new_stock = product.get("stock", "N/A")
-                    f.write(
-                        f"[{timestamp}] Updated: {product_name} - New Stock: {new_stock}\n"
-                    )
+        from crm.stock import drain_low_stock_queue, reconcile_low_stock
+
+        with record_job("update_low_stock", log_file) as job:
+            queued = reconcile_low_stock()
+            updated_products = []
+            while True:
+                batch = drain_low_stock_queue()
+                if not batch:
+                    break
+                updated_products.extend(batch)
+            job.add_rows(len(updated_products))
+
+            # Log the results
+            job.log(f"[{timestamp}] Low Stock Reconciliation Started")
+            job.log(
+                f"[{timestamp}] Queued {queued} missed product(s), "
+                f"restocked {len(updated_products)} product(s)"
+            )
+            for _, product_name, new_stock in updated_products:
+                job.log(
+                    f"[{timestamp}] Updated: {product_name} - New Stock: {new_stock}"
+                )
 
         print(f"[{timestamp}] Low stock products updated successfully")
 
     except Exception as e:
-        with open(log_file, "a") as f:
-            f.write(f"[{timestamp}] Error: {str(e)}\n")
+        sink = get_sink(log_file)
+        sink.write(f"[{timestamp}] Error: {str(e)}")
+        sink.flush()
         print(f"Error updating low stock products: {str(e)}")
+
+
+def clean_inactive_customers(days=365):
+    """
+    Delete customers created more than ``days`` ago who never placed an
+    order (live or archived). Runs every Sunday at 2:00.
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    log_file = "/tmp/customer_cleanup_log.txt"
+
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from crm.joblog import record_job
+    from crm.models import Customer
+
+    with record_job("clean_inactive_customers", log_file) as job:
+        inactive = Customer.objects.filter(
+            created_at__lt=timezone.now() - timedelta(days=days),
+            orders__isnull=True,
+            archived_orders__isnull=True,
+        )
+        deleted = inactive.delete()[1].get(Customer._meta.label, 0)
+        job.add_rows(deleted)
+        job.log(f"[{timestamp}] Deleted {deleted} inactive customers")
+    return deleted
+
+
+def send_order_reminders(days=7):
+    """
+    Log a reminder for every order placed in the last ``days`` days.
+    Runs every day at 8:00.
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    log_file = "/tmp/order_reminders_log.txt"
+
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from crm.joblog import record_job
+    from crm.models import Order
+
+    with record_job("send_order_reminders", log_file) as job:
+        orders = (
+            Order.objects.filter(order_date__gte=timezone.now() - timedelta(days=days))
+            .values_list("pk", "customer__name", "customer__email")
+            .order_by("pk")
+        )
+        for order_id, name, email in orders.iterator():
+            job.log(f"[{timestamp}] Order ID: {order_id}, Customer: {name} ({email})")
+            job.add_rows()
+    print("Order reminders processed!")
+    return job.rows
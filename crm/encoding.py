@@ -0,0 +1,184 @@
+"""
+Encoding of GraphQL responses.
+
+``CRMGraphQLView`` encodes results with the encoder named by
+``CRM_GRAPHQL_ENCODER["BACKEND"]``: "orjson", "json" (the standard library,
+byte for byte what graphene's view writes), "auto" (orjson when installed,
+otherwise json) or the dotted path of an encoder class.
+
+A result holding a list of at least ``STREAM_MIN_ITEMS`` items (a page of
+connection edges) is streamed: the list is encoded ``STREAM_CHUNK_ITEMS``
+items at a time and the pieces are written out in ~64 KB chunks, so the
+response is never built as one string.
+
+``install_fast_paths`` speeds up the leaves of large pages: Decimal and
+DateTime values are serialized by functions with their types bound as
+defaults (an exact type check, then ``str``/``isoformat``), and the Decimal
+and DateTime model fields of the given object types resolve with a pre-bound
+``attrgetter`` instead of graphene's generic attribute-or-key resolver.
+"""
+
+import json
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache, partial
+from operator import attrgetter
+
+import graphene
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from graphene.types.resolver import dict_or_attr_resolver
+from graphql import get_nullable_type
+
+try:
+    import orjson
+except ImportError:  # optional: the json module
+    orjson = None
+
+DEFAULTS = {
+    "BACKEND": "auto",
+    "STREAM_MIN_ITEMS": 0,
+    "STREAM_CHUNK_ITEMS": 500,
+}
+
+STREAM_BUFFER_BYTES = 64 * 1024
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "CRM_GRAPHQL_ENCODER", {})}
+
+
+class JSONEncoder:
+    """The standard library's json module, in graphene's compact format."""
+
+    name = "json"
+
+    def dumps(self, value):
+        return json.dumps(value, separators=(",", ":")).encode()
+
+
+class OrjsonEncoder(JSONEncoder):
+    """orjson: UTF-8 output, several times faster than the json module."""
+
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImproperlyConfigured("The orjson encoder needs orjson installed")
+
+    def dumps(self, value):
+        return orjson.dumps(value)
+
+
+BACKENDS = {"json": JSONEncoder, "orjson": OrjsonEncoder}
+
+
+@lru_cache(maxsize=1)
+def get_encoder():
+    backend = get_config()["BACKEND"]
+    if backend == "auto":
+        backend = "json" if orjson is None else "orjson"
+    encoder_class = BACKENDS.get(backend) or import_string(backend)
+    return encoder_class()
+
+
+def longest_list(value):
+    """Length of the longest list reachable from ``value`` through objects only."""
+    if isinstance(value, list):
+        return len(value)
+    if isinstance(value, dict):
+        return max(map(longest_list, value.values()), default=0)
+    return 0
+
+
+def should_stream(value, config=None):
+    min_items = (config or get_config())["STREAM_MIN_ITEMS"]
+    return bool(min_items) and longest_list(value) >= min_items
+
+
+def _pieces(value, dumps, min_items, chunk_items):
+    if isinstance(value, dict):
+        yield b"{"
+        for n, (key, item) in enumerate(value.items()):
+            yield (b"," if n else b"") + dumps(key) + b":"
+            yield from _pieces(item, dumps, min_items, chunk_items)
+        yield b"}"
+    elif isinstance(value, list) and len(value) >= min_items:
+        yield b"["
+        for start in range(0, len(value), chunk_items):
+            chunk = dumps(value[start : start + chunk_items])
+            yield (b"," if start else b"") + chunk[1:-1]
+        yield b"]"
+    else:
+        yield dumps(value)
+
+
+def iter_encode(value, encoder=None, config=None):
+    """
+    Encode ``value`` as a sequence of byte strings of about
+    ``STREAM_BUFFER_BYTES`` each; joined, they equal ``encoder.dumps(value)``.
+    """
+    encoder = encoder or get_encoder()
+    config = config or get_config()
+    buffer, size = [], 0
+    for piece in _pieces(
+        value,
+        encoder.dumps,
+        config["STREAM_MIN_ITEMS"] or 1,
+        config["STREAM_CHUNK_ITEMS"],
+    ):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_BUFFER_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def serialize_decimal(
+    value, _decimal=Decimal, _str=str, _slow=graphene.Decimal.serialize
+):
+    return _str(value) if value.__class__ is _decimal else _slow(value)
+
+
+def serialize_datetime(
+    value,
+    _datetime=datetime,
+    _isoformat=datetime.isoformat,
+    _slow=graphene.DateTime.serialize,
+):
+    return _isoformat(value) if value.__class__ is _datetime else _slow(value)
+
+
+FAST_SERIALIZERS = {"Decimal": serialize_decimal, "DateTime": serialize_datetime}
+
+
+def _attribute_resolver(name):
+    get = attrgetter(name)
+
+    def resolve(root, info):
+        return get(root)
+
+    return resolve
+
+
+def install_fast_paths(schema, type_names):
+    """
+    Bind the Decimal and DateTime fast paths into ``schema`` (a graphene
+    Schema) for the object types named in ``type_names``.
+    """
+    type_map = schema.graphql_schema.type_map
+    for scalar, serialize in FAST_SERIALIZERS.items():
+        if scalar in type_map:
+            type_map[scalar].serialize = serialize
+    for type_name in type_names:
+        for field in type_map[type_name].fields.values():
+            resolve = field.resolve
+            if (
+                getattr(get_nullable_type(field.type), "name", None) in FAST_SERIALIZERS
+                and isinstance(resolve, partial)
+                and resolve.func is dict_or_attr_resolver
+            ):
+                field.resolve = _attribute_resolver(resolve.args[0])
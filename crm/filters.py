@@ -1,5 +1,9 @@
 import django_filters
-from .models import Customer, Product, Order
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.constants import LOOKUP_SEP
+from django_filters.constants import EMPTY_VALUES
+from .models import ArchivedOrder, Customer, Product, Order
 
 
 class CustomerFilter(django_filters.FilterSet):
@@ -15,16 +19,15 @@ class CustomerFilter(django_filters.FilterSet):
     createdAtGte = django_filters.DateTimeFilter(field_name="created_at", lookup_expr="gte")
     createdAtLte = django_filters.DateTimeFilter(field_name="created_at", lookup_expr="lte")
 
-    # Custom phone pattern filter
-    phonePattern = django_filters.CharFilter(method="filter_phone_pattern")
+    # Phone prefix filter
+    phonePattern = django_filters.CharFilter(
+        field_name="phone", lookup_expr="startswith"
+    )
 
     class Meta:
         model = Customer
         fields = ["name", "email", "created_at", "phone"]
 
-    def filter_phone_pattern(self, queryset, name, value):
-        return queryset.filter(phone__startswith=value)
-
 
 class ProductFilter(django_filters.FilterSet):
     # Case-insensitive partial match
@@ -81,3 +84,99 @@ class OrderFilter(django_filters.FilterSet):
     class Meta:
         model = Order
         fields = ["total_amount", "order_date", "customer", "products"]
+
+
+class ArchivedOrderFilter(OrderFilter):
+    """The order filters, applied to the order archive."""
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ["total_amount", "order_date", "customer", "products"]
+
+
+class CompiledFilter:
+    """
+    Translate a GraphQL filter input straight into a ``Q`` object.
+
+    The declared filters of a FilterSet are compiled once: each input name is
+    bound to its lookup and to the form field that parses its value, so a
+    request no longer builds a form or clones the queryset per filter.
+    Lookups across a many-valued relation become an EXISTS semi-join, which
+    keeps matching rows unique without a DISTINCT.
+    """
+
+    def __init__(self, filterset_class):
+        self.model = filterset_class._meta.model
+        self.filters = {}
+        for name, declared in filterset_class.declared_filters.items():
+            if isinstance(declared, django_filters.OrderingFilter):
+                continue
+            if declared.method:
+                raise ValueError(f"{filterset_class.__name__}.{name} uses a method")
+            lookup = LOOKUP_SEP.join([declared.field_name, declared.lookup_expr])
+            self.filters[name] = (
+                declared.field,
+                self._compile_lookup(lookup),
+                declared.exclude,
+            )
+
+    def _compile_lookup(self, lookup):
+        relation, _, rest = lookup.partition(LOOKUP_SEP)
+        try:
+            field = self.model._meta.get_field(relation)
+        except FieldDoesNotExist:
+            field = None
+
+        if field is not None and field.many_to_many and not field.auto_created:
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = LOOKUP_SEP.join([field.m2m_reverse_field_name(), rest])
+            return lambda value: Exists(
+                through.objects.filter(**{source: OuterRef("pk"), target: value})
+            )
+        if field is not None and (field.one_to_many or field.many_to_many):
+            related = field.related_model
+            source = field.remote_field.name
+            return lambda value: Exists(
+                related.objects.filter(**{source: OuterRef("pk"), rest: value})
+            )
+        return lambda value: Q(**{lookup: value})
+
+    def cleaned_value(self, data, name):
+        """The parsed value of one filter input, or None if it is absent or invalid."""
+        value = (data or {}).get(name)
+        if value in EMPTY_VALUES:
+            return None
+        try:
+            value = self.filters[name][0].clean(value)
+        except ValidationError:
+            return None
+        return None if value in EMPTY_VALUES else value
+
+    def to_q(self, data):
+        q = Q()
+        for name, value in (data or {}).items():
+            compiled = self.filters.get(name)
+            if compiled is None:
+                continue
+            form_field, build, exclude = compiled
+            try:
+                value = form_field.clean(value)
+            except ValidationError:
+                # An invalid value is dropped, as the FilterSet form would.
+                continue
+            if value in EMPTY_VALUES:
+                continue
+            condition = build(value)
+            q &= ~condition if exclude else condition
+        return q
+
+    def filter(self, queryset, data):
+        q = self.to_q(data)
+        return queryset.filter(q) if q else queryset
+
+
+compiled_customer_filter = CompiledFilter(CustomerFilter)
+compiled_product_filter = CompiledFilter(ProductFilter)
+compiled_order_filter = CompiledFilter(OrderFilter)
+compiled_archived_order_filter = CompiledFilter(ArchivedOrderFilter)
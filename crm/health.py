@@ -0,0 +1,128 @@
+"""
+Liveness and readiness probes for the CRM application.
+
+Dependency checks are time-bounded and their results cached for a couple of
+seconds, so a burst of probes costs at most one ``SELECT 1`` per interval.
+Request latency comes from an in-process ring buffer fed by
+``crm.middleware.RequestLatencyMiddleware``.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.db import connections
+
+
+class LatencyRecorder:
+    """Fixed-size ring buffer of recent request durations, in milliseconds."""
+
+    def __init__(self, size=1024):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, duration_ms):
+        with self._lock:
+            self._samples.append(duration_ms)
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0, "p50": None, "p99": None}
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 2)
+
+        return {"count": len(samples), "p50": percentile(0.50), "p99": percentile(0.99)}
+
+
+request_latency = LatencyRecorder()
+
+# One long-lived thread runs the checks so a hung dependency cannot hold a
+# request thread past the timeout.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="crm-health")
+_results = {}
+_results_lock = threading.Lock()
+
+
+def _check_database():
+    connection = connections["default"]
+    connection.close_if_unusable_or_obsolete()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+    except Exception:
+        # Reconnect on the next probe rather than reusing a broken connection.
+        connection.close()
+        raise
+
+
+def _check_broker():
+    from kombu import Connection
+
+    timeout = getattr(settings, "CRM_HEALTH_CHECK_TIMEOUT", 1.0)
+    with Connection(settings.CELERY_BROKER_URL, connect_timeout=timeout) as conn:
+        conn.ensure_connection(max_retries=1)
+
+
+CHECKS = {
+    "database": _check_database,
+    "broker": _check_broker,
+}
+
+# Checks that gate readiness. The others are only reported: without the
+# broker, requests are still served and just the background jobs wait.
+REQUIRED_CHECKS = ("database",)
+
+
+def run_check(name):
+    """
+    Run a dependency check, or reuse its result from the last few seconds.
+
+    Returns {"ok": bool, "duration_ms": float, "error": str (on failure)}.
+    """
+    ttl = getattr(settings, "CRM_HEALTH_CACHE_SECONDS", 2.0)
+    now = time.monotonic()
+    with _results_lock:
+        cached = _results.get(name)
+        if cached and now - cached[0] < ttl:
+            return cached[1]
+
+    timeout = getattr(settings, "CRM_HEALTH_CHECK_TIMEOUT", 1.0)
+    started = time.perf_counter()
+    result = {"ok": True}
+    try:
+        _executor.submit(CHECKS[name]).result(timeout=timeout)
+    except TimeoutError:
+        result = {"ok": False, "error": f"timed out after {timeout}s"}
+    except Exception as e:
+        result = {"ok": False, "error": str(e)}
+    result["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    with _results_lock:
+        _results[name] = (time.monotonic(), result)
+    return result
+
+
+def readiness():
+    """
+    Return ``(status, checks)``: "ok", "unavailable" when a check in
+    REQUIRED_CHECKS failed, or "degraded" when only another one did.
+    """
+    checks = {"database": run_check("database")}
+    if getattr(settings, "CELERY_BROKER_URL", None):
+        checks["broker"] = run_check("broker")
+    if not all(checks[name]["ok"] for name in REQUIRED_CHECKS):
+        return "unavailable", checks
+    if not all(check["ok"] for check in checks.values()):
+        return "degraded", checks
+    return "ok", checks
+
+
+def reset_checks():
+    with _results_lock:
+        _results.clear()
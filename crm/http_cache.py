@@ -0,0 +1,144 @@
+"""
+HTTP caching for read-only GraphQL operations sent with GET.
+
+The ETag of a query is derived from the operation itself (document,
+variables, operation name) and the data versions (``crm.versions``) of the
+models its selection can reach. Those are found statically, by walking the
+document against the schema, so a matching ``If-None-Match`` is answered with
+a 304 before any resolver runs.
+
+Response bodies above ``CRM_GRAPHQL_COMPRESS_MIN_BYTES`` are compressed with
+brotli when the ``brotli`` package is installed and the client accepts it,
+otherwise with gzip. Streamed responses are gzipped as they are written.
+"""
+
+import hashlib
+import json
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+from graphql import (
+    GraphQLError,
+    TypeInfo,
+    TypeInfoVisitor,
+    Visitor,
+    get_named_type,
+    get_operation_ast,
+    parse,
+    visit,
+)
+
+from .versions import get_data_versions
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+_accepts_gzip = re.compile(r"\bgzip\b")
+_accepts_brotli = re.compile(r"\bbr\b")
+
+
+def graphene_models(graphene_type):
+    """Models behind a graphene type: its Django model, or its ``data_models``."""
+    model = getattr(getattr(graphene_type, "_meta", None), "model", None)
+    if model is not None:
+        return (model,)
+    return tuple(getattr(graphene_type, "data_models", ()))
+
+
+class _ModelCollector(Visitor):
+    def __init__(self, type_info):
+        super().__init__()
+        self.type_info = type_info
+        self.models = set()
+
+    def enter_field(self, node, *args):
+        field_type = self.type_info.get_type()
+        if field_type is None:
+            return
+        graphene_type = getattr(get_named_type(field_type), "graphene_type", None)
+        self.models.update(graphene_models(graphene_type))
+
+
+@lru_cache(maxsize=256)
+def analyze_operation(schema, query, operation_name=None):
+    """
+    Return the models a read-only operation can touch, sorted by label, or
+    None when the request is not a cacheable query.
+    """
+    try:
+        document = parse(query)
+    except GraphQLError:
+        return None
+    operation = get_operation_ast(document, operation_name)
+    if operation is None or operation.operation.value != "query":
+        return None
+
+    graphql_schema = getattr(schema, "graphql_schema", schema)
+    type_info = TypeInfo(graphql_schema)
+    collector = _ModelCollector(type_info)
+    visit(document, TypeInfoVisitor(type_info, collector))
+    return tuple(sorted(collector.models, key=lambda model: model._meta.label_lower))
+
+
+def operation_etag(schema, query, variables=None, operation_name=None):
+    """Weak ETag for a GET query, or None when it cannot be cached."""
+    if not query:
+        return None
+    models = analyze_operation(schema, query, operation_name)
+    if models is None:
+        return None
+    versions = sorted(get_data_versions(models).items())
+    digest = hashlib.sha1(
+        json.dumps([query, variables or "", operation_name or "", versions]).encode()
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def cache_control_for(operation_name):
+    """The Cache-Control for an operation, from CRM_GRAPHQL_CACHE_CONTROL."""
+    policies = getattr(settings, "CRM_GRAPHQL_CACHE_CONTROL", {})
+    return policies.get(operation_name, policies.get("default", DEFAULT_CACHE_CONTROL))
+
+
+def compress_response(request, response):
+    """Compress ``response`` in place when it is large enough and the client agrees."""
+    if response.streaming:
+        return compress_stream(request, response)
+    min_bytes = getattr(settings, "CRM_GRAPHQL_COMPRESS_MIN_BYTES", 1024)
+    if response.has_header("Content-Encoding") or len(response.content) < min_bytes:
+        return response
+    patch_vary_headers(response, ("Accept-Encoding",))
+
+    accept_encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    if brotli is not None and _accepts_brotli.search(accept_encoding):
+        encoding, content = "br", brotli.compress(response.content)
+    elif _accepts_gzip.search(accept_encoding):
+        encoding, content = "gzip", compress_string(response.content)
+    else:
+        return response
+    if len(content) >= len(response.content):
+        return response
+
+    response.content = content
+    response["Content-Length"] = str(len(content))
+    response["Content-Encoding"] = encoding
+    return response
+
+
+def compress_stream(request, response):
+    """Gzip a streamed response (only large results are streamed) chunk by chunk."""
+    if response.has_header("Content-Encoding"):
+        return response
+    patch_vary_headers(response, ("Accept-Encoding",))
+    if not _accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+        return response
+    response.streaming_content = compress_sequence(response.streaming_content)
+    response["Content-Encoding"] = "gzip"
+    return response
@@ -0,0 +1,309 @@
+"""
+Streaming bulk import of customers, products and orders.
+
+Rows are read lazily from CSV or NDJSON files, validated one batch at a time
+with the same rules as the mutations (``crm.validation``) and written with a
+single ``bulk_create`` per batch. Each row carries the byte offset just past
+it, so an interrupted import can resume after its last committed batch.
+
+Columns (CSV header or NDJSON keys):
+
+- customers: ``name``, ``email``, ``phone``, ``created_at``
+- products: ``name``, ``price``, ``stock``
+- orders: ``customer_id``, ``product_ids`` (a list, or ``;``-separated in
+  CSV), ``total_amount`` (defaults to the sum of the product prices),
+  ``order_date``
+"""
+
+import csv
+import json
+import time
+from collections import namedtuple
+from decimal import Decimal
+from itertools import batched
+
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Customer, Order, Product
+from .sales import add_daily_sales
+from .sqlite import write_transaction
+from .validation import customer_errors, parse_price, product_errors
+
+# ``data`` is the parsed row (None when the line could not be parsed), ``end``
+# the byte offset just past it and ``raw`` the text kept for the reject file.
+Record = namedtuple("Record", "data end raw")
+
+
+def read_ndjson(path, offset=0):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        position = offset
+        for line in f:
+            position += len(line)
+            text = line.decode("utf-8").strip()
+            if not text:
+                continue
+            try:
+                data = json.loads(text)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                data = None
+            yield Record(data, position, text)
+
+
+def read_csv(path, offset=0):
+    with open(path, "rb") as f:
+        header = f.readline()
+        fieldnames = next(csv.reader([header.decode("utf-8-sig")]))
+        position = max(offset, f.tell())
+        f.seek(position)
+
+        def lines():
+            nonlocal position
+            for line in f:
+                position += len(line)
+                yield line.decode("utf-8")
+
+        for values in csv.reader(lines()):
+            if not values:
+                continue
+            data = None
+            if len(values) == len(fieldnames):
+                data = dict(zip(fieldnames, values))
+            yield Record(data, position, values)
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def detect_format(path):
+    return "csv" if str(path).lower().endswith(".csv") else "ndjson"
+
+
+def _text(data, key):
+    value = data.get(key)
+    return str(value).strip() if value not in (None, "") else ""
+
+
+def _datetime(data, key, errors):
+    value = _text(data, key)
+    if not value:
+        return timezone.now()
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        errors.append(f"Invalid {key}")
+        return None
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def prepare_customers(records, ignore_conflicts):
+    emails = [_text(record.data, "email") for record in records]
+    existing = set()
+    if not ignore_conflicts:
+        existing = set(
+            Customer.objects.filter(email__in=emails).values_list("email", flat=True)
+        )
+
+    customers, rejects = [], []
+    for record, email in zip(records, emails):
+        name, phone = _text(record.data, "name"), _text(record.data, "phone") or None
+        errors = []
+        if not name:
+            errors.append("Name is required")
+        if not email:
+            errors.append("Email is required")
+        elif email in existing:
+            errors.append("Email already exists")
+        errors.extend(customer_errors(phone))
+        created_at = _datetime(record.data, "created_at", errors)
+        if errors:
+            rejects.append((record, errors))
+            continue
+        if not ignore_conflicts:
+            existing.add(email)
+        customers.append(
+            Customer(name=name, email=email, phone=phone, created_at=created_at)
+        )
+    return customers, rejects
+
+
+def prepare_products(records, ignore_conflicts):
+    products, rejects = [], []
+    for record in records:
+        name = _text(record.data, "name")
+        price = parse_price(_text(record.data, "price"))
+        errors = [] if name else ["Name is required"]
+        try:
+            stock = int(_text(record.data, "stock") or 0)
+        except ValueError:
+            stock = None
+            errors.append("Invalid stock")
+        errors.extend(product_errors(price, stock))
+        if errors:
+            rejects.append((record, errors))
+            continue
+        products.append(Product(name=name, price=price, stock=stock))
+    return products, rejects
+
+
+def _id_list(value):
+    if isinstance(value, list):
+        return [str(v).strip() for v in value]
+    return [v.strip() for v in str(value or "").split(";") if v.strip()]
+
+
+def prepare_orders(records, ignore_conflicts):
+    customer_ids = {_text(record.data, "customer_id") for record in records}
+    product_ids = {pk for r in records for pk in _id_list(r.data.get("product_ids"))}
+    customers = {
+        str(pk)
+        for pk in Customer.objects.filter(
+            pk__in=[pk for pk in customer_ids if pk.isdigit()]
+        ).values_list("pk", flat=True)
+    }
+    prices = {
+        str(pk): price
+        for pk, price in Product.objects.filter(
+            pk__in=[pk for pk in product_ids if pk.isdigit()]
+        ).values_list("pk", "price")
+    }
+
+    orders, rejects = [], []
+    for record in records:
+        errors = []
+        customer_id = _text(record.data, "customer_id")
+        ids = _id_list(record.data.get("product_ids"))
+        if customer_id not in customers:
+            errors.append("Invalid customer ID")
+        if not ids or any(pk not in prices for pk in ids):
+            errors.append("Invalid product IDs")
+        total = _text(record.data, "total_amount")
+        if total:
+            total = parse_price(total)
+            if total is None or total < 0:
+                errors.append("Invalid total_amount")
+        elif not errors:
+            total = sum(prices[pk] for pk in ids)
+        order_date = _datetime(record.data, "order_date", errors)
+        if errors:
+            rejects.append((record, errors))
+            continue
+        order = Order(
+            customer_id=customer_id, total_amount=total, order_date=order_date
+        )
+        # Priced as the batch read them, like an order placed through the API.
+        order._import_products = [
+            Product(pk=int(pk), price=prices[pk]) for pk in dict.fromkeys(ids)
+        ]
+        orders.append(order)
+    return orders, rejects
+
+
+def write_orders(orders, batch_size, ignore_conflicts):
+    Order.objects.bulk_create(orders, batch_size=batch_size)
+    Link = Order.products.through
+    Link.objects.bulk_create(
+        [
+            Link(order_id=order.pk, product_id=product.pk)
+            for order in orders
+            for product in order._import_products
+        ],
+        batch_size=batch_size,
+        ignore_conflicts=ignore_conflicts,
+    )
+    # bulk_create skips CreateOrder, so add the orders to the rollup here, in
+    # the batch's transaction, summed per product and day.
+    totals = {}
+    for order in orders:
+        day = timezone.localdate(order.order_date)
+        for product in order._import_products:
+            units, revenue = totals.get((product.pk, day), (0, Decimal(0)))
+            totals[product.pk, day] = (units + 1, revenue + product.price)
+    add_daily_sales(totals)
+    return len(orders)
+
+
+def _bulk_writer(model):
+    def write(objects, batch_size, ignore_conflicts):
+        """Insert ``objects`` and return how many rows were actually inserted."""
+        if not ignore_conflicts:
+            model.objects.bulk_create(objects, batch_size=batch_size)
+            return len(objects)
+        # Skipped conflicts are not reported. The batch's write transaction
+        # keeps other writers out, so the new rows are those past the old last id.
+        last = model.objects.aggregate(last=Max("pk"))["last"] or 0
+        model.objects.bulk_create(objects, batch_size=batch_size, ignore_conflicts=True)
+        return model.objects.filter(pk__gt=last).count()
+
+    return write
+
+
+IMPORTERS = {
+    "customers": (Customer, prepare_customers, _bulk_writer(Customer)),
+    "products": (Product, prepare_products, _bulk_writer(Product)),
+    "orders": (Order, prepare_orders, write_orders),
+}
+
+
+def run_import(
+    kind,
+    path,
+    fmt=None,
+    batch_size=1000,
+    ignore_conflicts=False,
+    offset=0,
+    rejects_path=None,
+    progress=None,
+):
+    """
+    Import ``path`` into the ``kind`` table and return the import statistics.
+
+    Every batch is committed on its own; ``progress`` (if given) is called with
+    the statistics after each one, including the byte ``offset`` to restart from.
+    """
+    model, prepare, write = IMPORTERS[kind]
+    records = READERS[fmt or detect_format(path)](path, offset)
+    stats = {
+        "rows": 0,
+        "imported": 0,
+        "rejected": 0,
+        "offset": offset,
+        "rows_per_sec": 0.0,
+    }
+    started = time.perf_counter()
+
+    with open(rejects_path or f"{path}.rejects.ndjson", "a") as rejects_file:
+        for batch in batched(records, batch_size):
+            parsed = [record for record in batch if record.data is not None]
+            rejects = [
+                (record, ["Malformed row"]) for record in batch if record.data is None
+            ]
+            with write_transaction():
+                objects, invalid = prepare(parsed, ignore_conflicts)
+                imported = 0
+                if objects:
+                    imported = write(objects, batch_size, ignore_conflicts)
+
+            for record, errors in rejects + invalid:
+                row = record.data if record.data is not None else record.raw
+                rejects_file.write(
+                    json.dumps({"end": record.end, "row": row, "errors": errors}) + "\n"
+                )
+            rejects_file.flush()
+
+            stats["rows"] += len(batch)
+            stats["imported"] += imported
+            stats["rejected"] += len(rejects) + len(invalid)
+            stats["offset"] = batch[-1].end
+            stats["rows_per_sec"] = round(
+                stats["rows"] / max(time.perf_counter() - started, 1e-9), 1
+            )
+            if progress:
+                progress(stats)
+    return stats
@@ -0,0 +1,368 @@
+"""
+Write-behind order ingestion.
+
+With ``CRM_ORDER_INGEST["ENABLED"]``, ``createOrder`` validates the order,
+appends it to a durable queue (a WAL-mode SQLite file on the local disk) and
+returns a provisional id instead of the order. A flusher writes the queued
+orders to the database in batches of up to ``BATCH_SIZE``, with one commit
+per batch, at most ``MAX_LATENCY`` seconds after they were queued.
+
+Stock is taken when the batch is written, so a queued order can still fail.
+``orderStatus(provisionalId)`` reports it as PENDING, COMMITTED (with the
+order) or FAILED (with the reason). Every order row carries its provisional
+id, so a batch flushed again after a crash (its rows are reclaimed after
+``CLAIM_TIMEOUT`` seconds) does not create duplicate orders.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Customer, Order, Product
+from .pubsub import ORDER_CREATED, publish
+from .routers import PRIMARY_DB
+from .sales import record_order_sales
+from .sqlite import write_transaction
+from .stock import InsufficientStock, decrement_stock
+from .versions import bump_data_version
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+FLUSHING = "flushing"
+COMMITTED = "committed"
+FAILED = "failed"
+
+DEFAULTS = {
+    "ENABLED": False,
+    "PATH": "order_queue.sqlite3",
+    "BATCH_SIZE": 100,
+    "MAX_LATENCY": 0.05,
+    "CLAIM_TIMEOUT": 30.0,
+    "RETAIN": 86400,
+    "FLUSH_IN_PROCESS": True,
+}
+
+# ``products`` holds (product id, unit price) pairs, priced when queued.
+QueuedOrder = namedtuple(
+    "QueuedOrder", "provisional_id customer_id products total_amount order_date"
+)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "CRM_ORDER_INGEST", {})}
+
+
+def ingest_enabled():
+    return get_config()["ENABLED"]
+
+
+def _load(provisional_id, payload):
+    data = json.loads(payload)
+    return QueuedOrder(
+        provisional_id,
+        data["customer_id"],
+        [(pk, Decimal(price)) for pk, price in data["products"]],
+        Decimal(data["total_amount"]),
+        parse_datetime(data["order_date"]),
+    )
+
+
+def write_batch(entries):
+    """
+    Write queued orders to the database in one transaction.
+
+    Returns ``(committed, failed)``: {provisional id: order id} and
+    {provisional id: error message}.
+    """
+    committed, failed, accepted = {}, {}, []
+    with write_transaction():
+        committed.update(
+            Order.objects.filter(
+                provisional_id__in=[entry.provisional_id for entry in entries]
+            ).values_list("provisional_id", "pk")
+        )
+        customers = set(
+            Customer.objects.filter(
+                pk__in={entry.customer_id for entry in entries}
+            ).values_list("pk", flat=True)
+        )
+        products = dict(
+            Product.objects.filter(
+                pk__in={pk for entry in entries for pk, _ in entry.products}
+            ).values_list("pk", "name")
+        )
+        for entry in entries:
+            if entry.provisional_id in committed:
+                continue  # written by an earlier flush of this batch
+            product_ids = [pk for pk, _ in entry.products]
+            if entry.customer_id not in customers:
+                failed[entry.provisional_id] = "Invalid customer ID"
+                continue
+            if any(pk not in products for pk in product_ids):
+                failed[entry.provisional_id] = "Invalid product IDs"
+                continue
+            try:
+                decrement_stock(product_ids)
+            except InsufficientStock as e:
+                names = [products[pk] for pk in product_ids if pk in e.product_ids]
+                failed[entry.provisional_id] = f"Insufficient stock: {', '.join(names)}"
+                continue
+            accepted.append(entry)
+        if not accepted:
+            return committed, failed
+
+        orders = Order.objects.bulk_create(
+            Order(
+                customer_id=entry.customer_id,
+                total_amount=entry.total_amount,
+                order_date=entry.order_date,
+                provisional_id=entry.provisional_id,
+            )
+            for entry in accepted
+        )
+        Link = Order.products.through
+        Link.objects.bulk_create(
+            Link(order_id=order.pk, product_id=pk)
+            for order, entry in zip(orders, accepted)
+            for pk, _ in entry.products
+        )
+        for order, entry in zip(orders, accepted):
+            record_order_sales(
+                order, [Product(pk=pk, price=price) for pk, price in entry.products]
+            )
+            committed[entry.provisional_id] = order.pk
+            publish(
+                ORDER_CREATED,
+                {
+                    "order_id": order.pk,
+                    "customer_id": entry.customer_id,
+                    "product_ids": [pk for pk, _ in entry.products],
+                    "total_amount": str(entry.total_amount),
+                    "order_date": entry.order_date.isoformat(),
+                },
+            )
+    return committed, failed
+
+
+class OrderQueue:
+    """Queued orders in a local SQLite file, and the thread that flushes them."""
+
+    def __init__(
+        self,
+        path,
+        batch_size=100,
+        max_latency=0.05,
+        claim_timeout=30.0,
+        retain=86400,
+        flush_in_process=True,
+    ):
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.claim_timeout = claim_timeout
+        self.retain = retain
+        self.flush_in_process = flush_in_process
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._appended = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._db().execute(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, provisional_id TEXT UNIQUE, "
+            "payload TEXT, status TEXT, order_id INTEGER, error TEXT, "
+            "queued_at REAL, claimed_at REAL, finished_at REAL)"
+        )
+        self._db().execute(
+            "CREATE INDEX IF NOT EXISTS orders_status ON orders (status, id)"
+        )
+
+    def _db(self):
+        # sqlite3 connections stay in the thread that opened them.
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=FULL")  # an accepted order survives a crash
+            self._local.db = db
+        return db
+
+    def append(self, customer_id, products, total_amount):
+        """
+        Queue an order of ``products`` (Product instances, priced at queue
+        time); returns its provisional id.
+        """
+        provisional_id = uuid.uuid4().hex
+        payload = {
+            "customer_id": customer_id,
+            "products": [[p.pk, str(p.price)] for p in products],
+            "total_amount": str(total_amount),
+            "order_date": timezone.now().isoformat(),
+        }
+        self._db().execute(
+            "INSERT INTO orders (provisional_id, payload, status, queued_at) "
+            "VALUES (?, ?, ?, ?)",
+            (provisional_id, json.dumps(payload), PENDING, time.time()),
+        )
+        # No version bump: nobody can have asked about the new id yet, so the
+        # main database is not written until the batch is flushed.
+        if self.flush_in_process:
+            self._start_flusher()
+            with self._lock:
+                self._appended += 1
+                if self._appended >= self.batch_size:
+                    self._appended = 0
+                    self._wakeup.set()  # a full batch need not wait out the latency
+        return provisional_id
+
+    def claim(self, limit):
+        """Mark up to ``limit`` pending orders as being flushed and return them."""
+        now = time.time()
+        rows = self._db().execute(
+            "UPDATE orders SET status = ?, claimed_at = ? WHERE id IN ("
+            "SELECT id FROM orders WHERE status = ? "
+            "OR (status = ? AND claimed_at < ?) ORDER BY id LIMIT ?) "
+            "RETURNING id, provisional_id, payload",
+            (FLUSHING, now, PENDING, FLUSHING, now - self.claim_timeout, limit),
+        ).fetchall()
+        return [_load(pid, payload) for _, pid, payload in sorted(rows)]
+
+    def finish(self, committed, failed):
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                "UPDATE orders SET status = ?, order_id = ?, finished_at = ? "
+                "WHERE provisional_id = ?",
+                [(COMMITTED, pk, now, pid) for pid, pk in committed.items()],
+            )
+            db.executemany(
+                "UPDATE orders SET status = ?, error = ?, finished_at = ? "
+                "WHERE provisional_id = ?",
+                [(FAILED, error, now, pid) for pid, error in failed.items()],
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def flush(self):
+        """Write one batch of queued orders; returns how many were handled."""
+        entries = self.claim(self.batch_size)
+        if not entries:
+            return 0
+        committed, failed = write_batch(entries)
+        self.finish(committed, failed)
+        # Once per batch, after finish: orderStatus answers change only now.
+        bump_data_version(Order)
+        return len(entries)
+
+    def drain(self):
+        """Flush until the queue is empty; returns how many orders were handled."""
+        handled = 0
+        while True:
+            flushed = self.flush()
+            handled += flushed
+            if flushed < self.batch_size:
+                return handled
+
+    def status(self, provisional_id):
+        """``(status, order id, error)`` of a queued order, or None if unknown here."""
+        return self._db().execute(
+            "SELECT status, order_id, error FROM orders WHERE provisional_id = ?",
+            (provisional_id,),
+        ).fetchone()
+
+    def prune(self):
+        self._db().execute(
+            "DELETE FROM orders WHERE status IN (?, ?) AND finished_at < ?",
+            (COMMITTED, FAILED, time.time() - self.retain),
+        )
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self.run_flusher, name="crm-order-flusher", daemon=True
+                )
+                self._flusher.start()
+
+    def run_flusher(self):
+        """Flush every ``max_latency`` seconds (or on a full batch) until stopped."""
+        last_prune = time.monotonic()
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.max_latency)
+            self._wakeup.clear()
+            try:
+                self.drain()
+                if time.monotonic() - last_prune > 60:
+                    self.prune()
+                    last_prune = time.monotonic()
+            except Exception:
+                # The batch stays claimed and is retried after CLAIM_TIMEOUT.
+                logger.exception("Flushing queued orders failed")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+
+@lru_cache(maxsize=None)
+def get_order_queue():
+    config = get_config()
+    return OrderQueue(
+        config["PATH"],
+        batch_size=config["BATCH_SIZE"],
+        max_latency=config["MAX_LATENCY"],
+        claim_timeout=config["CLAIM_TIMEOUT"],
+        retain=config["RETAIN"],
+        flush_in_process=config["FLUSH_IN_PROCESS"],
+    )
+
+
+def reset_order_queue():
+    """Stop the current queue's flusher and forget it (for changed settings)."""
+    if get_order_queue.cache_info().currsize:
+        get_order_queue().stop()
+    get_order_queue.cache_clear()
+
+
+def order_status(provisional_id):
+    """The ``orderStatus`` answer for a provisional id, or None if it is unknown."""
+    order = (
+        Order.objects.using(PRIMARY_DB).filter(provisional_id=provisional_id).first()
+    )
+    if order is not None:
+        return {"provisional_id": provisional_id, "status": COMMITTED, "order": order}
+    if not ingest_enabled():
+        return None
+    row = get_order_queue().status(provisional_id)
+    if row is None:
+        return None
+    status, order_id, error = row
+    if status == COMMITTED:
+        # Written, then archived or deleted since.
+        return {"provisional_id": provisional_id, "status": COMMITTED, "order": None}
+    return {
+        "provisional_id": provisional_id,
+        "status": FAILED if status == FAILED else PENDING,
+        "error": error,
+    }
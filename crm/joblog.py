@@ -0,0 +1,232 @@
+"""
+Job-run history and log sinks for the scheduled jobs.
+
+``record_job(job, log_file)`` wraps one run of a job: it writes a ``JobRun``
+row when the job starts and completes it with the duration, the number of
+rows the job processed and its status. Detailed lines go to a ``LogSink``
+instead of being appended to the log file one ``open``/``write`` at a time:
+they are buffered in memory and written in batches by a background thread
+(every ``FLUSH_INTERVAL`` seconds, or sooner once ``BUFFER_LINES`` are
+waiting), and when the run ends. A file is rotated once it grows past
+``MAX_BYTES``, keeping ``BACKUP_COUNT`` old files (``log.txt.1``, ...).
+Rotating and appending hold a lock on ``log.txt.lock``, so several processes
+can share a log file.
+
+``prune_job_runs`` deletes the ``JobRun`` rows older than ``RETAIN_DAYS``;
+the nightly archive job calls it.
+
+Nothing heavier than the CRM models is imported, so job processes stay cheap
+to start.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import JobRun
+
+try:
+    import fcntl
+except ImportError:  # optional: no cross-process lock off POSIX
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MAX_BYTES": 10 * 1024 * 1024,
+    "BACKUP_COUNT": 5,
+    "FLUSH_INTERVAL": 1.0,
+    "BUFFER_LINES": 1000,
+    "RETAIN_DAYS": 90,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "CRM_JOB_LOG", {})}
+
+
+@contextmanager
+def _file_lock(path):
+    """Hold the lock every process writing ``path`` takes before touching it."""
+    with open(f"{path}.lock", "ab") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield  # closing the file releases the lock
+
+
+class LogSink:
+    """Lines for one log file, written in batches by a background thread."""
+
+    def __init__(
+        self,
+        path,
+        max_bytes=10 * 1024 * 1024,
+        backup_count=5,
+        flush_interval=1.0,
+        buffer_lines=1000,
+    ):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.buffer_lines = buffer_lines
+        self._lines = []
+        self._lock = threading.Lock()  # guards _lines
+        self._write_lock = threading.Lock()  # one writer at a time
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+    def write(self, line):
+        """Queue ``line`` (a newline is added when missing); never blocks on I/O."""
+        if not line.endswith("\n"):
+            line += "\n"
+        with self._lock:
+            self._lines.append(line)
+            full = len(self._lines) >= self.buffer_lines
+        self._start_flusher()
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write the queued lines now, in one write."""
+        with self._write_lock:
+            with self._lock:
+                lines, self._lines = self._lines, []
+            if not lines:
+                return
+            data = "".join(lines).encode()
+            with _file_lock(self.path):
+                self._rotate(len(data))
+                with open(self.path, "ab") as f:
+                    f.write(data)
+
+    def _rotate(self, incoming):
+        if not self.max_bytes:
+            return
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if not size or size + incoming <= self.max_bytes:
+            return
+        if self.backup_count <= 0:
+            os.truncate(self.path, 0)
+            return
+        for n in range(self.backup_count - 1, 0, -1):
+            older = f"{self.path}.{n}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{n + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._run, name="crm-log-sink", daemon=True
+                )
+                self._flusher.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError:
+                # Keep the job running; the lines of this batch are lost.
+                logger.exception("Error writing %s", self.path)
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(path):
+    """The process-wide sink for ``path``."""
+    path = str(path)
+    sink = _sinks.get(path)
+    if sink is None:
+        with _sinks_lock:
+            sink = _sinks.get(path)
+            if sink is None:
+                config = get_config()
+                sink = _sinks[path] = LogSink(
+                    path,
+                    max_bytes=config["MAX_BYTES"],
+                    backup_count=config["BACKUP_COUNT"],
+                    flush_interval=config["FLUSH_INTERVAL"],
+                    buffer_lines=config["BUFFER_LINES"],
+                )
+    return sink
+
+
+@atexit.register
+def flush_sinks():
+    for sink in list(_sinks.values()):
+        try:
+            sink.flush()
+        except OSError:
+            pass
+
+
+def prune_job_runs(retain_days=None):
+    """Delete the runs that started more than ``retain_days`` ago; returns how many."""
+    if retain_days is None:
+        retain_days = get_config()["RETAIN_DAYS"]
+    cutoff = timezone.now() - timedelta(days=retain_days)
+    deleted, _ = JobRun.objects.filter(started_at__lt=cutoff).delete()
+    return deleted
+
+
+class JobRecorder:
+    """Handed to the job by ``record_job``: its log and its row count."""
+
+    def __init__(self, run, sink):
+        self.run = run
+        self.sink = sink
+        self.rows = 0
+
+    def log(self, line):
+        if self.sink is not None:
+            self.sink.write(line)
+
+    def add_rows(self, count=1):
+        self.rows += count
+
+    def fail(self, error):
+        """Mark the run as failed, for jobs that handle their own errors."""
+        self.run.status, self.run.error = JobRun.ERROR, error
+
+
+@contextmanager
+def record_job(job, log_file=None):
+    """
+    Record one run of ``job`` as a ``JobRun``; yields a ``JobRecorder``.
+
+    An exception marks the run as failed and propagates.
+    """
+    run = JobRun.objects.create(job=job, started_at=timezone.now())
+    recorder = JobRecorder(run, get_sink(log_file) if log_file else None)
+    started = time.perf_counter()
+    try:
+        yield recorder
+    except BaseException as e:
+        recorder.fail(str(e) or type(e).__name__)
+        raise
+    finally:
+        if run.status == JobRun.RUNNING:
+            run.status = JobRun.SUCCESS
+        run.duration_ms = (time.perf_counter() - started) * 1000
+        run.rows_processed = recorder.rows
+        run.save(update_fields=["status", "error", "duration_ms", "rows_processed"])
+        if recorder.sink is not None:
+            recorder.sink.flush()
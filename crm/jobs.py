@@ -0,0 +1,41 @@
+"""
+Lightweight entry point for running a CRM job in a fresh process:
+
+    python -m crm.jobs crm.cron.update_low_stock
+
+Django is set up with ``alx_backend_graphql.settings_jobs`` and nothing but
+the job itself is imported.
+"""
+
+import os
+import sys
+
+
+def setup():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings_jobs")
+    import django
+
+    django.setup()
+
+
+def run(job_path):
+    setup()
+
+    from django.utils.module_loading import import_string
+
+    if not job_path.startswith("crm."):
+        raise ValueError(f"Not a CRM job: {job_path}")
+    return import_string(job_path)()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("usage: python -m crm.jobs <dotted.path.to.job>", file=sys.stderr)
+        return 2
+    run(argv[0])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
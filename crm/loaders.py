@@ -0,0 +1,35 @@
+"""
+Per-request lookup caches for GraphQL resolvers.
+
+The cache lives on the execution context (the Django request), so every
+operation of an HTTP batch shares it: a customer loaded for one operation is
+not fetched again by the next.
+"""
+
+import threading
+
+_lock = threading.Lock()
+
+
+def get_context_cache(context, name):
+    """Return the dict cache ``name`` attached to ``context`` (None if there is none)."""
+    if context is None:
+        return None
+    caches = getattr(context, "_crm_caches", None)
+    if caches is None:
+        with _lock:
+            caches = getattr(context, "_crm_caches", None)
+            if caches is None:
+                caches = {}
+                context._crm_caches = caches
+    return caches.setdefault(name, {})
+
+
+def load_instance(context, model, pk):
+    """Fetch ``model`` by primary key, at most once per context."""
+    cache = get_context_cache(context, model._meta.label_lower)
+    if cache is None:
+        return model._default_manager.get(pk=pk)
+    if pk not in cache:
+        cache[pk] = model._default_manager.get(pk=pk)
+    return cache[pk]
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from crm.archive import archive_cutoff, archive_orders
+
+
+class Command(BaseCommand):
+    help = "Move orders older than the archive horizon into the order archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Archive horizon in days (default: CRM_ORDER_ARCHIVE_DAYS).",
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="Stop after this many batches; a later run resumes.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options["days"])
+        archived = archive_orders(
+            horizon_days=options["days"],
+            batch_size=options["batch_size"],
+            max_batches=options["max_batches"],
+        )
+        self.stdout.write(
+            f"Archived {archived} order(s) placed before {cutoff:%Y-%m-%d %H:%M}"
+        )
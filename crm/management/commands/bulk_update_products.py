@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.importer import READERS, detect_format
+from crm.product_updates import update_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply price and stock changes from a CSV or NDJSON file "
+        "(columns: id, price, stock, stock_delta)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="File format (default: from the extension, .csv or NDJSON).",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        read = READERS[options["format"] or detect_format(options["path"])]
+
+        started = time.perf_counter()
+        try:
+            records = read(options["path"])
+            updated, errors = update_products(
+                (record.data for record in records), batch_size=options["batch_size"]
+            )
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        for error in errors:
+            self.stderr.write(
+                f"Row {error.index + 1} ({error.id}): {'; '.join(error.errors)}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Updated {updated} products ({len(errors)} rejected) "
+                f"at {round(updated / elapsed) if elapsed else updated} rows/s"
+            )
+        )
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.importer import IMPORTERS, READERS, run_import
+
+
+class Command(BaseCommand):
+    help = "Stream customers, products or orders from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(IMPORTERS))
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="File format (default: from the extension, .csv or NDJSON).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--ignore-conflicts",
+            action="store_true",
+            help="Skip rows that hit a unique constraint (e.g. a known email).",
+        )
+        parser.add_argument(
+            "--offset",
+            type=int,
+            default=0,
+            help="Byte offset to resume from, as printed by an earlier run.",
+        )
+        parser.add_argument(
+            "--rejects",
+            help="File for rejected rows (default: <path>.rejects.ndjson).",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        if options["kind"] == "orders" and options["ignore_conflicts"]:
+            raise CommandError("--ignore-conflicts is not supported for orders.")
+
+        def progress(stats):
+            self.stdout.write(
+                "{rows} rows, {imported} imported, {rejected} rejected, "
+                "offset {offset} ({rows_per_sec} rows/s)".format(**stats)
+            )
+
+        try:
+            stats = run_import(
+                options["kind"],
+                options["path"],
+                fmt=options["format"],
+                batch_size=options["batch_size"],
+                ignore_conflicts=options["ignore_conflicts"],
+                offset=options["offset"],
+                rejects_path=options["rejects"],
+                progress=progress if options["verbosity"] > 1 else None,
+            )
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Imported {imported} of {rows} {kind} ({rejected} rejected) "
+                "at {rows_per_sec} rows/s; resume offset {offset}".format(
+                    kind=options["kind"], **stats
+                )
+            )
+        )
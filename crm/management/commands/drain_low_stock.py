@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.stock import drain_low_stock_queue
+
+
+class Command(BaseCommand):
+    help = "Restock the products queued in the low-stock queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the queue instead of exiting once it is empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait between polls of an empty queue (with --loop).",
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            batch = drain_low_stock_queue(batch_size=options["batch_size"])
+            for _, name, stock in batch:
+                self.stdout.write(f"Restocked {name}: {stock}")
+            if batch:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
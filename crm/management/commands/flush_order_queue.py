@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from crm.ingest import get_order_queue
+
+
+class Command(BaseCommand):
+    help = "Write the orders waiting in the write-behind queue to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep flushing as orders arrive (a dedicated flusher process).",
+        )
+
+    def handle(self, *args, **options):
+        queue = get_order_queue()
+        if options["loop"]:
+            try:
+                queue.run_flusher()
+            except KeyboardInterrupt:
+                pass
+            return
+        handled = queue.drain()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {handled} queued orders"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from crm.profiling import PROFILE_HEADER, get_config, make_profile_token
+
+
+class Command(BaseCommand):
+    help = "Print a signed header value that turns on profiling for /graphql requests."
+
+    def handle(self, *args, **options):
+        max_age = get_config()["TOKEN_MAX_AGE"]
+        self.stdout.write(f"{PROFILE_HEADER}: {make_profile_token()}")
+        self.stderr.write(f"Valid for {max_age} seconds.")
@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.sales import rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-product daily sales rollup from the orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from",
+            dest="start",
+            type=date.fromisoformat,
+            help="First day (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--to", dest="end", type=date.fromisoformat, help="Last day (YYYY-MM-DD)."
+        )
+
+    def handle(self, *args, **options):
+        start, end = options["start"], options["end"]
+        if (start is None) != (end is None):
+            raise CommandError("--from and --to must be given together.")
+        if start is not None and start > end:
+            raise CommandError("--from must not be after --to.")
+        rows = rebuild_daily_sales(start, end)
+        scope = f"{start} to {end}" if start else "all days"
+        self.stdout.write(f"Rebuilt {rows} daily sales row(s) for {scope}")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from crm.snapshot import refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = "Bring the columnar order snapshot used for analytics up to date."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Rewrite it from scratch (picks up edited and deleted orders).",
+        )
+
+    def handle(self, *args, **options):
+        meta = refresh_snapshot(rebuild=options["rebuild"])
+        self.stdout.write(
+            f"Order snapshot holds {meta['orders']} order(s) and "
+            f"{meta['links']} product link(s), up to order {meta['watermark']}"
+        )
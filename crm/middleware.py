@@ -0,0 +1,25 @@
+"""
+Middleware for the CRM application.
+"""
+
+import time
+
+from .health import request_latency
+
+
+class RequestLatencyMiddleware:
+    """Record each request's duration for the health endpoints."""
+
+    # Probes are frequent and trivial; counting them would hide real latency.
+    skip_paths = ("/healthz", "/readyz")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path in self.skip_paths:
+            return self.get_response(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        request_latency.record((time.perf_counter() - started) * 1000)
+        return response
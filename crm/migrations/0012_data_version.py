@@ -0,0 +1,68 @@
+from django.db import migrations, models
+
+# Tables whose writes bump a data version (crm.versions), by version label.
+VERSIONED_TABLES = {
+    "crm.customer": ["crm_customer"],
+    "crm.product": ["crm_product"],
+    "crm.order": ["crm_order", "crm_order_products"],
+    "crm.archivedorder": ["crm_archivedorder", "crm_archivedorderproduct"],
+    "crm.productdailysales": ["crm_productdailysales"],
+    "crm.jobrun": ["crm_jobrun"],
+}
+OPERATIONS = ("INSERT", "UPDATE", "DELETE")
+
+# Counters move to at least the clock (in microseconds), so a version that
+# was rolled back or deleted is never handed out again for other data.
+NOW_SQL = "CAST((julianday('now') - 2440587.5) * 86400000000 AS INTEGER)"
+BUMP_SQL = (
+    f"INSERT INTO crm_dataversion (label, version) VALUES ('{{label}}', {NOW_SQL}) "
+    f"ON CONFLICT (label) DO UPDATE SET version = MAX(version + 1, {NOW_SQL});"
+)
+
+
+def trigger_name(table, operation):
+    return f"crm_version_{table}_{operation.lower()}"
+
+
+def create_triggers(apps, schema_editor):
+    # SQLite is the only database the project runs on; others need the same
+    # triggers written in their own dialect.
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for label, tables in VERSIONED_TABLES.items():
+        for table in tables:
+            for operation in OPERATIONS:
+                schema_editor.execute(
+                    f"CREATE TRIGGER {trigger_name(table, operation)} "
+                    f"AFTER {operation} ON {table} "
+                    f"BEGIN {BUMP_SQL.format(label=label)} END"
+                )
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for tables in VERSIONED_TABLES.values():
+        for table in tables:
+            for operation in OPERATIONS:
+                schema_editor.execute(
+                    f"DROP TRIGGER IF EXISTS {trigger_name(table, operation)}"
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0011_job_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('label', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 6.0 on 2026-10-19 09:51
+
+from django.db import migrations, models
+
+OPERATIONS = {"INSERT": "NEW", "UPDATE": "NEW", "DELETE": "OLD"}
+
+# Writes kept in the change log; a catalog further behind reloads everything.
+CHANGE_LOG_SIZE = 10000
+
+# As in 0012.
+NOW_SQL = "CAST((julianday('now') - 2440587.5) * 86400000000 AS INTEGER)"
+BUMP_SQL = (
+    f"INSERT INTO crm_dataversion (label, version) VALUES ('crm.product', {NOW_SQL}) "
+    f"ON CONFLICT (label) DO UPDATE SET version = MAX(version + 1, {NOW_SQL});"
+)
+LOG_SQL = (
+    "INSERT INTO crm_productchange (version, product_id) "
+    "SELECT version, {row}.id FROM crm_dataversion WHERE label = 'crm.product';"
+)
+PRUNE_SQL = (
+    "DELETE FROM crm_productchange "
+    "WHERE id <= (SELECT MAX(id) - {size} FROM crm_productchange);"
+)
+
+
+def trigger_name(operation):
+    return f"crm_version_crm_product_{operation.lower()}"
+
+
+def create_triggers(statements):
+    def create(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for operation, row in OPERATIONS.items():
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger_name(operation)}")
+            body = " ".join(statements).format(row=row, size=CHANGE_LOG_SIZE)
+            schema_editor.execute(
+                f"CREATE TRIGGER {trigger_name(operation)} "
+                f"AFTER {operation} ON crm_product BEGIN {body} END"
+            )
+
+    return create
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0012_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(db_index=True)),
+                ('product_id', models.IntegerField()),
+            ],
+        ),
+        # The product triggers of 0012 also log the row they wrote.
+        migrations.RunPython(
+            create_triggers([BUMP_SQL, LOG_SQL, PRUNE_SQL]),
+            create_triggers([BUMP_SQL]),
+        ),
+    ]
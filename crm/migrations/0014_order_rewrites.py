@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# Label of the counter bumped when stored orders are rewritten rather than
+# appended to (crm.versions.ORDER_REWRITES).
+LABEL = "crm.order:rewrites"
+
+# As in 0012.
+NOW_SQL = "CAST((julianday('now') - 2440587.5) * 86400000000 AS INTEGER)"
+BUMP_SQL = (
+    f"INSERT INTO crm_dataversion (label, version) VALUES ('{LABEL}', {NOW_SQL}) "
+    f"ON CONFLICT (label) DO UPDATE SET version = MAX(version + 1, {NOW_SQL});"
+)
+
+# (table, operation, WHEN clause). Moving an order into the archive deletes
+# the live rows after copying them, which is not a rewrite.
+REWRITES = [
+    ("crm_order", "UPDATE", ""),
+    (
+        "crm_order",
+        "DELETE",
+        "WHEN NOT EXISTS (SELECT 1 FROM crm_archivedorder WHERE id = OLD.id)",
+    ),
+    ("crm_order_products", "UPDATE", ""),
+    (
+        "crm_order_products",
+        "DELETE",
+        "WHEN NOT EXISTS (SELECT 1 FROM crm_archivedorderproduct "
+        "WHERE archived_order_id = OLD.order_id AND product_id = OLD.product_id)",
+    ),
+    ("crm_archivedorder", "UPDATE", ""),
+    ("crm_archivedorder", "DELETE", ""),
+    ("crm_archivedorderproduct", "UPDATE", ""),
+    ("crm_archivedorderproduct", "DELETE", ""),
+]
+
+
+def trigger_name(table, operation):
+    return f"crm_rewrite_{table}_{operation.lower()}"
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table, operation, when in REWRITES:
+        schema_editor.execute(
+            f"CREATE TRIGGER {trigger_name(table, operation)} "
+            f"AFTER {operation} ON {table} {when} BEGIN {BUMP_SQL} END"
+        )
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table, operation, _ in REWRITES:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger_name(table, operation)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0013_product_change'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
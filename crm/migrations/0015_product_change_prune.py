@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# The product triggers of 0013 without the prune: trimming the change log on
+# every written row made bulk writes delete from it once per row, so the
+# nightly archive_old_orders job trims it instead (crm.catalog).
+OPERATIONS = {"INSERT": "NEW", "UPDATE": "NEW", "DELETE": "OLD"}
+
+# As in 0013.
+CHANGE_LOG_SIZE = 10000
+NOW_SQL = "CAST((julianday('now') - 2440587.5) * 86400000000 AS INTEGER)"
+BUMP_SQL = (
+    f"INSERT INTO crm_dataversion (label, version) VALUES ('crm.product', {NOW_SQL}) "
+    f"ON CONFLICT (label) DO UPDATE SET version = MAX(version + 1, {NOW_SQL});"
+)
+LOG_SQL = (
+    "INSERT INTO crm_productchange (version, product_id) "
+    "SELECT version, {row}.id FROM crm_dataversion WHERE label = 'crm.product';"
+)
+PRUNE_SQL = (
+    "DELETE FROM crm_productchange "
+    "WHERE id <= (SELECT MAX(id) - {size} FROM crm_productchange);"
+)
+
+
+def trigger_name(operation):
+    return f"crm_version_crm_product_{operation.lower()}"
+
+
+def create_triggers(statements):
+    def create(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for operation, row in OPERATIONS.items():
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger_name(operation)}")
+            body = " ".join(statements).format(row=row, size=CHANGE_LOG_SIZE)
+            schema_editor.execute(
+                f"CREATE TRIGGER {trigger_name(operation)} "
+                f"AFTER {operation} ON crm_product BEGIN {body} END"
+            )
+
+    return create
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0014_order_rewrites'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_triggers([BUMP_SQL, LOG_SQL]),
+            create_triggers([BUMP_SQL, LOG_SQL, PRUNE_SQL]),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.utils import timezone
 from django.db import models
 
+# Products below this stock level are queued for restocking.
+LOW_STOCK_THRESHOLD = 10
+
 
 class Customer(models.Model):
     name = models.CharField(max_length=100)
@@ -17,9 +20,26 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # Keeps the reconciliation sweep off a full table scan.
+            models.Index(
+                fields=["stock"],
+                condition=models.Q(stock__lt=LOW_STOCK_THRESHOLD),
+                name="crm_product_low_stock_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded stock so saves can tell when it changed.
+        instance._loaded_stock = instance.__dict__.get("stock")
+        return instance
+
 
 class Order(models.Model):
     customer = models.ForeignKey(
@@ -27,7 +47,172 @@ class Order(models.Model):
     )
     products = models.ManyToManyField(Product, related_name="orders")
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=None)
-    order_date = models.DateTimeField(default=timezone.now)
+    order_date = models.DateTimeField(default=timezone.now, db_index=True)
+    # Set for orders taken through the write-behind queue (crm.ingest), so a
+    # queued order is written once even when its batch is flushed again.
+    provisional_id = models.CharField(
+        max_length=32, unique=True, null=True, blank=True, editable=False
+    )
 
     def __str__(self):
         return f"Order {self.pk} by {self.customer.name}"
+
+
+class ArchivedOrder(models.Model):
+    """
+    An order moved out of ``Order`` by ``crm.archive``.
+
+    The columns match ``Order`` one for one (the id is kept), so live and
+    archived orders can be read back together with a UNION.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name="archived_orders"
+    )
+    products = models.ManyToManyField(
+        Product, through="ArchivedOrderProduct", related_name="archived_orders"
+    )
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    order_date = models.DateTimeField(db_index=True)
+    provisional_id = models.CharField(
+        max_length=32, null=True, blank=True, editable=False
+    )
+
+    def __str__(self):
+        return f"Archived order {self.pk}"
+
+
+class ArchivedOrderProduct(models.Model):
+    archived_order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["archived_order", "product"],
+                name="crm_archived_order_product_unique",
+            ),
+        ]
+
+
+class LowStockAlert(models.Model):
+    """A product whose stock fell below the threshold, waiting to be restocked."""
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="low_stock_alerts"
+    )
+    stock = models.PositiveIntegerField()
+    detected_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["detected_at"],
+                condition=models.Q(processed_at__isnull=True),
+                name="crm_lowstock_pending_idx",
+            ),
+        ]
+        constraints = [
+            # At most one pending alert per product.
+            models.UniqueConstraint(
+                fields=["product"],
+                condition=models.Q(processed_at__isnull=True),
+                name="crm_lowstock_one_pending",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Low stock: {self.product} ({self.stock})"
+
+
+class ProductDailySales(models.Model):
+    """Units sold and revenue per product and day, kept up to date as orders come in."""
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="daily_sales"
+    )
+    day = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "day"], name="crm_daily_sales_product_day"
+            ),
+        ]
+        indexes = [models.Index(fields=["day"], name="crm_daily_sales_day_idx")]
+
+    def __str__(self):
+        return f"{self.product} on {self.day}: {self.units} sold"
+
+
+class JobRun(models.Model):
+    """One run of a scheduled job (see ``crm.joblog``)."""
+
+    RUNNING = "running"
+    SUCCESS = "success"
+    ERROR = "error"
+    STATUS_CHOICES = [(RUNNING, "Running"), (SUCCESS, "Success"), (ERROR, "Error")]
+
+    job = models.CharField(max_length=100)
+    started_at = models.DateTimeField(default=timezone.now)
+    duration_ms = models.FloatField(null=True, blank=True)
+    rows_processed = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RUNNING)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["job", "-started_at"], name="crm_jobrun_job_started_idx"
+            ),
+            models.Index(fields=["-started_at"], name="crm_jobrun_started_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.job} at {self.started_at:%Y-%m-%d %H:%M:%S} ({self.status})"
+
+
+class JobLock(models.Model):
+    """
+    The lock of a scheduled job while one of its runs is in progress (see
+    ``crm.scheduling``); ``pending`` asks for one more run once it finishes.
+    """
+
+    job = models.CharField(max_length=100, primary_key=True)
+    owner = models.CharField(max_length=32)
+    acquired_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+    pending = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.job} until {self.expires_at:%Y-%m-%d %H:%M:%S}"
+
+
+class DataVersion(models.Model):
+    """
+    The write counter of a CRM model (see ``crm.versions``), bumped by
+    database triggers in the transaction of every write to its tables.
+    """
+
+    label = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.label} at {self.version}"
+
+
+class ProductChange(models.Model):
+    """
+    A write to one product row, logged by trigger under the product data
+    version it made (see ``crm.catalog``).
+    """
+
+    version = models.BigIntegerField(db_index=True)
+    product_id = models.IntegerField()
+
+    def __str__(self):
+        return f"Product {self.product_id} at {self.version}"
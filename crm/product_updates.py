@@ -0,0 +1,212 @@
+"""
+Bulk price and stock updates for products.
+
+Each change is validated with the ``createProduct`` rules
+(``crm.validation``). The valid changes of a chunk are then applied with one
+UPDATE whose CASE expressions pick every product's new price and stock,
+instead of one ``save()`` per product. The statement is written out directly:
+building the same CASE from ORM expressions cost more than running it.
+
+A change either sets the stock (``stock``) or adjusts it (``stock_delta``);
+adjustments are applied as ``stock + delta`` in the UPDATE, so they add to
+whatever concurrent orders left.
+
+Fields of a change: ``id``, and any of ``price``, ``stock``, ``stock_delta``.
+"""
+
+from collections import namedtuple
+from itertools import batched
+
+from django.conf import settings
+from django.db import connections, router
+
+from .models import LOW_STOCK_THRESHOLD, Product
+from .pubsub import PRODUCT_STOCK_CHANGED, publish
+from .sqlite import write_transaction
+from .stock import enqueue_low_stock
+from .validation import parse_price, price_errors, stock_errors
+
+ProductUpdate = namedtuple("ProductUpdate", "id price stock stock_delta")
+# ``index`` is the position of the change in the input, counting from 0, and
+# ``id`` the product ID as given.
+RowError = namedtuple("RowError", "index id errors")
+
+
+def _integer(data, key, errors):
+    value = data.get(key)
+    if value in (None, ""):
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        errors.append(f"Invalid {key}")
+        return None
+
+
+def parse_change(data):
+    """Return ``(ProductUpdate, errors)`` for one input row."""
+    if not isinstance(data, dict):
+        return None, ["Malformed row"]
+    errors = []
+    product_id = _integer(data, "id", errors)
+    if product_id is None and not errors:
+        errors.append("Product ID is required")
+
+    price = None
+    if data.get("price") not in (None, ""):
+        price = parse_price(data["price"])
+        errors.extend(price_errors(price))
+    stock = _integer(data, "stock", errors)
+    errors.extend(stock_errors(stock))
+    stock_delta = _integer(data, "stock_delta", errors)
+
+    if stock is not None and stock_delta is not None:
+        errors.append("Give either stock or stock_delta, not both")
+    if not errors and price is None and stock is None and stock_delta is None:
+        errors.append("Nothing to update")
+    return ProductUpdate(product_id, price, stock, stock_delta), errors
+
+
+def _execute_update(changes, using):
+    """One UPDATE setting the price and stock of every change, through CASE."""
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    price_field = Product._meta.get_field("price")
+    pk = quote(Product._meta.pk.column)
+    price_column = quote(price_field.column)
+    stock_column = quote(Product._meta.get_field("stock").column)
+
+    assignments, params = [], []
+    prices = [c for c in changes if c.price is not None]
+    if prices:
+        whens = " ".join(["WHEN %s THEN %s"] * len(prices))
+        assignments.append(
+            f"{price_column} = CASE {pk} {whens} ELSE {price_column} END"
+        )
+        for change in prices:
+            price = price_field.get_db_prep_save(change.price, connection)
+            params += [change.id, price]
+    stocks = [c for c in changes if c.stock is not None or c.stock_delta is not None]
+    if stocks:
+        whens = []
+        for change in stocks:
+            if change.stock is not None:
+                whens.append("WHEN %s THEN %s")
+                params += [change.id, change.stock]
+            else:
+                # Relative to the row as it is now, like F("stock") + delta.
+                whens.append(f"WHEN %s THEN {stock_column} + %s")
+                params += [change.id, change.stock_delta]
+        assignments.append(
+            f"{stock_column} = CASE {pk} {' '.join(whens)} ELSE {stock_column} END"
+        )
+    placeholders = ", ".join(["%s"] * len(changes))
+    params += [change.id for change in changes]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {quote(Product._meta.db_table)} SET {', '.join(assignments)} "
+            f"WHERE {pk} IN ({placeholders})",
+            params,
+        )
+
+
+def max_batch_size(using):
+    # Every change takes up to five query parameters. SQLite reads the limit
+    # from the open connection, so there has to be one.
+    connection = connections[using]
+    connection.ensure_connection()
+    max_params = connection.features.max_query_params
+    return max_params // 5 if max_params else None
+
+
+def apply_changes(changes):
+    """
+    Apply one chunk of ``(index, ProductUpdate)`` pairs in a single UPDATE.
+
+    Returns the RowErrors of the changes that could not be applied (unknown
+    products, adjustments that would make the stock negative).
+    """
+    ids = [change.id for _, change in changes]
+    errors, valid = [], []
+    using = router.db_for_write(Product)
+    with write_transaction(using=using):
+        before = {
+            pk: (name, stock)
+            for pk, name, stock in Product.objects.using(using)
+            .select_for_update()
+            .filter(pk__in=ids)
+            .values_list("pk", "name", "stock")
+        }
+        for index, change in changes:
+            if change.id not in before:
+                errors.append(RowError(index, change.id, ["Product not found"]))
+            elif (
+                change.stock_delta is not None
+                and before[change.id][1] + change.stock_delta < 0
+            ):
+                errors.append(RowError(index, change.id, ["Stock cannot be negative"]))
+            else:
+                valid.append(change)
+        if not valid:
+            return errors
+
+        _execute_update(valid, using)
+
+        dropped = []
+        for change in valid:
+            name, old_stock = before[change.id]
+            if change.stock is not None:
+                new_stock = change.stock
+            elif change.stock_delta is not None:
+                new_stock = old_stock + change.stock_delta
+            else:
+                continue
+            if new_stock == old_stock:
+                continue
+            publish(
+                PRODUCT_STOCK_CHANGED,
+                {
+                    "product_id": change.id,
+                    "name": name,
+                    "old_stock": old_stock,
+                    "new_stock": new_stock,
+                },
+            )
+            if old_stock >= LOW_STOCK_THRESHOLD > new_stock:
+                dropped.append(change.id)
+        enqueue_low_stock(dropped)
+    return errors
+
+
+def update_products(rows, batch_size=None):
+    """
+    Validate and apply the change ``rows`` (dicts), one chunk at a time.
+
+    Returns ``(updated, errors)``: the number of products updated and the
+    RowErrors of the rows that were skipped. Each chunk commits on its own.
+    """
+    batch_size = batch_size or getattr(settings, "CRM_PRODUCT_UPDATE_BATCH_SIZE", 500)
+    limit = max_batch_size(router.db_for_write(Product))
+    if limit:
+        batch_size = min(batch_size, limit)
+    updated, errors = 0, []
+    seen = set()
+
+    def parsed():
+        for index, data in enumerate(rows):
+            change, row_errors = parse_change(data)
+            if not row_errors and change.id in seen:
+                row_errors = ["Duplicate product ID"]
+            if row_errors:
+                raw_id = data.get("id") if isinstance(data, dict) else None
+                errors.append(RowError(index, raw_id, row_errors))
+                continue
+            seen.add(change.id)
+            yield index, change
+
+    for chunk in batched(parsed(), batch_size):
+        chunk_errors = apply_changes(chunk)
+        updated += len(chunk) - len(chunk_errors)
+        errors.extend(chunk_errors)
+    errors.sort(key=lambda error: error.index)
+    return updated, errors
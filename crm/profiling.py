@@ -0,0 +1,212 @@
+"""
+On-demand profiling of GraphQL requests.
+
+A request is profiled when it carries a valid signed ``X-CRM-Profile`` header
+(see ``python manage.py profile_token``) or is picked by the sampling rate
+``CRM_PROFILING["SAMPLE_RATE"]``. Untriggered requests pay for one header
+lookup and, when sampling is on, one random number.
+
+A capture holds a cProfile dump of the request thread and the timeline of the
+SQL statements it ran. Captures are written to ``CRM_PROFILING["DIR"]``, and
+only the newest ``MAX_CAPTURES`` are kept.
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import random
+import re
+import secrets
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+PROFILE_HEADER = "X-CRM-Profile"
+# Capture ids start with a microsecond timestamp, so they sort by age.
+CAPTURE_ID_PATTERN = re.compile(r"^\d{8}T\d{12}-[0-9a-f]{4}$")
+DEFAULTS = {
+    "SAMPLE_RATE": 0.0,
+    "DIR": "/tmp/crm_profiles",
+    "MAX_CAPTURES": 50,
+    "TOKEN_MAX_AGE": 3600,
+}
+
+_signer = signing.TimestampSigner(salt="crm.profiling")
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "CRM_PROFILING", {})}
+
+
+def make_profile_token():
+    """A header value that enables profiling until it expires."""
+    return _signer.sign(secrets.token_hex(8))
+
+
+def should_profile(request, config):
+    token = request.headers.get(PROFILE_HEADER)
+    if token:
+        try:
+            _signer.unsign(token, max_age=config["TOKEN_MAX_AGE"])
+            return True
+        except signing.BadSignature:
+            return False
+    rate = config["SAMPLE_RATE"]
+    return bool(rate) and random.random() < rate
+
+
+class Capture:
+    METADATA_KEYS = (
+        "id",
+        "trigger",
+        "method",
+        "path",
+        "query",
+        "duration_ms",
+        "sql_count",
+        "sql_ms",
+    )
+
+    def __init__(self, request, trigger):
+        timestamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        self.id = f"{timestamp}-{secrets.token_hex(2)}"
+        self.request = request
+        self.trigger = trigger
+        self.profiler = cProfile.Profile()
+        self.profiled = False
+        self.queries = []
+        self.started = time.perf_counter()
+        self.duration_ms = None
+
+    def sql_recorder(self, alias):
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                finished = time.perf_counter()
+                self.queries.append(
+                    {
+                        "alias": alias,
+                        "start_ms": round((started - self.started) * 1000, 3),
+                        "duration_ms": round((finished - started) * 1000, 3),
+                        "sql": sql,
+                        "many": many,
+                    }
+                )
+
+        return record
+
+    def summary(self, limit=30):
+        if not self.profiled:
+            return ""
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def metadata(self):
+        return {
+            "id": self.id,
+            "trigger": self.trigger,
+            "method": self.request.method,
+            "path": self.request.path,
+            "query": _graphql_query(self.request),
+            "duration_ms": self.duration_ms,
+            "sql_count": len(self.queries),
+            "sql_ms": round(sum(q["duration_ms"] for q in self.queries), 3),
+        }
+
+
+def _graphql_query(request):
+    if request.method == "GET":
+        return request.GET.get("query")
+    try:
+        return request.body.decode("utf-8", "replace")[:10000]
+    except Exception:
+        return None
+
+
+@contextmanager
+def profile_request(request):
+    """
+    Profile the block when the request asks for it; yields the Capture, or
+    None (at almost no cost) otherwise.
+    """
+    config = get_config()
+    if not should_profile(request, config):
+        yield None
+        return
+
+    trigger = "header" if request.headers.get(PROFILE_HEADER) else "sample"
+    capture = Capture(request, trigger)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(capture.sql_recorder(alias))
+                )
+            try:
+                capture.profiler.enable()
+                capture.profiled = True
+            except ValueError:  # another profiler already owns this thread
+                pass
+            try:
+                yield capture
+            finally:
+                if capture.profiled:
+                    capture.profiler.disable()
+                elapsed = time.perf_counter() - capture.started
+                capture.duration_ms = round(elapsed * 1000, 3)
+    finally:
+        save_capture(capture, config)
+
+
+def _store(config):
+    path = Path(config["DIR"])
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_capture(capture, config=None):
+    config = config or get_config()
+    store = _store(config)
+    if capture.profiled:
+        capture.profiler.dump_stats(store / f"{capture.id}.prof")
+    data = {
+        **capture.metadata(),
+        "sql": capture.queries,
+        "profile": capture.summary(),
+    }
+    (store / f"{capture.id}.json").write_text(json.dumps(data, default=str))
+
+    for old in list_captures(config)[config["MAX_CAPTURES"] :]:
+        for suffix in (".json", ".prof"):
+            (store / f"{old['id']}{suffix}").unlink(missing_ok=True)
+
+
+def list_captures(config=None):
+    """Capture metadata, newest first."""
+    store = _store(config or get_config())
+    captures = []
+    for path in sorted(store.glob("*.json"), reverse=True):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        captures.append({key: data.get(key) for key in Capture.METADATA_KEYS})
+    return captures
+
+
+def capture_path(capture_id, kind, config=None):
+    """Path of a stored capture file, or None if there is no such capture."""
+    if not CAPTURE_ID_PATTERN.match(capture_id) or kind not in ("json", "prof"):
+        return None
+    path = _store(config or get_config()) / f"{capture_id}.{kind}"
+    return path if path.exists() else None
@@ -0,0 +1,181 @@
+"""
+Publish/subscribe layer behind the GraphQL subscriptions.
+
+Publishers are ordinary synchronous Django code (mutations, model signals);
+subscribers are WebSocket connections running on an asyncio event loop. Each
+subscriber owns a bounded queue: when a slow connection lets it fill up, the
+oldest event is dropped so one consumer can never hold memory for everyone.
+
+Backends:
+
+- ``InMemoryBroker``: delivers within one process (a single node).
+- ``SQLiteLogBroker``: appends events to a shared SQLite file that every
+  process polls, a local stand-in for Redis pub/sub across several nodes.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+ORDER_CREATED = "order_created"
+PRODUCT_STOCK_CHANGED = "product_stock_changed"
+
+
+class Subscription:
+    """A bounded, drop-oldest queue of events for one subscriber."""
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def _deliver(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    def push(self, message):
+        """Hand a message to the subscriber's loop; safe from any thread."""
+        try:
+            self.loop.call_soon_threadsafe(self._deliver, message)
+        except RuntimeError:
+            # The subscriber's loop is gone; forget about it.
+            self.close()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+
+class InMemoryBroker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers[subscription.channel].discard(subscription)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers[channel])
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers[channel])
+        for subscription in subscribers:
+            subscription.push(message)
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+
+class SQLiteLogBroker(InMemoryBroker):
+    """
+    Share events between processes through an append-only SQLite table.
+
+    Publishing appends a row; a poller thread in each subscribing process
+    reads rows past its watermark and delivers them locally.
+    """
+
+    def __init__(self, path, poll_interval=0.2, retain=10000, queue_size=100):
+        super().__init__(queue_size=queue_size)
+        self.path = str(path)
+        self.poll_interval = poll_interval
+        self.retain = retain
+        self._poller = None
+        self._stopped = threading.Event()
+        db = self._connect()
+        try:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT, message TEXT)"
+            )
+        finally:
+            db.close()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def publish(self, channel, message):
+        db = self._connect()
+        try:
+            db.execute(
+                "INSERT INTO events (channel, message) VALUES (?, ?)",
+                (channel, json.dumps(message)),
+            )
+        finally:
+            db.close()
+
+    def subscribe(self, channel):
+        subscription = super().subscribe(channel)
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(
+                    target=self._poll, name="crm-pubsub-poller", daemon=True
+                )
+                self._poller.start()
+        return subscription
+
+    def _poll(self):
+        db = self._connect()
+        watermark = db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        since_prune = 0
+        while not self._stopped.wait(self.poll_interval):
+            rows = db.execute(
+                "SELECT id, channel, message FROM events WHERE id > ? ORDER BY id",
+                (watermark,),
+            ).fetchall()
+            for event_id, channel, message in rows:
+                watermark = event_id
+                self.deliver(channel, json.loads(message))
+            since_prune += len(rows)
+            if since_prune >= self.retain:
+                db.execute("DELETE FROM events WHERE id <= ?", (watermark - self.retain,))
+                since_prune = 0
+        db.close()
+
+    def stop(self):
+        self._stopped.set()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    config = getattr(settings, "CRM_PUBSUB", {})
+    backend = import_string(config.get("BACKEND", "crm.pubsub.InMemoryBroker"))
+    return backend(**config.get("OPTIONS", {}))
+
+
+def publish(channel, message):
+    """Publish once the current transaction commits, so no rollback leaks out."""
+    transaction.on_commit(lambda: get_broker().publish(channel, message))
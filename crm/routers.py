@@ -0,0 +1,100 @@
+"""
+Database routing for the CRM application.
+
+Reads are spread across the configured read replicas, while writes always go
+to the primary. A read is pinned to the primary when it runs inside
+``transaction.atomic``, inside a ``use_primary()`` block (mutations), or for a
+client that is still inside its read-your-writes window.
+
+The window travels with the client, not the server: a mutation's response
+carries a signed, timestamped token (cookie and header) that any worker can
+check on the client's next requests.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signing
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY_DB = DEFAULT_DB_ALIAS
+
+READ_YOUR_WRITES_COOKIE = "crm_read_your_writes"
+READ_YOUR_WRITES_HEADER = "X-CRM-Read-Your-Writes"
+_read_your_writes_signer = signing.TimestampSigner(salt="crm.routers.read-your-writes")
+
+_pinned_to_primary = ContextVar("crm_pinned_to_primary", default=False)
+
+
+def get_read_replicas():
+    """Return the database aliases that serve read traffic."""
+    return list(getattr(settings, "CRM_READ_REPLICAS", []))
+
+
+@contextmanager
+def use_primary():
+    """Route every read made inside the block to the primary."""
+    token = _pinned_to_primary.set(True)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+def _read_your_writes_window():
+    return getattr(settings, "CRM_READ_YOUR_WRITES_SECONDS", 5)
+
+
+def pin_client_to_primary(response, client_key):
+    """
+    Send this client's reads to the primary for the read-your-writes window,
+    through a token set on ``response``.
+    """
+    window = _read_your_writes_window()
+    if client_key and window > 0:
+        token = _read_your_writes_signer.sign(client_key)
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE,
+            token,
+            max_age=window,
+            httponly=True,
+            samesite="Lax",
+        )
+        response[READ_YOUR_WRITES_HEADER] = token
+
+
+def is_client_pinned(request, client_key):
+    """Whether the request carries this client's unexpired read-your-writes token."""
+    window = _read_your_writes_window()
+    token = request.headers.get(READ_YOUR_WRITES_HEADER) or request.COOKIES.get(
+        READ_YOUR_WRITES_COOKIE
+    )
+    if not (client_key and token and window > 0):
+        return False
+    try:
+        return _read_your_writes_signer.unsign(token, max_age=window) == client_key
+    except signing.BadSignature:
+        return False
+
+
+class ReplicaRouter:
+    """Send reads to a random replica and writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if _pinned_to_primary.get() or connections[PRIMARY_DB].in_atomic_block:
+            return PRIMARY_DB
+        replicas = get_read_replicas()
+        if not replicas:
+            return PRIMARY_DB
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY_DB, *get_read_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,174 @@
+"""
+Per-product daily sales rollup.
+
+``ProductDailySales`` holds one row per product and day. ``record_order_sales``
+adds each new order to it inside the order's transaction, so the analytics
+queries read a few hundred rollup rows instead of joining every order to its
+products. ``rebuild_daily_sales`` recomputes the rollup from the orders for
+whatever the incremental path did not see (admin edits, deletes).
+
+Orders do not store line prices, so an order counts one unit of each of its
+products at the price it had when the order was placed; a rebuild uses the
+current prices, and reads archived orders (``crm.archive``) as well.
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connections, router
+from django.db.models import Case, Count, DecimalField, F, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .catalog import catalog
+from .models import ArchivedOrderProduct, Order, ProductDailySales
+from .sqlite import write_transaction
+
+CENTS = Decimal("0.01")
+
+
+def record_order_sales(order, products):
+    """Add one unit of each of ``products`` to the rollup for the order's day."""
+    if not products:
+        return
+    day = timezone.localdate(order.order_date)
+    product_ids = [product.pk for product in products]
+    ProductDailySales.objects.bulk_create(
+        [ProductDailySales(product_id=pk, day=day) for pk in product_ids],
+        ignore_conflicts=True,
+    )
+    ProductDailySales.objects.filter(product_id__in=product_ids, day=day).update(
+        units=F("units") + 1,
+        revenue=F("revenue")
+        + Case(
+            *[When(product_id=p.pk, then=Value(p.price)) for p in products],
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    )
+
+
+def add_daily_sales(totals):
+    """
+    Add ``{(product id, day): (units, revenue)}`` to the rollup with one upsert
+    per key, for writers that aggregate a batch of orders first (the importer).
+    """
+    if not totals:
+        return
+    connection = connections[router.db_for_write(ProductDailySales)]
+    table = connection.ops.quote_name(ProductDailySales._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} (product_id, day, units, revenue) "
+            "VALUES (%s, %s, %s, %s) ON CONFLICT (product_id, day) DO UPDATE SET "
+            "units = units + excluded.units, revenue = revenue + excluded.revenue",
+            [
+                (product_id, day, units, str(revenue))
+                for (product_id, day), (units, revenue) in totals.items()
+            ],
+        )
+
+
+def _day_bounds(start, end):
+    """[start, end] days -> aware datetimes bounding the orders placed on them."""
+    lower = timezone.make_aware(datetime.combine(start, time.min))
+    upper = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    return lower, upper
+
+
+def raw_daily_sales(start=None, end=None, archived=False):
+    """
+    Aggregate the order/product join (or, with ``archived``, the order
+    archive's) by product and day (the slow path).
+    """
+    if archived:
+        links, order = ArchivedOrderProduct.objects.all(), "archived_order"
+    else:
+        links, order = Order.products.through.objects.all(), "order"
+    if start is not None and end is not None:
+        lower, upper = _day_bounds(start, end)
+        links = links.filter(
+            **{f"{order}__order_date__gte": lower, f"{order}__order_date__lt": upper}
+        )
+    return (
+        links.annotate(day=TruncDate(f"{order}__order_date"))
+        .values("product_id", "day")
+        .annotate(units=Count("id"), revenue=Sum("product__price"))
+        .order_by()
+    )
+
+
+def rebuild_daily_sales(start=None, end=None, batch_size=1000):
+    """
+    Recompute the rollup from the orders, live and archived, for [start, end]
+    days or everything.
+
+    Returns the number of rollup rows written.
+    """
+    totals = {}
+    for archived in (False, True):
+        for row in raw_daily_sales(start, end, archived=archived):
+            key = (row["product_id"], row["day"])
+            units, revenue = totals.get(key, (0, Decimal(0)))
+            totals[key] = (units + row["units"], revenue + row["revenue"])
+    rows = [
+        ProductDailySales(product_id=product_id, day=day, units=units, revenue=revenue)
+        for (product_id, day), (units, revenue) in totals.items()
+    ]
+    with write_transaction():
+        stale = ProductDailySales.objects.all()
+        if start is not None and end is not None:
+            stale = stale.filter(day__gte=start, day__lte=end)
+        stale.delete()
+        ProductDailySales.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def top_products(start, end, limit=20):
+    """Products with the most revenue over [start, end] days, read from the rollup."""
+    totals = (
+        ProductDailySales.objects.filter(day__gte=start, day__lte=end)
+        .values("product_id")
+        .annotate(units=Sum("units"), revenue=Sum("revenue"))
+        .order_by("-revenue", "product_id")[:limit]
+    )
+    return _with_products(list(totals))
+
+
+def top_products_raw(start, end, limit=20):
+    """``top_products`` computed from the order/product join, for comparison."""
+    lower, upper = _day_bounds(start, end)
+    totals = (
+        Order.products.through.objects.filter(
+            order__order_date__gte=lower, order__order_date__lt=upper
+        )
+        .values("product_id")
+        .annotate(units=Count("id"), revenue=Sum("product__price"))
+        .order_by("-revenue", "product_id")[:limit]
+    )
+    return _with_products(list(totals))
+
+
+def _with_products(totals):
+    products = {
+        product.pk: product
+        for product in catalog.products([row["product_id"] for row in totals])
+    }
+    return [
+        {
+            **row,
+            "revenue": row["revenue"].quantize(CENTS),
+            "product": products[row["product_id"]],
+        }
+        for row in totals
+    ]
+
+
+def sales_by_day(product_id, start, end):
+    """Daily units and revenue of one product over [start, end] days."""
+    return list(
+        ProductDailySales.objects.filter(
+            product_id=product_id, day__gte=start, day__lte=end
+        )
+        .order_by("day")
+        .values("day", "units", "revenue")
+    )
@@ -0,0 +1,136 @@
+"""
+One scheduler for every CRM job: Celery beat, driven by ``CRM_JOBS``.
+
+Beat sends ``crm.tasks.run_scheduled_job(name)`` on each job's schedule (see
+``crm.celery``). A run is
+
+- jittered: it is re-queued with a random countdown of up to ``JITTER``
+  seconds, so jobs due at the same minute don't all start together;
+- locked: it holds the job's ``JobLock`` row while it runs, so two workers
+  (or hosts sharing the database) never run the same job at once. A run
+  that finds the lock taken is dropped (``OVERLAP`` "skip") or leaves a
+  request for one more run when the current one finishes ("coalesce");
+- bounded: ``TIMEOUT`` is the task's soft time limit, with a hard limit
+  ``LOCK_GRACE`` seconds later. The lock expires with the hard limit, so a
+  worker that died mid-run holds up the job for one timeout at most.
+
+Jobs with ``HOLDS_LOCK`` get ``job_lock=[name, token]`` and release the lock
+themselves when their work is really done (the report's merge step).
+
+Models are imported in the lock functions, so ``crm.celery`` can read the
+schedule before Django's apps are ready.
+"""
+
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .sqlite import write_transaction
+
+SKIP = "skip"
+COALESCE = "coalesce"
+
+# Seconds between the soft and the hard time limit of a run; the job's lock
+# lasts TIMEOUT + LOCK_GRACE.
+LOCK_GRACE = 30
+
+JOB_DEFAULTS = {
+    "KWARGS": {},
+    "TIMEOUT": 600,
+    "JITTER": 0,
+    "OVERLAP": SKIP,
+    "HOLDS_LOCK": False,
+}
+
+CRONTAB_FIELDS = ("minute", "hour", "day_of_month", "month_of_year", "day_of_week")
+
+
+def get_jobs():
+    jobs = {}
+    for name, job in getattr(settings, "CRM_JOBS", {}).items():
+        job = {**JOB_DEFAULTS, **job}
+        if job["OVERLAP"] not in (SKIP, COALESCE):
+            raise ValueError(f"{name}: OVERLAP must be {SKIP!r} or {COALESCE!r}")
+        jobs[name] = job
+    return jobs
+
+
+def get_job(name):
+    try:
+        return get_jobs()[name]
+    except KeyError:
+        raise ValueError(f"Unknown scheduled job: {name}") from None
+
+
+def parse_schedule(expression):
+    """``crontab`` keyword arguments for a five-field cron expression."""
+    fields = expression.split()
+    if len(fields) != len(CRONTAB_FIELDS):
+        raise ValueError(f"Not a five-field cron expression: {expression!r}")
+    return dict(zip(CRONTAB_FIELDS, fields))
+
+
+def time_limits(job):
+    """Celery options bounding one run of ``job``."""
+    return {
+        "soft_time_limit": job["TIMEOUT"],
+        "time_limit": job["TIMEOUT"] + LOCK_GRACE,
+    }
+
+
+def jitter_delay(job, rng=random):
+    return rng.uniform(0, job["JITTER"]) if job["JITTER"] else 0.0
+
+
+def acquire_job_lock(name, timeout):
+    """
+    Take the lock of job ``name`` for ``timeout`` (+ ``LOCK_GRACE``) seconds.
+
+    Returns the owner token, or None while another run holds it. An expired
+    lock is taken over.
+    """
+    from .models import JobLock
+
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    fields = {
+        "owner": token,
+        "acquired_at": now,
+        "expires_at": now + timedelta(seconds=timeout + LOCK_GRACE),
+        "pending": False,
+    }
+    with write_transaction():
+        if JobLock.objects.filter(job=name, expires_at__lte=now).update(**fields):
+            return token
+        _, created = JobLock.objects.get_or_create(job=name, defaults=fields)
+    return token if created else None
+
+
+def request_rerun(name):
+    """Ask the run holding ``name``'s lock for one more run; False if none does."""
+    from .models import JobLock
+
+    return bool(
+        JobLock.objects.filter(job=name, expires_at__gt=timezone.now()).update(
+            pending=True
+        )
+    )
+
+
+def release_job_lock(name, token):
+    """
+    Release the lock taken with ``token``.
+
+    Returns True when a coalesced run is waiting, i.e. the caller should
+    queue the job again. A lock that expired and was taken over is left alone.
+    """
+    from .models import JobLock
+
+    with write_transaction():
+        lock = JobLock.objects.select_for_update().filter(job=name, owner=token)
+        pending = lock.values_list("pending", flat=True).first()
+        lock.delete()
+    return bool(pending)
@@ -1,13 +1,111 @@
 import graphene
 from graphene_django import DjangoObjectType
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from datetime import datetime
 from decimal import Decimal
-import re
-from .models import Customer, Product, Order
+from functools import partial
+from django.db.models import QuerySet
+from graphql import GraphQLError
+from graphene.relay.connection import connection_adapter, page_info_adapter
+from graphql_relay import connection_from_array_slice, get_offset_with_default
+from .models import (
+    ArchivedOrder,
+    Customer,
+    JobRun,
+    Product,
+    Order,
+    ProductDailySales,
+)
 from crm.models import Product
 from graphene_django.filter import DjangoFilterConnectionField
-from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .pubsub import ORDER_CREATED, PRODUCT_STOCK_CHANGED, get_broker, publish
+from .analytics import load_snapshot, order_stats
+from .archive import archived_products, orders_queryset
+from .catalog import catalog
+from .ingest import get_order_queue, ingest_enabled, order_status
+from .loaders import load_instance
+from .product_updates import update_products
+from .sqlite import write_transaction
+from .validation import customer_errors, parse_price, product_errors
+from .sales import record_order_sales, sales_by_day, top_products
+from .stock import InsufficientStock, decrement_stock
+from .counting import COUNT_CACHED, COUNT_ESTIMATED, COUNT_EXACT, count_queryset
+from .filters import (
+    CustomerFilter,
+    ProductFilter,
+    OrderFilter,
+    compiled_customer_filter,
+    compiled_product_filter,
+)
+
+
+class CountMode(graphene.Enum):
+    EXACT = COUNT_EXACT
+    CACHED = COUNT_CACHED
+    ESTIMATED = COUNT_ESTIMATED
+
+
+class CountableConnection(graphene.relay.Connection):
+    """Connection exposing totalCount, computed only when it is selected."""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+    is_estimate = graphene.Boolean()
+
+    def _count(self):
+        if not hasattr(self, "_count_result"):
+            self._count_result = count_queryset(
+                self.iterable, getattr(self, "count_mode", None)
+            )
+        return self._count_result
+
+    def resolve_total_count(self, info):
+        return self._count()[0]
+
+    def resolve_is_estimate(self, info):
+        return self._count()[1]
+
+
+class CountableConnectionField(graphene.ConnectionField):
+    """
+    Connection field that pages a queryset with LIMIT/OFFSET.
+
+    Forward pagination fetches one extra row to know whether there is a next
+    page, so no COUNT(*) runs unless totalCount asks for it.
+    """
+
+    def __init__(self, type_, *args, **kwargs):
+        kwargs.setdefault("count_mode", CountMode())
+        super().__init__(type_, *args, **kwargs)
+
+    @classmethod
+    def resolve_connection(cls, connection_type, args, resolved):
+        first = args.get("first")
+        if (
+            not isinstance(resolved, QuerySet)
+            or first is None
+            or args.get("last") is not None
+            or args.get("before") is not None
+        ):
+            connection = super().resolve_connection(connection_type, args, resolved)
+        else:
+            offset = get_offset_with_default(args.get("after"), -1) + 1
+            page = list(resolved[offset : offset + max(first, 0) + 1])
+            connection = connection_from_array_slice(
+                page,
+                args,
+                slice_start=offset,
+                array_length=offset + len(page),
+                connection_type=partial(connection_adapter, connection_type),
+                edge_type=connection_type.Edge,
+                page_info_type=page_info_adapter,
+            )
+            connection.iterable = resolved
+        count_mode = args.get("count_mode")
+        connection.count_mode = getattr(count_mode, "value", count_mode)
+        return connection
 
 
 # GraphQL Nodes with Filters
@@ -16,6 +114,7 @@ class CustomerNode(DjangoObjectType):
         model = Customer
         filterset_class = CustomerFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
 
 
 class ProductNode(DjangoObjectType):
@@ -23,6 +122,7 @@ class ProductNode(DjangoObjectType):
         model = Product
         filterset_class = ProductFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
 
 
 class OrderNode(DjangoObjectType):
@@ -30,7 +130,15 @@ class OrderNode(DjangoObjectType):
         model = Order
         filterset_class = OrderFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
+
+    def resolve_customer(self, info):
+        return load_instance(info.context, Customer, self.customer_id)
 
+    def resolve_products(self, info, **kwargs):
+        if getattr(self, "is_archived", False):
+            return archived_products(self.pk)
+        return self.products.all()
 
 # Filter Input Types
 class CustomerFilterInput(graphene.InputObjectType):
@@ -75,6 +183,11 @@ class OrderType(DjangoObjectType):
         model = Order
 
 
+class JobRunType(DjangoObjectType):
+    class Meta:
+        model = JobRun
+
+
 # Input Types
 class CustomerInput(graphene.InputObjectType):
     name = graphene.String(required=True)
@@ -88,6 +201,13 @@ class ProductInput(graphene.InputObjectType):
     stock = graphene.Int()
 
 
+class ProductUpdateInput(graphene.InputObjectType):
+    id = graphene.ID(required=True)
+    price = graphene.Float()
+    stock = graphene.Int()  # new stock level ...
+    stock_delta = graphene.Int()  # ... or an adjustment, e.g. -3
+
+
 class OrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
     product_ids = graphene.List(graphene.ID, required=True)
@@ -106,8 +226,7 @@ class CreateCustomer(graphene.Mutation):
         errors = []
         if Customer.objects.filter(email=input.email).exists():
             errors.append("Email already exists")
-        if input.phone and not re.match(r"^\+?\d[\d\-]+$", input.phone):
-            errors.append("Invalid phone format")
+        errors.extend(customer_errors(input.phone))
 
         if errors:
             return CreateCustomer(
@@ -130,13 +249,13 @@ class BulkCreateCustomers(graphene.Mutation):
 
     def mutate(self, info, input):
         created, errors = [], []
-        with transaction.atomic():
+        with write_transaction():
             for cust in input:
                 try:
                     if Customer.objects.filter(email=cust.email).exists():
                         raise ValidationError("Email already exists")
-                    if cust.phone and not re.match(r"^\+?\d[\d\-]+$", cust.phone):
-                        raise ValidationError("Invalid phone format")
+                    for error in customer_errors(cust.phone):
+                        raise ValidationError(error)
                     new_customer = Customer(
                         name=cust.name, email=cust.email, phone=cust.phone
                     )
@@ -155,13 +274,9 @@ class CreateProduct(graphene.Mutation):
     errors = graphene.List(graphene.String)
 
     def mutate(self, info, input):
-        errors = []
         try:
-            price = Decimal(str(input.price))  # convert raw float → Decimal
-            if price <= 0:
-                errors.append("Price must be positive")
-            if input.stock is not None and input.stock < 0:
-                errors.append("Stock cannot be negative")
+            price = parse_price(input.price)  # convert raw float → Decimal
+            errors = product_errors(price, input.stock)
 
             if errors:
                 return CreateProduct(product=None, errors=errors)
@@ -173,11 +288,26 @@ class CreateProduct(graphene.Mutation):
             return CreateProduct(product=None, errors=[str(e)])
 
 
+class BulkUpdateProducts(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(ProductUpdateInput, required=True)
+
+    updated_count = graphene.Int()
+    errors = graphene.List(graphene.String)
+
+    def mutate(self, info, input):
+        updated, row_errors = update_products(input)
+        errors = [f"{e.id}: {'; '.join(e.errors)}" for e in row_errors]
+        return BulkUpdateProducts(updated_count=updated, errors=errors)
+
+
 class CreateOrder(graphene.Mutation):
     class Arguments:
         input = OrderInput(required=True)
 
     order = graphene.Field(OrderType)
+    # Set instead of ``order`` when orders are queued (see crm.ingest).
+    provisional_id = graphene.String()
     errors = graphene.List(graphene.String)
 
     def mutate(self, info, input):
@@ -188,15 +318,44 @@ class CreateOrder(graphene.Mutation):
             errors.append("Invalid customer ID")
             return CreateOrder(order=None, errors=errors)
 
-        products = Product.objects.filter(id__in=input.product_ids)
-        if not products.exists():
+        # Prices come from the catalog; stock is still taken in the database.
+        product_ids = [int(pk) for pk in input.product_ids if str(pk).isdigit()]
+        products = catalog.products(dict.fromkeys(product_ids))
+        if not products:
             errors.append("Invalid product IDs")
             return CreateOrder(order=None, errors=errors)
 
         total = sum([Decimal(str(p.price)) for p in products])
-        order = Order(customer=customer, total_amount=total)
-        order.save()
-        order.products.set(products)
+        if ingest_enabled():
+            # Stock is taken when the order is flushed; this only turns away
+            # orders the catalog already knows cannot be filled.
+            short = [p.name for p in products if p.stock < 1]
+            if short:
+                errors.append(f"Insufficient stock: {', '.join(short)}")
+                return CreateOrder(order=None, errors=errors)
+            provisional_id = get_order_queue().append(customer.pk, products, total)
+            return CreateOrder(order=None, provisional_id=provisional_id, errors=[])
+        try:
+            with write_transaction():
+                decrement_stock([p.pk for p in products])
+                order = Order(customer=customer, total_amount=total)
+                order.save()
+                order.products.set(products)
+                record_order_sales(order, products)
+        except InsufficientStock as e:
+            names = [p.name for p in products if p.pk in e.product_ids]
+            errors.append(f"Insufficient stock: {', '.join(names)}")
+            return CreateOrder(order=None, errors=errors)
+        publish(
+            ORDER_CREATED,
+            {
+                "order_id": order.pk,
+                "customer_id": customer.pk,
+                "product_ids": [p.pk for p in products],
+                "total_amount": str(order.total_amount),
+                "order_date": order.order_date.isoformat(),
+            },
+        )
         return CreateOrder(order=order, errors=[])
 
 
@@ -244,32 +403,121 @@ class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
+    bulk_update_products = BulkUpdateProducts.Field()
     create_order = CreateOrder.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
 
 
+# Sales Analytics Types
+class ProductSalesType(graphene.ObjectType):
+    data_models = (ProductDailySales,)  # for HTTP cache validators
+
+    product = graphene.Field(ProductType)
+    units = graphene.Int()
+    revenue = graphene.Decimal()
+
+
+class DailySalesType(graphene.ObjectType):
+    data_models = (ProductDailySales,)
+
+    day = graphene.Date()
+    units = graphene.Int()
+    revenue = graphene.Decimal()
+
+
+class OrderValuePercentileType(graphene.ObjectType):
+    percentile = graphene.Float()
+    value = graphene.Decimal()
+
+
+class DailyOrdersType(graphene.ObjectType):
+    day = graphene.Date()
+    orders = graphene.Int()
+    revenue = graphene.Decimal()
+
+
+class CustomerOrdersType(graphene.ObjectType):
+    customer = graphene.Field(CustomerType)
+    orders = graphene.Int()
+    revenue = graphene.Decimal()
+
+
+class OrderStatsType(graphene.ObjectType):
+    data_models = (Order, ArchivedOrder)  # read from the order snapshot
+
+    orders = graphene.Int()
+    revenue = graphene.Decimal()
+    percentiles = graphene.List(OrderValuePercentileType)
+    by_day = graphene.List(DailyOrdersType)
+    top_customers = graphene.List(CustomerOrdersType)
+
+
+class OrderIngestStatus(graphene.Enum):
+    PENDING = "pending"
+    COMMITTED = "committed"
+    FAILED = "failed"
+
+
+class OrderStatusType(graphene.ObjectType):
+    data_models = (Order,)  # every status change bumps the Order version
+
+    provisional_id = graphene.String()
+    status = graphene.Field(OrderIngestStatus)
+    order = graphene.Field(OrderType)
+    error = graphene.String()
+
+
 # Root Query
 class Query(graphene.ObjectType):
-    all_customers = graphene.ConnectionField(
+    all_customers = CountableConnectionField(
         CustomerNode._meta.connection,
         filter=CustomerFilterInput(),
         order_by=graphene.List(of_type=graphene.String),
     )
-    all_products = graphene.ConnectionField(
+    all_products = CountableConnectionField(
         ProductNode._meta.connection,
         filter=ProductFilterInput(),
         order_by=graphene.List(of_type=graphene.String),
     )
-    all_orders = graphene.ConnectionField(
+    all_orders = CountableConnectionField(
         OrderNode._meta.connection,
         filter=OrderFilterInput(),
         order_by=graphene.List(of_type=graphene.String),
     )
+    top_products = graphene.List(
+        ProductSalesType,
+        from_=graphene.Date(name="from", required=True),
+        to=graphene.Date(required=True),
+        limit=graphene.Int(default_value=20),
+    )
+    sales_by_day = graphene.List(
+        DailySalesType,
+        product_id=graphene.ID(required=True),
+        from_=graphene.Date(name="from", required=True),
+        to=graphene.Date(required=True),
+    )
+    order_status = graphene.Field(
+        OrderStatusType, provisional_id=graphene.String(required=True)
+    )
+    job_runs = graphene.List(
+        JobRunType,
+        job=graphene.String(),
+        since=graphene.DateTime(),
+        status=graphene.String(),
+        limit=graphene.Int(default_value=100),
+    )
+    order_stats = graphene.Field(
+        OrderStatsType,
+        from_=graphene.Date(name="from", required=True),
+        to=graphene.Date(required=True),
+        top_customers=graphene.Int(default_value=10),
+        percentiles=graphene.List(graphene.Float, default_value=[50, 90, 99]),
+    )
 
     def resolve_all_customers(self, info, filter=None, order_by=None, **kwargs):
         qs = Customer.objects.all()
         if filter:
-            qs = CustomerFilter(data=filter, queryset=qs).qs
+            qs = compiled_customer_filter.filter(qs, filter)
         if order_by:
             qs = qs.order_by(*order_by)
         return qs
@@ -277,15 +525,82 @@ class Query(graphene.ObjectType):
     def resolve_all_products(self, info, filter=None, order_by=None, **kwargs):
         qs = Product.objects.all()
         if filter:
-            qs = ProductFilter(data=filter, queryset=qs).qs
+            qs = compiled_product_filter.filter(qs, filter)
         if order_by:
             qs = qs.order_by(*order_by)
         return qs
 
     def resolve_all_orders(self, info, filter=None, order_by=None, **kwargs):
-        qs = Order.objects.all()
-        if filter:
-            qs = OrderFilter(data=filter, queryset=qs).qs
-        if order_by:
-            qs = qs.order_by(*order_by)
-        return qs
+        # Archived orders are included only when the date range reaches them.
+        return orders_queryset(filter, order_by)
+
+    def resolve_top_products(self, info, from_, to, limit=20):
+        return top_products(from_, to, limit=max(0, min(limit, 100)))
+
+    def resolve_sales_by_day(self, info, product_id, from_, to):
+        return sales_by_day(product_id, from_, to)
+
+    def resolve_order_status(self, info, provisional_id):
+        return order_status(provisional_id)
+
+    def resolve_job_runs(self, info, job=None, since=None, status=None, limit=100):
+        runs = JobRun.objects.order_by("-started_at")
+        if job:
+            runs = runs.filter(job=job)
+        if since:
+            runs = runs.filter(started_at__gte=since)
+        if status:
+            runs = runs.filter(status=status)
+        return runs[: max(0, min(limit, 1000))]
+
+    def resolve_order_stats(self, info, from_, to, top_customers=10, percentiles=()):
+        if any(not 0 <= p <= 100 for p in percentiles):
+            raise GraphQLError("Percentiles must be between 0 and 100")
+        snapshot = load_snapshot()
+        if snapshot is None:
+            raise GraphQLError("Order statistics are unavailable (needs NumPy)")
+        return order_stats(
+            snapshot,
+            from_,
+            to,
+            top_customers=max(0, min(top_customers, 100)),
+            percentiles=percentiles,
+        )
+
+
+# Subscription Event Types
+class OrderCreatedEvent(graphene.ObjectType):
+    order_id = graphene.ID()
+    customer_id = graphene.ID()
+    product_ids = graphene.List(graphene.ID)
+    total_amount = graphene.Decimal()
+    order_date = graphene.DateTime()
+
+    def resolve_order_date(root, info):
+        return datetime.fromisoformat(root["order_date"])
+
+
+class ProductStockChangedEvent(graphene.ObjectType):
+    product_id = graphene.ID()
+    name = graphene.String()
+    old_stock = graphene.Int()
+    new_stock = graphene.Int()
+
+
+# Root Subscription
+class Subscription(graphene.ObjectType):
+    order_created = graphene.Field(OrderCreatedEvent)
+    product_stock_changed = graphene.Field(
+        ProductStockChangedEvent, product_id=graphene.ID()
+    )
+
+    async def subscribe_order_created(root, info):
+        async with get_broker().subscribe(ORDER_CREATED) as events:
+            async for event in events:
+                yield event
+
+    async def subscribe_product_stock_changed(root, info, product_id=None):
+        async with get_broker().subscribe(PRODUCT_STOCK_CHANGED) as events:
+            async for event in events:
+                if product_id is None or str(event["product_id"]) == str(product_id):
+                    yield event
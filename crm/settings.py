@@ -4,7 +4,6 @@ CRM App Configuration Settings
 
 # Django INSTALLED_APPS entry
 INSTALLED_APPS = [
-    "django_crontab",
     "django_celery_beat",
 ]
 
@@ -38,26 +37,11 @@ CRON_INTERVALS = {
     "ORDER_REMINDERS": "0 8 * * *",
 }
 
-# Django Crontab Jobs Configuration
-CRONJOBS = [
-    ("*/5 * * * *", "crm.cron.log_crm_heartbeat"),
-    ("0 */12 * * *", "crm.cron.update_low_stock"),
-]
-
-# Celery Configuration
-CELERY_BROKER_URL = "redis://localhost:6379/0"
-CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
-CELERY_ACCEPT_CONTENT = ["json"]
-CELERY_TASK_SERIALIZER = "json"
-CELERY_RESULT_SERIALIZER = "json"
-CELERY_TIMEZONE = "UTC"
+# Scheduled jobs: CRM_JOBS in alx_backend_graphql/settings.py, all sent by
+# Celery beat (see crm/scheduling.py).
 
-# Celery Beat Schedule
-from celery.schedules import crontab
+# Celery configuration: CELERY_* in alx_backend_graphql/settings.py, which
+# crm.celery and the /readyz broker check read.
 
-CELERY_BEAT_SCHEDULE = {
-    "generate-crm-report": {
-        "task": "crm.tasks.generate_crm_report",
-        "schedule": crontab(day_of_week="mon", hour=6, minute=0),
-    },
-}
+# Celery Beat Schedule: defined in crm/celery.py so that importing settings
+# never has to import Celery.
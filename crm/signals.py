@@ -0,0 +1,45 @@
+"""
+Signal receivers for the CRM models.
+"""
+
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .admission import get_admission_controller
+from .ingest import reset_order_queue
+from .models import LOW_STOCK_THRESHOLD, Product
+from .pubsub import PRODUCT_STOCK_CHANGED, publish
+from .stock import enqueue_low_stock
+
+
+@receiver(post_save, sender=Product)
+def publish_stock_change(sender, instance, created, **kwargs):
+    old_stock = getattr(instance, "_loaded_stock", None)
+    if created or old_stock != instance.stock:
+        publish(
+            PRODUCT_STOCK_CHANGED,
+            {
+                "product_id": instance.pk,
+                "name": instance.name,
+                "old_stock": old_stock,
+                "new_stock": instance.stock,
+            },
+        )
+        was_above = old_stock is None or old_stock >= LOW_STOCK_THRESHOLD
+        if was_above and instance.stock < LOW_STOCK_THRESHOLD:
+            enqueue_low_stock([instance.pk])
+    instance._loaded_stock = instance.stock
+
+
+@receiver(setting_changed)
+def reset_cached_settings(setting, **kwargs):
+    if setting == "CRM_ADMISSION":
+        get_admission_controller.cache_clear()
+    elif setting == "CRM_ORDER_INGEST":
+        reset_order_queue()
+    elif setting == "CRM_GRAPHQL_ENCODER":
+        # Imported here: crm.encoding imports graphene, which jobs never load.
+        from .encoding import get_encoder
+
+        get_encoder.cache_clear()
@@ -0,0 +1,246 @@
+"""
+Columnar snapshot of the orders for vectorized analytics (``crm.analytics``).
+
+Live and archived orders are written to flat files of native int64 values,
+one file per column, which NumPy maps straight into memory:
+
+- ``order_id``, ``customer_id``, ``order_date`` (microseconds since the
+  epoch, UTC), ``total_cents`` (``total_amount`` scaled by ``SCALE``), in
+  order id order
+- ``link_order_id``, ``link_product_id``: the order/product links
+
+``meta.json`` holds the row counts and the id watermark. A refresh appends
+the orders past the watermark and their links, then rewrites ``meta.json``,
+so readers only ever see complete rows. Orders are append-only apart from
+admin edits and deletes; those move the ``ORDER_REWRITES`` counter
+(``crm.versions``), and a refresh that finds it moved since the snapshot was
+built rebuilds it. A rebuild writes a new generation directory and switches
+``meta.json`` to it.
+
+Writing the snapshot needs only the standard library; reading it needs NumPy.
+"""
+
+import heapq
+import json
+import os
+import shutil
+import threading
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import chain, islice
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderProduct, Order
+from .routers import PRIMARY_DB
+from .sqlite import read_transaction
+from .versions import ORDER_REWRITES, get_versions
+
+try:
+    import fcntl
+except ImportError:  # optional: writers are serialized within the process only
+    fcntl = None
+
+ORDER_COLUMNS = ("order_id", "customer_id", "order_date", "total_cents")
+LINK_COLUMNS = ("link_order_id", "link_product_id")
+SCALE = 100  # total_amount has two decimal places
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+DEFAULTS = {"ENABLED": True, "DIR": "/tmp/crm_order_snapshot", "CHUNK_SIZE": 10000}
+
+_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "CRM_ORDER_SNAPSHOT", {})}
+
+
+def to_micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def _database_name():
+    return str(connections[PRIMARY_DB].settings_dict["NAME"])
+
+
+def _max_order_id():
+    return max(
+        model.objects.using(PRIMARY_DB).aggregate(last=Max("pk"))["last"] or 0
+        for model in (Order, ArchivedOrder)
+    )
+
+
+def _order_rewrites():
+    return get_versions([ORDER_REWRITES], using=PRIMARY_DB)[ORDER_REWRITES]
+
+
+def _stale(meta, rewrites):
+    # A snapshot of another database (e.g. the dev one, seen from the test
+    # runner), or of orders since edited or deleted, is rebuilt rather than
+    # extended.
+    return (
+        meta is None
+        or meta.get("database") != _database_name()
+        or meta.get("rewrites") != rewrites
+        or meta["watermark"] > _max_order_id()
+    )
+
+
+def read_meta(directory=None):
+    path = Path(directory or get_config()["DIR"]) / "meta.json"
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(directory, meta):
+    tmp = directory / "meta.json.tmp"
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, directory / "meta.json")
+
+
+def column_path(directory, meta, column):
+    return Path(directory) / meta["generation"] / f"{column}.i8"
+
+
+@contextmanager
+def _exclusive(directory):
+    """Serialize writers across threads and (on POSIX) processes."""
+    with _lock, open(directory / ".lock", "w") as lock_file:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _order_rows(after, chunk_size):
+    fields = ("id", "customer_id", "order_date", "total_amount")
+    sources = [
+        model.objects.using(PRIMARY_DB)
+        .filter(pk__gt=after)
+        .order_by("pk")
+        .values_list(*fields)
+        .iterator(chunk_size=chunk_size)
+        for model in (Order, ArchivedOrder)
+    ]
+    last = None
+    for pk, customer_id, order_date, total in heapq.merge(*sources):
+        if pk == last:
+            continue  # archived while being read: seen in both tables
+        last = pk
+        yield pk, customer_id, to_micros(order_date), int(total * SCALE)
+
+
+def _link_rows(after, upto, chunk_size):
+    live = Order.products.through.objects.using(PRIMARY_DB).filter(
+        order_id__gt=after, order_id__lte=upto
+    )
+    archived = ArchivedOrderProduct.objects.using(PRIMARY_DB).filter(
+        archived_order_id__gt=after, archived_order_id__lte=upto
+    )
+    return chain(
+        live.values_list("order_id", "product_id").iterator(chunk_size=chunk_size),
+        archived.values_list("archived_order_id", "product_id").iterator(
+            chunk_size=chunk_size
+        ),
+    )
+
+
+def _append(generation, columns, rows, chunk_size):
+    """Append ``rows`` (tuples) to the column files; returns (rows, last row)."""
+    files = [open(generation / f"{column}.i8", "ab") for column in columns]
+    written, last = 0, None
+    try:
+        while chunk := list(islice(rows, chunk_size)):
+            for f, values in zip(files, zip(*chunk)):
+                f.write(array("q", values).tobytes())
+            written += len(chunk)
+            last = chunk[-1]
+        for f in files:
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        for f in files:
+            f.close()
+    return written, last
+
+
+def _truncate(generation, columns, rows):
+    # Drop what a crashed refresh appended past the committed row count.
+    for column in columns:
+        with open(generation / f"{column}.i8", "ab") as f:
+            f.truncate(rows * 8)
+
+
+def refresh_snapshot(rebuild=False, directory=None):
+    """
+    Bring the snapshot up to date (from scratch with ``rebuild``); returns
+    its metadata.
+    """
+    config = get_config()
+    directory = Path(directory or config["DIR"])
+    directory.mkdir(parents=True, exist_ok=True)
+    chunk_size = config["CHUNK_SIZE"]
+
+    with _exclusive(directory):
+        meta = read_meta(directory)
+        # One consistent read, the rewrite counter included.
+        with read_transaction(PRIMARY_DB):
+            rewrites = _order_rewrites()
+            fresh = rebuild or _stale(meta, rewrites)
+            if fresh:
+                meta = {
+                    "generation": f"g{timezone.now().strftime('%Y%m%dT%H%M%S%f')}",
+                    "database": _database_name(),
+                    "scale": SCALE,
+                    "orders": 0,
+                    "links": 0,
+                    "watermark": 0,
+                    "rewrites": rewrites,
+                }
+            generation = directory / meta["generation"]
+            generation.mkdir(exist_ok=True)
+            _truncate(generation, ORDER_COLUMNS, meta["orders"])
+            _truncate(generation, LINK_COLUMNS, meta["links"])
+
+            added, last = _append(
+                generation,
+                ORDER_COLUMNS,
+                _order_rows(meta["watermark"], chunk_size),
+                chunk_size,
+            )
+            if added:
+                links, _ = _append(
+                    generation,
+                    LINK_COLUMNS,
+                    _link_rows(meta["watermark"], last[0], chunk_size),
+                    chunk_size,
+                )
+                meta = {
+                    **meta,
+                    "orders": meta["orders"] + added,
+                    "links": meta["links"] + links,
+                    "watermark": last[0],
+                }
+        if not (fresh or added):
+            return meta
+        meta["refreshed_at"] = timezone.now().isoformat()
+        _write_meta(directory, meta)
+
+        for old in directory.glob("g*"):
+            if old.name != meta["generation"]:
+                shutil.rmtree(old, ignore_errors=True)
+    return meta
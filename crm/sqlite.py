@@ -0,0 +1,61 @@
+"""
+Transaction helpers for SQLite (see ``CRM_SQLITE_PROFILE``).
+
+The write paths (mutations, the order queue flush, jobs) open their
+transactions with ``write_transaction``, which sends BEGIN IMMEDIATE: the
+write lock is taken up front, waiting up to ``busy_timeout``, instead of
+failing with "database is locked" when a reading transaction upgrades to
+writing. Everything else, the read replicas included, keeps SQLite's
+deferred BEGIN, so readers never queue for the write lock;
+``read_transaction`` makes that explicit for consistent multi-query reads.
+"""
+
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+PRAGMAS = ("journal_mode", "synchronous", "mmap_size", "cache_size", "busy_timeout")
+
+
+@contextmanager
+def _atomic(using, mode):
+    """``transaction.atomic`` whose outermost block on SQLite sends BEGIN ``mode``."""
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    connection.ensure_connection()  # the mode is set from OPTIONS on connect
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    # transaction_mode is read when the outermost block sends BEGIN.
+    default = connection.transaction_mode
+    connection.transaction_mode = mode
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = default
+            yield
+    finally:
+        connection.transaction_mode = default
+
+
+def read_transaction(using):
+    """``transaction.atomic`` for reads: a deferred transaction on SQLite."""
+    return _atomic(using, None)
+
+
+def write_transaction(using=None):
+    """``transaction.atomic`` for writes: BEGIN IMMEDIATE on SQLite."""
+    return _atomic(using, "IMMEDIATE")
+
+
+def pragmas(using):
+    """{pragma: value} of the settings the production profile tunes."""
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return {}
+    with connection.cursor() as cursor:
+        values = {}
+        for name in PRAGMAS:
+            cursor.execute(f"PRAGMA {name}")
+            row = cursor.fetchone()  # no row for mmap_size in memory
+            values[name] = row[0] if row else None
+    return values
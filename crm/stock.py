@@ -0,0 +1,132 @@
+"""
+Stock bookkeeping for the CRM application.
+
+Stock changes that cross below ``LOW_STOCK_THRESHOLD`` are recorded in the
+``LowStockAlert`` queue as they happen. ``drain_low_stock_queue`` restocks
+the queued products in batches, and ``reconcile_low_stock`` re-queues any
+product the event path missed (the old 12-hour scan, now backed by a
+partial index).
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import LOW_STOCK_THRESHOLD, LowStockAlert, Product
+from .pubsub import PRODUCT_STOCK_CHANGED, publish
+from .sqlite import write_transaction
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f"Insufficient stock for product(s) {product_ids}")
+
+
+def _publish_stock_changes(before, delta):
+    for product_id, name, old_stock in before:
+        publish(
+            PRODUCT_STOCK_CHANGED,
+            {
+                "product_id": product_id,
+                "name": name,
+                "old_stock": old_stock,
+                "new_stock": old_stock + delta,
+            },
+        )
+
+
+def decrement_stock(product_ids, quantity=1):
+    """
+    Take ``quantity`` units of each product in one guarded UPDATE.
+
+    Raises InsufficientStock, leaving every product untouched, when any of
+    them does not have enough stock. Must run inside ``write_transaction``.
+
+    The UPDATE itself only takes stock from rows that still have enough, in
+    case a concurrent writer got in after the rows were read (SQLite ignores
+    ``select_for_update``); a short row count rolls it back to a savepoint.
+    """
+    product_ids = list(product_ids)
+    before = list(
+        Product.objects.select_for_update()
+        .filter(pk__in=product_ids)
+        .values_list("pk", "name", "stock")
+    )
+    short = [pk for pk, _, stock in before if stock < quantity]
+    if short:
+        raise InsufficientStock(short)
+
+    savepoint = transaction.savepoint()
+    updated = Product.objects.filter(pk__in=product_ids, stock__gte=quantity).update(
+        stock=F("stock") - quantity
+    )
+    if updated < len(before):
+        transaction.savepoint_rollback(savepoint)
+        short = Product.objects.filter(pk__in=product_ids, stock__lt=quantity)
+        raise InsufficientStock(list(short.values_list("pk", flat=True)))
+    transaction.savepoint_commit(savepoint)
+    _publish_stock_changes(before, -quantity)
+    enqueue_low_stock(
+        pk
+        for pk, _, stock in before
+        if stock >= LOW_STOCK_THRESHOLD > stock - quantity
+    )
+
+
+def enqueue_low_stock(product_ids):
+    """Queue the given products, skipping those that already have a pending alert."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    products = Product.objects.filter(
+        pk__in=product_ids, stock__lt=LOW_STOCK_THRESHOLD
+    ).values_list("pk", "stock")
+    alerts = [LowStockAlert(product_id=pk, stock=stock) for pk, stock in products]
+    LowStockAlert.objects.bulk_create(alerts, ignore_conflicts=True)
+    return len(alerts)
+
+
+def reconcile_low_stock():
+    """Queue every product below the threshold; returns how many were found."""
+    low_stock = Product.objects.filter(stock__lt=LOW_STOCK_THRESHOLD)
+    return enqueue_low_stock(low_stock.values_list("pk", flat=True))
+
+
+def drain_low_stock_queue(batch_size=None, restock_amount=None):
+    """
+    Restock one batch of queued products with a single UPDATE.
+
+    Returns the restocked products as (id, name, new stock) tuples.
+    """
+    batch_size = batch_size or getattr(settings, "CRM_LOW_STOCK_BATCH_SIZE", 100)
+    restock_amount = restock_amount or getattr(settings, "CRM_RESTOCK_AMOUNT", 10)
+
+    with write_transaction():
+        alerts = list(
+            LowStockAlert.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by("detected_at")
+            .values_list("pk", "product_id")[:batch_size]
+        )
+        if not alerts:
+            return []
+
+        product_ids = [product_id for _, product_id in alerts]
+        # A product restocked by other means since it was queued is skipped.
+        before = list(
+            Product.objects.select_for_update()
+            .filter(pk__in=product_ids, stock__lt=LOW_STOCK_THRESHOLD)
+            .values_list("pk", "name", "stock")
+        )
+        Product.objects.filter(pk__in=[pk for pk, _, _ in before]).update(
+            stock=F("stock") + restock_amount
+        )
+        LowStockAlert.objects.filter(pk__in=[pk for pk, _ in alerts]).update(
+            processed_at=timezone.now()
+        )
+        if before:
+            _publish_stock_changes(before, restock_amount)
+
+    return [(pk, name, stock + restock_amount) for pk, name, stock in before]
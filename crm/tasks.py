@@ -2,93 +2,355 @@
 Celery tasks for the CRM application.
 """
 
-import requests
-from celery import shared_task
-from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from celery import chord, shared_task
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+
+from .celery import app as celery_app  # noqa: F401 - binds shared_task to the CRM app
+
+REPORT_PARTITION_DAYS = 7
+REPORT_CACHE_PREFIX = "crm:report-partition"
+CENTS = Decimal("0.01")
+
+
+def report_partitions(start, end, partition_days=REPORT_PARTITION_DAYS):
+    """
+    Split [start, end) into partitions aligned on Monday 00:00 UTC.
+
+    Alignment keeps the boundaries of past weeks identical between runs, so a
+    closed partition always maps to the same cache key.
+    """
+    origin = datetime(2000, 1, 3, tzinfo=timezone.get_current_timezone())  # a Monday
+    step = timedelta(days=partition_days)
+    boundary = origin + ((start - origin) // step + 1) * step
+
+    partitions = []
+    current = start
+    while current < end:
+        upper = min(boundary, end)
+        partitions.append((current, upper))
+        current, boundary = upper, boundary + step
+    return partitions
+
+
+def _parse_datetime(value):
+    parsed = datetime.fromisoformat(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _report_versions():
+    """
+    The data versions of the models a report reads, as part of its partition
+    cache keys: any write to them, from any process, moves every key.
+    """
+    from .models import ArchivedOrder, Customer, Order
+    from .versions import get_data_versions
+
+    versions = get_data_versions((Order, ArchivedOrder, Customer))
+    return ":".join(str(version) for _, version in sorted(versions.items()))
+
+
+def _partition_cache_key(start, end, versions):
+    return f"{REPORT_CACHE_PREFIX}:{versions}:{start.isoformat()}:{end.isoformat()}"
+
+
+@shared_task
+def aggregate_report_partition(start, end):
+    """
+    Aggregate orders (live and archived), revenue and new customers for one
+    [start, end) window.
+
+    The partial result is cached once the window is closed, under the data
+    versions read before aggregating.
+    """
+    from .analytics import load_snapshot, window_totals
+    from .models import ArchivedOrder, Customer, Order
+
+    start_dt = _parse_datetime(start)
+    end_dt = _parse_datetime(end)
+    versions = _report_versions()
+
+    totals = {"orders": 0, "revenue": Decimal(0)}
+    snapshot = load_snapshot()
+    if snapshot is not None:
+        totals["orders"], totals["revenue"] = window_totals(snapshot, start_dt, end_dt)
+    else:
+        for model in (Order, ArchivedOrder):
+            window = model.objects.filter(
+                order_date__gte=start_dt, order_date__lt=end_dt
+            )
+            part = window.aggregate(orders=Count("id"), revenue=Sum("total_amount"))
+            totals["orders"] += part["orders"]
+            totals["revenue"] += part["revenue"] or 0
+    customers = Customer.objects.filter(
+        created_at__gte=start_dt, created_at__lt=end_dt
+    ).count()
+
+    partial = {
+        "start": start,
+        "end": end,
+        "customers": customers,
+        "orders": totals["orders"],
+        # Decimals travel as strings so the JSON serializer keeps them exact.
+        "revenue": str(totals["revenue"].quantize(CENTS)),
+    }
+    if end_dt <= timezone.now():
+        cache.set(
+            _partition_cache_key(start_dt, end_dt, versions),
+            partial,
+            timeout=getattr(settings, "CRM_REPORT_CACHE_SECONDS", 7 * 86400),
+        )
+    return partial
+
+
+@shared_task
+def merge_report_partitions(
+    partials, cached_partials=(), log_file=None, job_lock=None
+):
+    """
+    Merge partial aggregates into one report and log it.
+
+    ``job_lock`` is the scheduler's lock on the report, released here.
+    """
+    from .joblog import record_job
+
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    log_file = log_file or "/tmp/crm_report_log.txt"
+
+    try:
+        with record_job("merge_report_partitions", log_file) as job:
+            partitions = sorted(
+                [*cached_partials, *partials], key=lambda p: p["start"]
+            )
+            total_customers = sum(p["customers"] for p in partitions)
+            total_orders = sum(p["orders"] for p in partitions)
+            total_revenue = sum(
+                (Decimal(p["revenue"]) for p in partitions), Decimal("0.00")
+            )
+            job.add_rows(len(partitions))
+            job.log(
+                f"{timestamp} - Report: {total_customers} customers, "
+                f"{total_orders} orders, {total_revenue} revenue"
+            )
+    finally:
+        if job_lock:
+            finish_scheduled_job(*job_lock)
+
+    print(
+        f"CRM Report generated: {total_customers} customers, {total_orders} orders, {total_revenue} revenue"
+    )
+    return {
+        "status": "success",
+        "customers": total_customers,
+        "orders": total_orders,
+        "revenue": str(total_revenue),
+        "partitions": partitions,
+    }
+
+
+def build_report_workflow(
+    start, end, partition_days=REPORT_PARTITION_DAYS, log_file=None, job_lock=None
+):
+    """
+    Build the Celery signature for a report over [start, end).
+
+    Closed partitions already in the cache are handed straight to the merge
+    step; only the remaining ones are aggregated, in parallel, by a chord.
+    If a partition fails the merge never runs, and ``job_lock`` is left to
+    expire.
+    """
+    cached_partials, header = [], []
+    versions = _report_versions()
+    for part_start, part_end in report_partitions(start, end, partition_days):
+        partial = cache.get(_partition_cache_key(part_start, part_end, versions))
+        if partial is not None:
+            cached_partials.append(partial)
+        else:
+            header.append(
+                aggregate_report_partition.s(
+                    part_start.isoformat(), part_end.isoformat()
+                )
+            )
+
+    merge = merge_report_partitions.s(
+        cached_partials=cached_partials, log_file=log_file, job_lock=job_lock
+    )
+    if not header:
+        return merge.clone(args=([],)), 0
+    return chord(header, merge), len(header)
 
 
 @shared_task
-def generate_crm_report():
+def generate_crm_report(
+    start=None, end=None, partition_days=REPORT_PARTITION_DAYS, job_lock=None
+):
     """
-    Generate a weekly CRM report summarizing:
+    Generate a CRM report summarizing:
     - Total number of customers
     - Total number of orders
     - Total revenue (sum of order amounts)
 
-    Logs the report to /tmp/crm_report_log.txt
+    The date range (ISO strings, defaulting to all history up to now) is split
+    into weekly partitions that are aggregated in parallel and merged exactly
+    in Decimal. Logs the report to /tmp/crm_report_log.txt
+
+    A scheduled run passes its ``job_lock`` on to the merge step, which
+    releases it.
     """
+    from .joblog import record_job
+    from .models import ArchivedOrder, Customer, Order
+
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_file = "/tmp/crm_report_log.txt"
 
-    try:
-        # GraphQL query to fetch report data
-        query_string = """
-            query {
-                allCustomers {
-                    edges {
-                        node {
-                            id
-                        }
-                    }
-                }
-                allOrders {
-                    edges {
-                        node {
-                            id
-                            totalAmount
-                        }
-                    }
-                }
+    with record_job("generate_crm_report", log_file) as job:
+        try:
+            end_dt = _parse_datetime(end) if end else timezone.now()
+            if start:
+                start_dt = _parse_datetime(start)
+            else:
+                earliest = [
+                    Order.objects.aggregate(first=Min("order_date"))["first"],
+                    ArchivedOrder.objects.aggregate(first=Min("order_date"))["first"],
+                    Customer.objects.aggregate(first=Min("created_at"))["first"],
+                ]
+                start_dt = min([d for d in earliest if d is not None], default=end_dt)
+
+            workflow, recomputed = build_report_workflow(
+                start_dt, end_dt, partition_days, log_file=log_file, job_lock=job_lock
+            )
+            job.add_rows(recomputed)
+            result = workflow.apply_async()
+            dispatched = {
+                "status": "dispatched",
+                "report_id": result.id,
+                "partitions": len(report_partitions(start_dt, end_dt, partition_days)),
+                "recomputed": recomputed,
             }
-        """
-
-        # Execute the query
-        transport = RequestsHTTPTransport(url="http://localhost:8000/graphql")
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-        query = gql(query_string)
-        result = client.execute(query)
-
-        # Extract data
-        customers = result.get("allCustomers", {}).get("edges", [])
-        orders = result.get("allOrders", {}).get("edges", [])
-
-        total_customers = len(customers)
-        total_orders = len(orders)
-
-        # Calculate total revenue
-        total_revenue = 0.0
-        for order_edge in orders:
-            order_node = order_edge.get("node", {})
-            total_amount = order_node.get("totalAmount", 0)
-            if total_amount:
-                try:
-                    total_revenue += float(total_amount)
-                except (ValueError, TypeError):
-                    pass
-
-        # Log the report
-        report_message = f"{timestamp} - Report: {total_customers} customers, {total_orders} orders, {total_revenue} revenue\n"
-
-        with open(log_file, "a") as f:
-            f.write(report_message)
-
-        print(
-            f"CRM Report generated: {total_customers} customers, {total_orders} orders, {total_revenue} revenue"
+            if job_lock:
+                dispatched["job_lock"] = "handed_off"
+            return dispatched
+
+        except Exception as e:
+            job.log(f"{timestamp} - Error generating report: {str(e)}")
+            job.fail(str(e))
+
+            print(f"Error generating CRM report: {str(e)}")
+            return {"status": "error", "error": str(e)}
+
+
+@shared_task
+def archive_old_orders():
+    """
+    Move orders past CRM_ORDER_ARCHIVE_DAYS into the order archive, drop job
+    runs past CRM_JOB_LOG["RETAIN_DAYS"] and trim the product change log.
+    """
+    from .archive import archive_orders
+    from .catalog import prune_product_changes
+    from .joblog import prune_job_runs, record_job
+
+    with record_job("archive_old_orders") as job:
+        archived = archive_orders()
+        job.add_rows(archived)
+    # After the run is recorded, so a short retention never deletes its row.
+    pruned = prune_job_runs()
+    return {
+        "status": "success",
+        "archived": archived,
+        "pruned_job_runs": pruned,
+        "pruned_product_changes": prune_product_changes(),
+    }
+
+
+@shared_task
+def refresh_order_snapshot(rebuild=False):
+    """
+    Extend the columnar order snapshot (or, with ``rebuild``, rewrite it).
+    """
+    from .joblog import record_job
+    from .snapshot import read_meta, refresh_snapshot
+
+    with record_job("refresh_order_snapshot") as job:
+        before = 0 if rebuild else ((read_meta() or {}).get("orders") or 0)
+        meta = refresh_snapshot(rebuild=rebuild)
+        job.add_rows(max(0, meta["orders"] - before))
+    return {"status": "success", "orders": meta["orders"], "links": meta["links"]}
+
+
+@shared_task
+def drain_low_stock_queue():
+    """
+    Restock every product waiting in the low-stock queue, batch by batch.
+    """
+    from .joblog import record_job
+    from .stock import drain_low_stock_queue as drain_batch
+
+    restocked = 0
+    with record_job("drain_low_stock_queue") as job:
+        while batch := drain_batch():
+            restocked += len(batch)
+        job.add_rows(restocked)
+    return {"status": "success", "restocked": restocked}
+
+
+def finish_scheduled_job(name, token):
+    """Release a scheduled job's lock, and run it again if a run was coalesced."""
+    from .scheduling import get_job, release_job_lock, time_limits
+
+    if release_job_lock(name, token):
+        run_scheduled_job.apply_async(
+            (name,), {"jittered": True}, **time_limits(get_job(name))
         )
-        return {
-            "status": "success",
-            "customers": total_customers,
-            "orders": total_orders,
-            "revenue": total_revenue,
-        }
 
-    except Exception as e:
-        error_message = f"{timestamp} - Error generating report: {str(e)}\n"
 
-        with open(log_file, "a") as f:
-            f.write(error_message)
+@shared_task
+def run_scheduled_job(name, jittered=False):
+    """
+    Run the job ``name`` of CRM_JOBS under its lock (see ``crm.scheduling``).
+
+    Sent by beat; the first delivery re-queues the run with a random
+    countdown of up to the job's JITTER seconds.
+    """
+    from django.utils.module_loading import import_string
+
+    from .scheduling import (
+        COALESCE,
+        acquire_job_lock,
+        get_job,
+        jitter_delay,
+        request_rerun,
+        time_limits,
+    )
+
+    job = get_job(name)
+    if not jittered and job["JITTER"]:
+        countdown = jitter_delay(job)
+        run_scheduled_job.apply_async(
+            (name,), {"jittered": True}, countdown=countdown, **time_limits(job)
+        )
+        return {"status": "deferred", "countdown": countdown}
 
-        print(f"Error generating CRM report: {str(e)}")
-        return {"status": "error", "error": str(e)}
+    token = acquire_job_lock(name, job["TIMEOUT"])
+    if token is None:
+        if job["OVERLAP"] == COALESCE and request_rerun(name):
+            return {"status": "coalesced"}
+        return {"status": "skipped"}
+
+    kwargs = dict(job["KWARGS"])
+    if job["HOLDS_LOCK"]:
+        kwargs["job_lock"] = [name, token]
+    try:
+        result = import_string(job["TASK"])(**kwargs)
+    except BaseException:
+        # Including SoftTimeLimitExceeded: the run is over either way.
+        finish_scheduled_job(name, token)
+        raise
+    if not (isinstance(result, dict) and result.get("job_lock") == "handed_off"):
+        finish_scheduled_job(name, token)
+    return {"status": "ran", "result": result}
@@ -1,7 +1,95 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from array import array
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest import skipIf, skipUnless
+from unittest.mock import Mock, patch
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from graphene.test import Client
 from alx_backend_graphql.schema import schema
-from crm.models import Customer, Product, Order
+from crm import analytics
+from crm.admission import ClientLimiter, Pool, Rejected, get_admission_controller
+from crm.health import CHECKS, LatencyRecorder, reset_checks
+from crm.archive import archive_orders
+from crm.catalog import catalog
+from crm.models import (
+    ArchivedOrder,
+    ArchivedOrderProduct,
+    Customer,
+    JobLock,
+    JobRun,
+    LowStockAlert,
+    Product,
+    ProductChange,
+    ProductDailySales,
+    Order,
+)
+from crm import cron, jobs
+from crm.benchmarks import import_time, load
+from crm.celery import app as celery_app
+from crm.counting import count_queryset, table_row_estimate
+from crm import encoding
+from crm.filters import (
+    CustomerFilter,
+    OrderFilter,
+    ProductFilter,
+    compiled_customer_filter,
+    compiled_order_filter,
+    compiled_product_filter,
+)
+from crm.pubsub import (
+    ORDER_CREATED,
+    PRODUCT_STOCK_CHANGED,
+    InMemoryBroker,
+    SQLiteLogBroker,
+    get_broker,
+)
+from crm.http_cache import analyze_operation
+from crm.importer import run_import
+from crm.ingest import get_order_queue, write_batch
+from crm.joblog import LogSink, prune_job_runs, record_job
+from crm.product_updates import update_products
+from crm.profiling import list_captures, make_profile_token
+from crm.routers import READ_YOUR_WRITES_HEADER, ReplicaRouter, use_primary
+from crm.scheduling import LOCK_GRACE, acquire_job_lock
+from crm.snapshot import column_path, refresh_snapshot
+from crm.sqlite import pragmas, read_transaction, write_transaction
+from crm.sales import rebuild_daily_sales, top_products, top_products_raw
+from crm.stock import (
+    InsufficientStock,
+    decrement_stock,
+    drain_low_stock_queue,
+    reconcile_low_stock,
+)
+from crm.tasks import (
+    aggregate_report_partition,
+    archive_old_orders,
+    build_report_workflow,
+    drain_low_stock_queue as drain_low_stock_task,
+    finish_scheduled_job,
+    generate_crm_report,
+    merge_report_partitions,
+    report_partitions,
+    run_scheduled_job,
+)
+from crm.versions import get_data_version
+from crm.websocket import PROTOCOL, GraphQLWebSocketApp
 from decimal import Decimal
 from django.utils import timezone
 
@@ -102,3 +190,2444 @@ class FilterTests(TestCase):
                 for node in nodes
             )
         )
+
+
+@override_settings(CRM_READ_REPLICAS=["replica"], CRM_READ_YOUR_WRITES_SECONDS=5)
+class ReadReplicaRoutingTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        # The two databases are kept apart so each read shows where it went.
+        Customer.objects.using("default").create(
+            name="Primary", email="primary@example.com"
+        )
+        Customer.objects.using("replica").create(
+            name="Replica", email="replica@example.com"
+        )
+
+    def post_graphql(self, query, **headers):
+        response = self.client.post(
+            "/graphql",
+            data=json.dumps({"query": query}),
+            content_type="application/json",
+            **headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def customer_names(self, **headers):
+        result = self.post_graphql(
+            "{ allCustomers { edges { node { name } } } }", **headers
+        )
+        edges = result["data"]["allCustomers"]["edges"]
+        return [edge["node"]["name"] for edge in edges]
+
+    def test_router_decisions(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Customer), "replica")
+        self.assertEqual(router.db_for_write(Customer), "default")
+        with use_primary():
+            self.assertEqual(router.db_for_read(Customer), "default")
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Customer), "default")
+
+    def test_queries_read_from_replica(self):
+        self.assertEqual(self.customer_names(), ["Replica"])
+
+    def test_mutation_pins_client_to_primary(self):
+        result = self.post_graphql(
+            'mutation { createCustomer(input: {name: "Carol", email: "carol@example.com"}) '
+            "{ customer { name } errors } }",
+            HTTP_X_API_KEY="client-a",
+        )
+        self.assertEqual(result["data"]["createCustomer"]["errors"], [])
+        self.assertTrue(Customer.objects.using("default").filter(name="Carol").exists())
+        self.assertFalse(Customer.objects.using("replica").filter(name="Carol").exists())
+
+        # The writer reads its own write; other clients stay on the replica.
+        self.assertEqual(
+            sorted(self.customer_names(HTTP_X_API_KEY="client-a")), ["Carol", "Primary"]
+        )
+        self.assertEqual(self.customer_names(HTTP_X_API_KEY="client-b"), ["Replica"])
+
+    def test_pin_travels_with_the_client(self):
+        mutation = (
+            'mutation { createCustomer(input: {name: "Carol", '
+            'email: "carol@example.com"}) { errors } }'
+        )
+        response = self.client.post(
+            "/graphql",
+            data=json.dumps({"query": mutation}),
+            content_type="application/json",
+            HTTP_X_API_KEY="client-a",
+        )
+        token = response[READ_YOUR_WRITES_HEADER]
+        # Nothing is kept by the worker that took the write.
+        self.client.cookies.clear()
+        cache.clear()
+
+        names = self.customer_names(
+            HTTP_X_API_KEY="client-a", HTTP_X_CRM_READ_YOUR_WRITES=token
+        )
+        self.assertEqual(sorted(names), ["Carol", "Primary"])
+        # The token only pins the client it was issued to.
+        names = self.customer_names(
+            HTTP_X_API_KEY="client-b", HTTP_X_CRM_READ_YOUR_WRITES=token
+        )
+        self.assertEqual(names, ["Replica"])
+
+    @override_settings(CRM_READ_REPLICAS=[])
+    def test_without_replicas_everything_uses_primary(self):
+        self.assertEqual(self.customer_names(), ["Primary"])
+
+
+@override_settings(CRM_READ_REPLICAS=[])
+class BatchedRequestTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    ORDERS_QUERY = "{ allOrders { edges { node { customer { name } } } } }"
+
+    def setUp(self):
+        cache.clear()
+        alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        for amount in ("10.00", "20.00", "30.00"):
+            Order.objects.create(customer=alice, total_amount=Decimal(amount))
+
+    def post_batch(self, operations):
+        operations = [{**operation, "id": i} for i, operation in enumerate(operations)]
+        return self.client.post(
+            "/graphql",
+            data=json.dumps(operations),
+            content_type="application/json",
+        )
+
+    def test_batch_returns_one_result_per_operation(self):
+        response = self.post_batch(
+            [
+                {"query": "{ allCustomers { edges { node { name } } } }"},
+                {
+                    "query": 'mutation { createCustomer(input: {name: "Bob", '
+                    'email: "bob@example.com"}) { customer { name } errors } }'
+                },
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual([result["id"] for result in results], [0, 1])
+        self.assertEqual(
+            results[0]["data"]["allCustomers"]["edges"], [{"node": {"name": "Alice"}}]
+        )
+        self.assertEqual(results[1]["data"]["createCustomer"]["errors"], [])
+
+    def test_single_operation_is_unchanged(self):
+        response = self.client.post(
+            "/graphql",
+            data=json.dumps({"query": "{ hello }"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.json(), {"data": {"hello": "Hello, GraphQL!"}})
+
+    def test_operations_share_the_batch_context(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_batch([{"query": self.ORDERS_QUERY}] * 2)
+        self.assertEqual(response.status_code, 200)
+        customer_queries = [
+            query for query in queries if 'FROM "crm_customer"' in query["sql"]
+        ]
+        # Alice is loaded once for all six orders across both operations.
+        self.assertEqual(len(customer_queries), 1)
+
+    @override_settings(CRM_GRAPHQL_MAX_BATCH_SIZE=2)
+    def test_oversized_batch_is_rejected(self):
+        response = self.post_batch([{"query": "{ hello }"}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("exceeds the limit of 2", response.json()["errors"][0]["message"])
+
+    @override_settings(CRM_GRAPHQL_BATCH_PARALLEL=True)
+    def test_parallel_read_only_batch_keeps_order(self):
+        response = self.post_batch(
+            [
+                {"query": "{ hello }"},
+                {"query": self.ORDERS_QUERY},
+                {"query": "{ hello }"},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual([result["id"] for result in results], [0, 1, 2])
+        self.assertEqual(len(results[1]["data"]["allOrders"]["edges"]), 3)
+
+
+class AdmissionControlTests(SimpleTestCase):
+    def test_pool_queues_then_rejects(self):
+        pool = Pool("query", size=1, queue=1, timeout=0.05)
+        pool.acquire()
+        self.assertEqual(pool.active, 1)
+
+        with self.assertRaises(Rejected) as caught:
+            pool.acquire()  # waits in the queue, then times out
+        self.assertIn("Timed out", str(caught.exception))
+
+        pool.waiting = pool.queue  # a full queue rejects straight away
+        with self.assertRaises(Rejected):
+            pool.acquire()
+        pool.waiting = 0
+        self.assertEqual(pool.rejected, {"queue_full": 1, "timeout": 1})
+
+        pool.release()
+        pool.acquire()
+        self.assertEqual(pool.admitted, 2)
+
+    def test_waiting_request_gets_released_slot(self):
+        pool = Pool("mutation", size=1, queue=1, timeout=5)
+        pool.acquire()
+        threading.Timer(0.05, pool.release).start()
+        pool.acquire()
+        self.assertEqual((pool.active, pool.waiting), (1, 0))
+
+    def test_token_bucket_per_client(self):
+        limiter = ClientLimiter(rate=10, burst=2)
+        self.assertEqual([limiter.take("a"), limiter.take("a")], [0, 0])
+        self.assertGreater(limiter.take("a"), 0)
+        self.assertEqual(limiter.take("b"), 0)
+
+
+@override_settings(
+    CRM_READ_REPLICAS=[],
+    CRM_ADMISSION={
+        "POOLS": {
+            "mutation": {"size": 1, "queue": 0, "timeout": 0.1},
+            "query": {"size": 2, "queue": 0, "timeout": 0.1},
+        },
+        "RATE": 0.5,
+        "BURST": 2,
+    },
+)
+class AdmissionEndpointTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        get_admission_controller.cache_clear()
+
+    def post_graphql(self, query, **headers):
+        return self.client.post(
+            "/graphql",
+            data=json.dumps({"query": query}),
+            content_type="application/json",
+            **headers,
+        )
+
+    def test_client_over_its_rate_gets_429(self):
+        for _ in range(2):
+            self.assertEqual(self.post_graphql("{ hello }").status_code, 200)
+        response = self.post_graphql("{ hello }")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "2")
+        self.assertEqual(
+            response.json(), {"errors": [{"message": "Rate limit exceeded"}]}
+        )
+        # Another API key has its own bucket.
+        response = self.post_graphql("{ hello }", HTTP_X_API_KEY="analyst")
+        self.assertEqual(response.status_code, 200)
+
+    def test_mutations_use_their_own_pool(self):
+        controller = get_admission_controller()
+        controller.pools["query"].active = 2  # every query slot is busy
+        try:
+            self.assertEqual(self.post_graphql("{ hello }").status_code, 429)
+            response = self.post_graphql(
+                'mutation { createProduct(input: {name: "Pen", price: 1.5}) '
+                "{ errors } }"
+            )
+            self.assertEqual(response.status_code, 200)
+        finally:
+            controller.pools["query"].active = 0
+
+        metrics = self.client.get("/metrics").content.decode()
+        self.assertIn('crm_admission_admitted_total{pool="mutation"} 1', metrics)
+        self.assertIn(
+            'crm_admission_rejected_total{pool="query",reason="queue_full"} 1', metrics
+        )
+        self.assertIn('crm_admission_queue_depth{pool="query"} 0', metrics)
+
+
+@override_settings(CRM_READ_REPLICAS=[])
+class HTTPCachingTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    CUSTOMERS = "{ allCustomers { edges { node { name } } } }"
+    PRODUCTS = "{ allProducts { edges { node { name } } } }"
+
+    def setUp(self):
+        cache.clear()
+        Customer.objects.create(name="Alice", email="alice@example.com")
+
+    def get_graphql(self, query, **extra):
+        return self.client.get("/graphql", {"query": query}, **extra)
+
+    def test_operation_models_come_from_the_selection(self):
+        self.assertEqual(
+            analyze_operation(
+                schema, "{ allOrders { edges { node { id customer { name } } } } }"
+            ),
+            (Customer, Order),
+        )
+        self.assertEqual(
+            analyze_operation(
+                schema,
+                'query { salesByDay(productId: "1", from: "2026-01-01", '
+                'to: "2026-01-31") { day units } }',
+            ),
+            (ProductDailySales,),
+        )
+        self.assertIsNone(analyze_operation(schema, "mutation { __typename }"))
+
+    def test_matching_etag_returns_304_without_executing(self):
+        response = self.get_graphql(self.CUSTOMERS)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        etag = response["ETag"]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_graphql(self.CUSTOMERS, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        # Only the data versions are read.
+        self.assertEqual(len(queries), 1)
+        self.assertIn("crm_dataversion", queries[0]["sql"])
+
+    def test_etag_follows_data_versions_of_touched_models(self):
+        customers_etag = self.get_graphql(self.CUSTOMERS)["ETag"]
+        products_etag = self.get_graphql(self.PRODUCTS)["ETag"]
+
+        Customer.objects.create(name="Bob", email="bob@example.com")
+
+        response = self.get_graphql(self.CUSTOMERS, HTTP_IF_NONE_MATCH=customers_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], customers_etag)
+        response = self.get_graphql(self.PRODUCTS, HTTP_IF_NONE_MATCH=products_etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_follows_writes_made_outside_django(self):
+        customer = Customer.objects.create(name="Bob", email="bob@example.com")
+        etag = self.get_graphql(self.CUSTOMERS)["ETag"]
+
+        # As another process or program sharing the database would write.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE crm_customer SET name = %s WHERE id = %s",
+                ["Robert", customer.pk],
+            )
+
+        response = self.get_graphql(self.CUSTOMERS, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_cache_control_per_operation(self):
+        response = self.client.get(
+            "/graphql",
+            {
+                "query": "query TopProducts { topProducts(from: \"2026-01-01\", "
+                'to: "2026-01-31") { units } }',
+                "operationName": "TopProducts",
+            },
+        )
+        self.assertEqual(response["Cache-Control"], "public, max-age=300")
+
+    def test_posted_queries_are_not_cached(self):
+        response = self.client.post(
+            "/graphql",
+            data=json.dumps({"query": self.CUSTOMERS}),
+            content_type="application/json",
+        )
+        self.assertFalse(response.has_header("ETag"))
+
+    @override_settings(CRM_GRAPHQL_COMPRESS_MIN_BYTES=200)
+    def test_large_responses_are_compressed(self):
+        Customer.objects.bulk_create(
+            Customer(name=f"Customer {i}", email=f"c{i}@example.com")
+            for i in range(20)
+        )
+        response = self.get_graphql(self.CUSTOMERS, HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        body = json.loads(gzip.decompress(response.content))
+        self.assertEqual(len(body["data"]["allCustomers"]["edges"]), 21)
+
+        small = self.get_graphql("{ hello }", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(small.has_header("Content-Encoding"))
+
+
+@override_settings(
+    CRM_READ_REPLICAS=[],
+    CRM_GRAPHQL_ENCODER={"STREAM_MIN_ITEMS": 5, "STREAM_CHUNK_ITEMS": 2},
+)
+class ResponseEncodingTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    ORDERS = (
+        "{ allOrders(first: 100) { edges { node { id totalAmount orderDate "
+        "customer { name createdAt } } } } }"
+    )
+
+    def setUp(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        Order.objects.bulk_create(
+            Order(customer=customer, total_amount=Decimal(f"{n}.05"))
+            for n in range(8)
+        )
+
+    def post_graphql(self, query, **extra):
+        return self.client.post(
+            "/graphql",
+            data=json.dumps({"query": query}),
+            content_type="application/json",
+            **extra,
+        )
+
+    def encoders(self):
+        yield encoding.JSONEncoder()
+        if encoding.orjson is not None:
+            yield encoding.OrjsonEncoder()
+
+    def test_streamed_encoding_matches_the_whole_encoding(self):
+        data = {
+            "data": {
+                "allOrders": {
+                    "edges": [
+                        {"node": {"id": str(n), "é": n / 3}} for n in range(7)
+                    ],
+                    "pageInfo": {"hasNextPage": False},
+                },
+                "hello": "Hello",
+            }
+        }
+        config = {"STREAM_MIN_ITEMS": 5, "STREAM_CHUNK_ITEMS": 3}
+        self.assertTrue(encoding.should_stream(data, config))
+        self.assertFalse(encoding.should_stream(data, {"STREAM_MIN_ITEMS": 8}))
+        for encoder in self.encoders():
+            with self.subTest(encoder=encoder.name):
+                streamed = b"".join(encoding.iter_encode(data, encoder, config))
+                self.assertEqual(streamed, encoder.dumps(data))
+                self.assertEqual(json.loads(streamed), data)
+
+    def test_fast_paths_serialize_like_graphene(self):
+        import graphene
+
+        from alx_backend_graphql.schema import Mutation, Query
+
+        plain = graphene.Schema(query=Query, mutation=Mutation)
+        Product.objects.create(name="Laptop", price=Decimal("999.90"), stock=3)
+        context = self.client.get("/").wsgi_request
+        for query in (
+            self.ORDERS,
+            "{ allProducts { edges { node { price stock } } } }",
+            "{ allCustomers { edges { node { createdAt } } } }",
+        ):
+            fast = schema.execute(query, context_value=context)
+            self.assertIsNone(fast.errors)
+            expected = plain.execute(query, context_value=context)
+            self.assertEqual(fast.data, expected.data)
+        type_map = schema.graphql_schema.type_map
+        self.assertIs(type_map["Decimal"].serialize, encoding.serialize_decimal)
+        # Only the Decimal and DateTime fields get the pre-bound resolvers.
+        fields = type_map["OrderNode"].fields
+        self.assertFalse(hasattr(fields["totalAmount"].resolve, "func"))
+        self.assertTrue(hasattr(fields["provisionalId"].resolve, "func"))
+
+    def test_large_results_are_streamed(self):
+        response = self.post_graphql(self.ORDERS)
+        self.assertTrue(response.streaming)
+        body = json.loads(b"".join(response.streaming_content))
+        edges = body["data"]["allOrders"]["edges"]
+        self.assertEqual(len(edges), 8)
+        self.assertEqual(edges[0]["node"]["totalAmount"], "0.05")
+
+        small = self.post_graphql("{ allOrders(first: 2) { edges { node { id } } } }")
+        self.assertFalse(small.streaming)
+
+    def test_streamed_results_are_gzipped(self):
+        response = self.post_graphql(self.ORDERS, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        body = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(len(json.loads(body)["data"]["allOrders"]["edges"]), 8)
+
+    def test_backend_setting(self):
+        for backend, expected in (
+            ("json", encoding.JSONEncoder),
+            ("crm.encoding.JSONEncoder", encoding.JSONEncoder),
+        ):
+            with self.settings(CRM_GRAPHQL_ENCODER={"BACKEND": backend}):
+                self.assertIsInstance(encoding.get_encoder(), expected)
+        self.assertEqual(
+            encoding.get_encoder().name,
+            "json" if encoding.orjson is None else "orjson",
+        )
+
+
+@override_settings(CRM_READ_REPLICAS=[])
+class ProfilingTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    ORDERS = "{ allOrders { edges { node { id customer { name } } } } }"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = override_settings(
+            CRM_PROFILING={"DIR": self.tmp.name, "MAX_CAPTURES": 2}
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        Order.objects.create(customer=alice, total_amount=Decimal("10.00"))
+
+    def post_graphql(self, query, **headers):
+        return self.client.post(
+            "/graphql",
+            data=json.dumps({"query": query}),
+            content_type="application/json",
+            **headers,
+        )
+
+    def test_untriggered_requests_are_not_captured(self):
+        response = self.post_graphql(self.ORDERS)
+        self.assertFalse(response.has_header("X-CRM-Profile-Id"))
+        response = self.post_graphql(self.ORDERS, HTTP_X_CRM_PROFILE="forged:token")
+        self.assertFalse(response.has_header("X-CRM-Profile-Id"))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_signed_header_captures_profile_and_sql(self):
+        response = self.post_graphql(
+            self.ORDERS, HTTP_X_CRM_PROFILE=make_profile_token()
+        )
+        capture_id = response["X-CRM-Profile-Id"]
+
+        # The store is for staff only.
+        listing = self.client.get("/admin/crm/profiles/")
+        self.assertEqual(listing.status_code, 302)
+
+        User.objects.create_user("admin", password="pw", is_staff=True)
+        self.client.login(username="admin", password="pw")
+        captures = self.client.get("/admin/crm/profiles/").json()["captures"]
+        self.assertEqual([c["id"] for c in captures], [capture_id])
+        self.assertEqual(captures[0]["trigger"], "header")
+        self.assertGreaterEqual(captures[0]["sql_count"], 2)
+        self.assertIn("allOrders", captures[0]["query"])
+
+        report = self.client.get(f"/admin/crm/profiles/{capture_id}.json")
+        data = json.loads(b"".join(report.streaming_content))
+        self.assertTrue(any("crm_order" in q["sql"] for q in data["sql"]))
+        self.assertIn("function calls", data["profile"])
+
+        dump = self.client.get(f"/admin/crm/profiles/{capture_id}.prof")
+        self.assertEqual(dump.status_code, 200)
+        missing = self.client.get("/admin/crm/profiles/..%2Fsecret.json")
+        self.assertEqual(missing.status_code, 404)
+
+    def test_sampling_keeps_a_bounded_store(self):
+        config = {"DIR": self.tmp.name, "MAX_CAPTURES": 2, "SAMPLE_RATE": 1.0}
+        with self.settings(CRM_PROFILING=config):
+            ids = [
+                self.post_graphql("{ hello }")["X-CRM-Profile-Id"] for _ in range(3)
+            ]
+        self.assertEqual(
+            [capture["id"] for capture in list_captures(config)], ids[:0:-1]
+        )
+        self.assertEqual(len(os.listdir(self.tmp.name)), 4)
+
+
+class PartitionedReportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self._celery_conf = {
+            key: celery_app.conf[key]
+            for key in (
+                "task_always_eager",
+                "CELERY_BROKER_URL",
+                "CELERY_RESULT_BACKEND",
+            )
+        }
+        # The broker and backend come from Django settings, under their prefix.
+        celery_app.conf.update(
+            task_always_eager=True,
+            CELERY_BROKER_URL="memory://",
+            CELERY_RESULT_BACKEND="cache+memory://",
+        )
+        self.log_file = tempfile.NamedTemporaryFile(suffix=".txt", delete=False).name
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir, ignore_errors=True)
+        overrides = override_settings(CRM_ORDER_SNAPSHOT={"DIR": snapshot_dir})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.now = timezone.now()
+        amounts = ((3, "0.10"), (2, "0.20"), (2, "1000.05"), (0, "5.00"))
+        for weeks_ago, amount in amounts:
+            Order.objects.create(
+                customer=customer,
+                total_amount=Decimal(amount),
+                order_date=self.now - timedelta(weeks=weeks_ago),
+            )
+
+    def tearDown(self):
+        celery_app.conf.update(self._celery_conf)
+        os.unlink(self.log_file)
+
+    def run_report(self, start, end):
+        workflow, recomputed = build_report_workflow(
+            start, end, log_file=self.log_file
+        )
+        return workflow.apply_async().get(), recomputed
+
+    def test_partitions_align_on_weeks(self):
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)  # a Wednesday
+        end = datetime(2025, 1, 20, 12, tzinfo=dt_timezone.utc)
+        partitions = report_partitions(start, end)
+        self.assertEqual(
+            [(s.day, e.day) for s, e in partitions],
+            [(1, 6), (6, 13), (13, 20), (20, 20)],
+        )
+        self.assertEqual(partitions[0][0], start)
+        self.assertEqual(partitions[-1][1], end)
+
+    def test_merges_partials_exactly(self):
+        report, recomputed = self.run_report(
+            self.now - timedelta(weeks=4), self.now + timedelta(minutes=1)
+        )
+        self.assertEqual(report["orders"], 4)
+        self.assertEqual(report["customers"], 1)
+        self.assertEqual(report["revenue"], "1005.35")
+        self.assertEqual(recomputed, len(report["partitions"]))
+        with open(self.log_file) as f:
+            self.assertIn("1 customers, 4 orders, 1005.35 revenue", f.read())
+
+    def test_rerun_only_recomputes_open_partition(self):
+        start = self.now - timedelta(weeks=4)
+        end = self.now + timedelta(minutes=1)
+        first, _ = self.run_report(start, end)
+
+        second, recomputed = self.run_report(start, end)
+        self.assertEqual(recomputed, 1)
+        self.assertEqual(second["revenue"], first["revenue"])
+
+    def test_writes_to_closed_partitions_are_picked_up(self):
+        start = self.now - timedelta(weeks=4)
+        end = self.now + timedelta(minutes=1)
+        first, _ = self.run_report(start, end)
+
+        # A backdated order, as an import or another process would write.
+        Order.objects.bulk_create(
+            [
+                Order(
+                    customer=Customer.objects.get(),
+                    total_amount=Decimal("100.00"),
+                    order_date=self.now - timedelta(weeks=3),
+                )
+            ]
+        )
+        second, recomputed = self.run_report(start, end)
+        self.assertEqual(recomputed, len(second["partitions"]))
+        self.assertEqual(second["orders"], 5)
+        self.assertEqual(second["revenue"], "1105.35")
+
+        # An edit, which the order snapshot cannot append.
+        Order.objects.filter(total_amount=Decimal("100.00")).update(
+            total_amount=Decimal("200.00")
+        )
+        third, _ = self.run_report(start, end)
+        self.assertEqual(third["revenue"], "1205.35")
+
+    def test_generate_crm_report_dispatches_chord(self):
+        with patch("crm.tasks.merge_report_partitions.run") as merge:
+            merge.return_value = {}
+            result = generate_crm_report.delay(
+                start=(self.now - timedelta(weeks=4)).isoformat()
+            ).get()
+        self.assertEqual(result["status"], "dispatched")
+        self.assertEqual(result["recomputed"], result["partitions"])
+        partials = merge.call_args.args[0]
+        self.assertEqual(sum(p["orders"] for p in partials), 4)
+
+
+class CompiledFilterParityTests(TestCase):
+    """The compiled filters must select the same rows as the FilterSets."""
+
+    def setUp(self):
+        alice = Customer.objects.create(
+            name="Alice", email="alice@example.com", phone="+1234567890"
+        )
+        bob = Customer.objects.create(
+            name="Bob", email="bob@example.com", phone="123-456-7890"
+        )
+        Customer.objects.filter(pk=bob.pk).update(
+            created_at=timezone.make_aware(datetime(2024, 6, 1))
+        )
+        laptop = Product.objects.create(
+            name="Laptop", price=Decimal("999.99"), stock=10
+        )
+        tablet = Product.objects.create(
+            name="Tablet", price=Decimal("299.50"), stock=3
+        )
+        phone = Product.objects.create(name="Phone", price=Decimal("499.99"), stock=0)
+
+        first = Order.objects.create(customer=alice, total_amount=Decimal("1299.49"))
+        first.products.set([laptop, tablet])
+        second = Order.objects.create(
+            customer=bob,
+            total_amount=Decimal("499.99"),
+            order_date=timezone.make_aware(datetime(2024, 7, 1)),
+        )
+        second.products.set([phone])
+
+    def assertParity(self, filterset_class, compiled, model, cases):
+        for data in cases:
+            with self.subTest(data=data):
+                expected = filterset_class(data=data, queryset=model.objects.all())
+                expected_pks = set(expected.qs.values_list("pk", flat=True))
+                actual = compiled.filter(model.objects.all(), data)
+                actual_pks = list(actual.values_list("pk", flat=True))
+                self.assertEqual(len(actual_pks), len(set(actual_pks)))
+                self.assertEqual(sorted(actual_pks), sorted(expected_pks))
+
+    def test_customer_filters(self):
+        self.assertParity(
+            CustomerFilter,
+            compiled_customer_filter,
+            Customer,
+            [
+                {},
+                {"nameIcontains": "ali"},
+                {"nameIcontains": "  "},
+                {"emailIcontains": "EXAMPLE", "phonePattern": "+1"},
+                {"createdAtGte": "2025-01-01"},
+                {"createdAtLte": "2024-12-31T23:59:59Z"},
+                {"createdAtGte": "not a date", "nameIcontains": "b"},
+                {"nameIcontains": None},
+            ],
+        )
+
+    def test_product_filters(self):
+        self.assertParity(
+            ProductFilter,
+            compiled_product_filter,
+            Product,
+            [
+                {"priceGte": 100, "priceLte": 1000.0},
+                {"priceGte": 299.5},
+                {"stockGte": 1, "stockLte": 3},
+                {"stockLte": 0, "nameIcontains": "o"},
+            ],
+        )
+
+    def test_order_filters(self):
+        phone_pk = Product.objects.get(name="Phone").pk
+        tablet_pk = Product.objects.get(name="Tablet").pk
+        self.assertParity(
+            OrderFilter,
+            compiled_order_filter,
+            Order,
+            [
+                {"totalAmountGte": 500},
+                {"totalAmountLte": 499.99, "orderDateLte": "2024-12-31"},
+                {"orderDateGte": "2025-01-01T00:00:00+00:00"},
+                {"customerName": "ali", "productName": "a"},
+                {"productName": "t"},
+                {"productId": str(phone_pk)},
+                {"productId": "abc"},
+                {"productName": "lap", "productId": str(tablet_pk)},
+            ],
+        )
+
+    def test_many_to_many_filter_uses_exists(self):
+        qs = compiled_order_filter.filter(Order.objects.all(), {"productName": "t"})
+        sql = str(qs.query).upper()
+        self.assertIn("EXISTS", sql)
+        self.assertNotIn("DISTINCT", sql)
+        self.assertEqual(qs.count(), 1)
+
+
+class TotalCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client(schema)
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        for amount in (10, 20, 30, 40, 50):
+            Order.objects.create(customer=customer, total_amount=Decimal(amount))
+
+    def query_orders(self, arguments, selection):
+        executed = self.client.execute(
+            f"{{ allOrders({arguments}) {{ {selection} }} }}"
+        )
+        self.assertNotIn("errors", executed)
+        return executed["data"]["allOrders"]
+
+    def test_count_is_skipped_unless_selected(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = self.query_orders(
+                "first: 2", "edges { node { id } } pageInfo { hasNextPage }"
+            )
+        self.assertEqual(len(result["edges"]), 2)
+        self.assertTrue(result["pageInfo"]["hasNextPage"])
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries.captured_queries))
+
+    def test_exact_count(self):
+        result = self.query_orders(
+            "first: 2, filter: {totalAmountGte: 25}, countMode: EXACT",
+            "totalCount isEstimate edges { node { id } }",
+        )
+        self.assertEqual(result["totalCount"], 3)
+        self.assertFalse(result["isEstimate"])
+        self.assertEqual(len(result["edges"]), 2)
+
+    def test_cached_count_invalidated_by_writes(self):
+        arguments = "filter: {totalAmountGte: 25}, countMode: CACHED"
+        self.assertEqual(self.query_orders(arguments, "totalCount")["totalCount"], 3)
+        with CaptureQueriesContext(connection) as queries:
+            self.query_orders(arguments, "totalCount")
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries.captured_queries))
+
+        Order.objects.create(
+            customer=Customer.objects.get(), total_amount=Decimal("99.00")
+        )
+        self.assertEqual(self.query_orders(arguments, "totalCount")["totalCount"], 4)
+
+    @override_settings(CRM_COUNT_SAMPLE_SIZE=2)
+    def test_estimated_count(self):
+        result = self.query_orders("countMode: ESTIMATED", "totalCount isEstimate")
+        self.assertEqual(result["totalCount"], 5)
+        self.assertTrue(result["isEstimate"])
+
+        filtered = Order.objects.filter(total_amount__lte=20)
+        count, is_estimate = count_queryset(filtered, "estimated")
+        self.assertTrue(is_estimate)
+        # The sample is spread over the table (orders 20 and 40), so the
+        # oldest orders are not missed: half of it matches.
+        self.assertEqual(count, 2)
+
+    def test_pagination_after_cursor(self):
+        first_page = self.query_orders(
+            "first: 3", "edges { cursor } pageInfo { hasNextPage endCursor }"
+        )
+        cursor = first_page["pageInfo"]["endCursor"]
+        second_page = self.query_orders(
+            f'first: 3, after: "{cursor}"',
+            "edges { node { totalAmount } } pageInfo { hasNextPage hasPreviousPage }",
+        )
+        self.assertEqual(len(second_page["edges"]), 2)
+        self.assertFalse(second_page["pageInfo"]["hasNextPage"])
+
+
+class WebSocketSession:
+    """Drive an ASGI WebSocket application from a test."""
+
+    def __init__(self, app, path="/graphql"):
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        scope = {"type": "websocket", "path": path, "subprotocols": [PROTOCOL]}
+        self.task = asyncio.create_task(app(scope, self.inbox.get, self.outbox.put))
+
+    async def send_json(self, data):
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive(self):
+        return await asyncio.wait_for(self.outbox.get(), timeout=2)
+
+    async def receive_json(self):
+        return json.loads((await self.receive())["text"])
+
+    async def connect(self):
+        await self.inbox.put({"type": "websocket.connect"})
+        accepted = await self.receive()
+        await self.send_json({"type": "connection_init"})
+        return accepted, await self.receive_json()
+
+    async def disconnect(self):
+        await self.inbox.put({"type": "websocket.disconnect"})
+        await asyncio.wait_for(self.task, timeout=2)
+
+
+class SubscriptionTests(TestCase):
+    def setUp(self):
+        get_broker.cache_clear()
+        self.app = GraphQLWebSocketApp(None, schema)
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.product = Product.objects.create(
+            name="Laptop", price=Decimal("999.99"), stock=10
+        )
+
+    def tearDown(self):
+        get_broker.cache_clear()
+
+    async def wait_for_subscriber(self, channel):
+        for _ in range(100):
+            if get_broker().subscriber_count(channel):
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"No subscriber on {channel}")
+
+    def create_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            executed = Client(schema).execute(
+                "mutation ($input: OrderInput!) "
+                "{ createOrder(input: $input) { errors } }",
+                variables={
+                    "input": {
+                        "customerId": str(self.customer.pk),
+                        "productIds": [str(self.product.pk)],
+                    }
+                },
+            )
+        self.assertEqual(executed["data"]["createOrder"]["errors"], [])
+
+    def restock(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.refresh_from_db()
+            self.product.stock += 5
+            self.product.save()
+
+    async def test_order_created_subscription(self):
+        session = WebSocketSession(self.app)
+        accepted, ack = await session.connect()
+        self.assertEqual(accepted["subprotocol"], PROTOCOL)
+        self.assertEqual(ack["type"], "connection_ack")
+
+        await session.send_json(
+            {
+                "id": "1",
+                "type": "subscribe",
+                "payload": {
+                    "query": "subscription { orderCreated "
+                    "{ orderId customerId productIds totalAmount } }"
+                },
+            }
+        )
+        await self.wait_for_subscriber(ORDER_CREATED)
+        await sync_to_async(self.create_order)()
+
+        message = await session.receive_json()
+        self.assertEqual(message["type"], "next")
+        event = message["payload"]["data"]["orderCreated"]
+        self.assertEqual(event["customerId"], str(self.customer.pk))
+        self.assertEqual(event["productIds"], [str(self.product.pk)])
+        self.assertEqual(event["totalAmount"], "999.99")
+
+        await session.send_json({"id": "1", "type": "complete"})
+        await session.disconnect()
+        self.assertEqual(get_broker().subscriber_count(ORDER_CREATED), 0)
+
+    async def test_product_stock_changed_subscription(self):
+        session = WebSocketSession(self.app)
+        await session.connect()
+        await session.send_json(
+            {
+                "id": "stock",
+                "type": "subscribe",
+                "payload": {
+                    "query": "subscription ($id: ID) "
+                    "{ productStockChanged(productId: $id) { name oldStock newStock } }",
+                    "variables": {"id": str(self.product.pk)},
+                },
+            }
+        )
+        await self.wait_for_subscriber(PRODUCT_STOCK_CHANGED)
+        await sync_to_async(self.restock)()
+
+        message = await session.receive_json()
+        self.assertEqual(
+            message["payload"]["data"]["productStockChanged"],
+            {"name": "Laptop", "oldStock": 10, "newStock": 15},
+        )
+        await session.disconnect()
+
+    async def test_rejects_subscribe_before_init(self):
+        session = WebSocketSession(self.app)
+        await session.inbox.put({"type": "websocket.connect"})
+        await session.receive()
+        await session.send_json(
+            {
+                "id": "1",
+                "type": "subscribe",
+                "payload": {"query": "subscription { orderCreated { orderId } }"},
+            }
+        )
+        closed = await session.receive()
+        self.assertEqual(closed["code"], 4401)
+
+    async def test_slow_subscriber_queue_drops_oldest(self):
+        broker = InMemoryBroker(queue_size=2)
+        async with broker.subscribe("events") as subscription:
+            for number in range(5):
+                broker.publish("events", number)
+            await asyncio.sleep(0)
+            self.assertEqual(subscription.dropped, 3)
+            self.assertEqual([await anext(subscription) for _ in range(2)], [3, 4])
+
+    async def test_sqlite_log_broker_fans_out_between_nodes(self):
+        path = os.path.join(tempfile.mkdtemp(), "events.sqlite3")
+        publisher = SQLiteLogBroker(path, poll_interval=0.01)
+        subscriber = SQLiteLogBroker(path, poll_interval=0.01)
+        try:
+            async with subscriber.subscribe("events") as subscription:
+                await asyncio.sleep(0.05)
+                publisher.publish("events", {"order_id": 1})
+                event = await asyncio.wait_for(anext(subscription), timeout=2)
+            self.assertEqual(event, {"order_id": 1})
+        finally:
+            subscriber.stop()
+
+
+class LowStockQueueTests(TestCase):
+    def setUp(self):
+        self.client = Client(schema)
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(
+            name="Laptop", price=Decimal("999.99"), stock=10
+        )
+        self.phone = Product.objects.create(
+            name="Phone", price=Decimal("499.99"), stock=50
+        )
+
+    def create_order(self, *products):
+        executed = self.client.execute(
+            "mutation ($input: OrderInput!) "
+            "{ createOrder(input: $input) { order { id } errors } }",
+            variables={
+                "input": {
+                    "customerId": str(self.customer.pk),
+                    "productIds": [str(p.pk) for p in products],
+                }
+            },
+        )
+        return executed["data"]["createOrder"]
+
+    def test_order_crossing_threshold_queues_product(self):
+        self.assertEqual(self.create_order(self.laptop, self.phone)["errors"], [])
+        self.laptop.refresh_from_db()
+        self.phone.refresh_from_db()
+        self.assertEqual((self.laptop.stock, self.phone.stock), (9, 49))
+
+        pending = LowStockAlert.objects.filter(processed_at__isnull=True)
+        self.assertEqual(
+            list(pending.values_list("product_id", "stock")), [(self.laptop.pk, 9)]
+        )
+
+        # Further drops do not queue the product twice.
+        self.create_order(self.laptop)
+        self.assertEqual(pending.count(), 1)
+
+    def test_insufficient_stock_rejects_order(self):
+        Product.objects.filter(pk=self.laptop.pk).update(stock=0)
+        result = self.create_order(self.laptop, self.phone)
+        self.assertIsNone(result["order"])
+        self.assertEqual(result["errors"], ["Insufficient stock: Laptop"])
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 50)
+        self.assertFalse(Order.objects.exists())
+
+    def test_decrement_rechecks_stock_in_the_update(self):
+        products = [self.laptop.pk, self.phone.pk]
+        read = list(
+            Product.objects.filter(pk__in=products).values_list("pk", "name", "stock")
+        )
+        # Another writer takes the last laptops after the rows were read.
+        Product.objects.filter(pk=self.laptop.pk).update(stock=0)
+
+        with patch.object(Product.objects, "select_for_update") as select_for_update:
+            select_for_update().filter().values_list.return_value = read
+            with transaction.atomic():
+                with self.assertRaises(InsufficientStock) as raised:
+                    decrement_stock(products)
+        self.assertEqual(raised.exception.product_ids, [self.laptop.pk])
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 50)
+
+    def test_drain_restocks_in_batches(self):
+        products = [
+            Product.objects.create(name=f"Cable {i}", price=Decimal("5.00"), stock=i)
+            for i in range(3)
+        ]
+        self.assertEqual(LowStockAlert.objects.count(), 3)
+
+        with self.assertNumQueries(6):
+            restocked = drain_low_stock_queue(batch_size=2, restock_amount=10)
+        self.assertEqual([stock for _, _, stock in restocked], [10, 11])
+        remaining = drain_low_stock_queue(batch_size=2, restock_amount=10)
+        self.assertEqual(len(remaining), 1)
+        self.assertEqual(drain_low_stock_queue(), [])
+        self.assertEqual(
+            [p.stock for p in Product.objects.filter(pk__in=[p.pk for p in products])],
+            [10, 11, 12],
+        )
+
+    def test_reconcile_picks_up_missed_products(self):
+        # QuerySet.update() bypasses the event path entirely.
+        Product.objects.filter(pk=self.phone.pk).update(stock=2)
+        self.assertFalse(LowStockAlert.objects.exists())
+
+        self.assertEqual(reconcile_low_stock(), 1)
+        reconcile_low_stock()
+        self.assertEqual(
+            LowStockAlert.objects.filter(processed_at__isnull=True).count(), 1
+        )
+
+
+class SalesRollupTests(TestCase):
+    TOP_PRODUCTS = (
+        "query ($from: Date!, $to: Date!) { topProducts(from: $from, to: $to, limit: 5) "
+        "{ product { name } units revenue } }"
+    )
+
+    def setUp(self):
+        self.client = Client(schema)
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(
+            name="Laptop", price=Decimal("999.99"), stock=50
+        )
+        self.phone = Product.objects.create(
+            name="Phone", price=Decimal("499.99"), stock=50
+        )
+        self.today = timezone.localdate()
+
+    def create_order(self, *products):
+        executed = self.client.execute(
+            "mutation ($input: OrderInput!) "
+            "{ createOrder(input: $input) { order { id } errors } }",
+            variables={
+                "input": {
+                    "customerId": str(self.customer.pk),
+                    "productIds": [str(p.pk) for p in products],
+                }
+            },
+        )
+        self.assertEqual(executed["data"]["createOrder"]["errors"], [])
+
+    def top_products(self, start, end):
+        executed = self.client.execute(
+            self.TOP_PRODUCTS,
+            variables={"from": start.isoformat(), "to": end.isoformat()},
+        )
+        return executed["data"]["topProducts"]
+
+    def test_orders_update_rollup_incrementally(self):
+        self.create_order(self.laptop, self.phone)
+        self.create_order(self.phone)
+        self.create_order(self.phone)
+
+        self.assertEqual(
+            self.top_products(self.today, self.today),
+            [
+                {"product": {"name": "Phone"}, "units": 3, "revenue": "1499.97"},
+                {"product": {"name": "Laptop"}, "units": 1, "revenue": "999.99"},
+            ],
+        )
+        self.assertEqual(
+            [
+                (r["product_id"], r["units"], r["revenue"])
+                for r in top_products(self.today, self.today)
+            ],
+            [
+                (r["product_id"], r["units"], r["revenue"])
+                for r in top_products_raw(self.today, self.today)
+            ],
+        )
+
+    def test_sales_by_day_and_date_range(self):
+        old = Order.objects.create(
+            customer=self.customer,
+            total_amount=Decimal("999.99"),
+            order_date=timezone.now() - timedelta(days=3),
+        )
+        old.products.set([self.laptop])
+        self.create_order(self.laptop)
+        # Orders written behind the mutation's back only show up after a rebuild.
+        three_days_ago = self.today - timedelta(days=3)
+        self.assertEqual(self.top_products(three_days_ago, three_days_ago), [])
+        self.assertEqual(rebuild_daily_sales(), 2)
+
+        executed = self.client.execute(
+            "query ($id: ID!, $from: Date!, $to: Date!) "
+            "{ salesByDay(productId: $id, from: $from, to: $to) { day units revenue } }",
+            variables={
+                "id": str(self.laptop.pk),
+                "from": (self.today - timedelta(days=7)).isoformat(),
+                "to": self.today.isoformat(),
+            },
+        )
+        self.assertEqual(
+            executed["data"]["salesByDay"],
+            [
+                {"day": three_days_ago.isoformat(), "units": 1, "revenue": "999.99"},
+                {"day": self.today.isoformat(), "units": 1, "revenue": "999.99"},
+            ],
+        )
+        self.assertEqual(self.top_products(self.today, self.today)[0]["units"], 1)
+
+    def test_analytics_read_only_the_rollup(self):
+        self.create_order(self.laptop, self.phone)
+        with CaptureQueriesContext(connection) as queries:
+            self.top_products(self.today, self.today)
+        self.assertFalse(
+            any("crm_order" in query["sql"] for query in queries.captured_queries)
+        )
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def read_rejects(self, path):
+        with open(f"{path}.rejects.ndjson") as f:
+            return [json.loads(line) for line in f]
+
+    def test_customers_csv_applies_mutation_rules(self):
+        Customer.objects.create(name="Alice", email="alice@example.com")
+        path = self.write(
+            "customers.csv",
+            "name,email,phone\n"
+            "Bob,bob@example.com,+1234567890\n"
+            "Alice again,alice@example.com,\n"
+            "Carol,carol@example.com,not-a-phone\n"
+            '"Dunn, Dave",dave@example.com,123-456-7890\n'
+            "Bob twin,bob@example.com,\n",
+        )
+        stats = run_import("customers", path, batch_size=2)
+
+        self.assertEqual(
+            (stats["rows"], stats["imported"], stats["rejected"]), (5, 2, 3)
+        )
+        self.assertEqual(
+            sorted(Customer.objects.values_list("name", flat=True)),
+            ["Alice", "Bob", "Dunn, Dave"],
+        )
+        self.assertEqual(
+            [reject["errors"] for reject in self.read_rejects(path)],
+            [
+                ["Email already exists"],
+                ["Invalid phone format"],
+                ["Email already exists"],
+            ],
+        )
+
+    def test_ignore_conflicts_skips_known_emails(self):
+        Customer.objects.create(name="Alice", email="alice@example.com")
+        path = self.write(
+            "customers.ndjson",
+            '{"name": "Alice", "email": "alice@example.com"}\n'
+            '{"name": "Bob", "email": "bob@example.com"}\n',
+        )
+        stats = run_import("customers", path, ignore_conflicts=True)
+        self.assertEqual(Customer.objects.count(), 2)
+        self.assertEqual((stats["rows"], stats["imported"]), (2, 1))
+        self.assertEqual(self.read_rejects(path), [])
+
+    def test_restart_from_offset(self):
+        lines = [
+            '{"name": "Widget", "price": "9.99", "stock": 5}\n',
+            "not json\n",
+            '{"name": "Gadget", "price": "-1"}\n',
+            '{"name": "Gizmo", "price": 19.5, "stock": 12}\n',
+        ]
+        path = self.write("products.ndjson", "".join(lines))
+        offset = len("".join(lines[:2]).encode())
+
+        stats = run_import("products", path, offset=offset)
+        self.assertEqual(stats["offset"], os.path.getsize(path))
+        self.assertEqual(
+            list(Product.objects.values_list("name", "stock")), [("Gizmo", 12)]
+        )
+        self.assertEqual(
+            [reject["errors"] for reject in self.read_rejects(path)],
+            [["Price must be positive"]],
+        )
+
+    def test_orders_link_products_and_update_rollup(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        laptop = Product.objects.create(name="Laptop", price=Decimal("999.99"))
+        phone = Product.objects.create(name="Phone", price=Decimal("499.99"))
+        path = self.write(
+            "orders.csv",
+            "customer_id,product_ids,order_date\n"
+            f"{customer.pk},{laptop.pk};{phone.pk},2026-10-01T10:00:00Z\n"
+            f"{customer.pk},999,2026-10-01T11:00:00Z\n",
+        )
+        out = StringIO()
+        call_command("crm_import", "orders", path, stdout=out)
+
+        self.assertIn("Imported 1 of 2 orders (1 rejected)", out.getvalue())
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, Decimal("1499.98"))
+        self.assertEqual(order.products.count(), 2)
+        top = top_products(date(2026, 10, 1), date(2026, 10, 1))
+        self.assertEqual([row["product"] for row in top], [laptop, phone])
+
+    def test_imported_orders_leave_existing_sales_alone(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        laptop = Product.objects.create(name="Laptop", price=Decimal("999.99"))
+        day = date(2026, 10, 1)
+        # An order placed on the same day, before a price change.
+        ProductDailySales.objects.create(
+            product=laptop, day=day, units=1, revenue=Decimal("899.99")
+        )
+        path = self.write(
+            "orders.csv",
+            "customer_id,product_ids,order_date\n"
+            f"{customer.pk},{laptop.pk},2026-10-01T10:00:00Z\n",
+        )
+        call_command("crm_import", "orders", path, stdout=StringIO())
+
+        sales = ProductDailySales.objects.get(product=laptop, day=day)
+        self.assertEqual((sales.units, sales.revenue), (2, Decimal("1899.98")))
+
+    def test_batch_adds_to_the_rollup_once_per_product_and_day(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        laptop = Product.objects.create(name="Laptop", price=Decimal("999.99"))
+        rows = "".join(
+            f"{customer.pk},{laptop.pk},2026-10-01T{hour:02}:00:00Z\n"
+            for hour in range(10, 15)
+        )
+        path = self.write("orders.csv", "customer_id,product_ids,order_date\n" + rows)
+        with CaptureQueriesContext(connection) as queries:
+            call_command("crm_import", "orders", path, stdout=StringIO())
+
+        rollup = [q for q in queries if "crm_productdailysales" in q["sql"]]
+        self.assertEqual(len(rollup), 1)
+        sales = ProductDailySales.objects.get(product=laptop, day=date(2026, 10, 1))
+        self.assertEqual((sales.units, sales.revenue), (5, Decimal("4999.95")))
+
+
+class BulkUpdateProductsTests(TestCase):
+    MUTATION = (
+        "mutation ($input: [ProductUpdateInput]!) "
+        "{ bulkUpdateProducts(input: $input) { updatedCount errors } }"
+    )
+
+    def setUp(self):
+        self.client = Client(schema)
+        self.laptop = Product.objects.create(
+            name="Laptop", price=Decimal("999.99"), stock=12
+        )
+        self.phone = Product.objects.create(
+            name="Phone", price=Decimal("499.99"), stock=3
+        )
+
+    def test_mutation_applies_valid_rows_and_reports_the_rest(self):
+        executed = self.client.execute(
+            self.MUTATION,
+            variables={
+                "input": [
+                    {"id": str(self.laptop.pk), "price": 899.5, "stockDelta": -4},
+                    {"id": str(self.phone.pk), "price": -1},
+                    {"id": str(self.phone.pk), "stockDelta": -5},
+                    {"id": "999999", "stock": 1},
+                ]
+            },
+        )
+        result = executed["data"]["bulkUpdateProducts"]
+        self.assertEqual(result["updatedCount"], 1)
+        self.assertEqual(
+            result["errors"],
+            [
+                f"{self.phone.pk}: Price must be positive",
+                f"{self.phone.pk}: Stock cannot be negative",
+                "999999: Product not found",
+            ],
+        )
+        self.laptop.refresh_from_db()
+        self.phone.refresh_from_db()
+        self.assertEqual((self.laptop.price, self.laptop.stock), (Decimal("899.50"), 8))
+        self.assertEqual((self.phone.price, self.phone.stock), (Decimal("499.99"), 3))
+        # Falling below the threshold queues the product like any stock change.
+        self.assertTrue(LowStockAlert.objects.filter(product=self.laptop).exists())
+
+    def test_chunks_use_one_update_each(self):
+        products = Product.objects.bulk_create(
+            Product(name=f"Item {i}", price=Decimal("1.00"), stock=50)
+            for i in range(10)
+        )
+        rows = [{"id": p.pk, "price": "2.50", "stock_delta": 5} for p in products]
+        with CaptureQueriesContext(connection) as queries:
+            updated, errors = update_products(rows, batch_size=4)
+        self.assertEqual((updated, errors), (10, []))
+        updates = [q for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 3)
+        items = Product.objects.filter(name__startswith="Item")
+        self.assertEqual(set(items.values_list("price", "stock")), {(Decimal("2.50"), 55)})
+
+    def test_rows_are_validated_like_create_product(self):
+        updated, errors = update_products(
+            [
+                {"id": self.laptop.pk},
+                {"id": "abc", "price": "1"},
+                {"id": self.laptop.pk, "price": "x", "stock": -2},
+                {"id": self.laptop.pk, "stock": 1, "stock_delta": 1},
+                {"id": self.laptop.pk, "price": "5"},
+                {"id": self.laptop.pk, "price": "6"},
+            ]
+        )
+        self.assertEqual(updated, 1)
+        self.assertEqual(
+            [(error.index, error.errors) for error in errors],
+            [
+                (0, ["Nothing to update"]),
+                (1, ["Invalid id"]),
+                (2, ["Invalid price", "Stock cannot be negative"]),
+                (3, ["Give either stock or stock_delta, not both"]),
+                (5, ["Duplicate product ID"]),
+            ],
+        )
+
+    def test_command_reads_csv(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(f"id,price,stock_delta\n{self.phone.pk},450,10\n0,1,\n")
+        self.addCleanup(os.unlink, f.name)
+        out, err = StringIO(), StringIO()
+        call_command("bulk_update_products", f.name, stdout=out, stderr=err)
+        self.assertIn("Updated 1 products (1 rejected)", out.getvalue())
+        self.assertIn("Row 2 (0): Product not found", err.getvalue())
+        self.phone.refresh_from_db()
+        self.assertEqual((self.phone.price, self.phone.stock), (Decimal("450.00"), 13))
+
+
+class OrderIngestTests(TestCase):
+    ORDER = (
+        "mutation ($input: OrderInput!) "
+        "{ createOrder(input: $input) { provisionalId order { id } errors } }"
+    )
+    STATUS = (
+        "query ($id: String!) "
+        "{ orderStatus(provisionalId: $id) { status error order { totalAmount } } }"
+    )
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(
+            CRM_ORDER_INGEST={
+                "ENABLED": True,
+                "PATH": os.path.join(tmp.name, "queue.sqlite3"),
+                "BATCH_SIZE": 10,
+                "FLUSH_IN_PROCESS": False,
+            }
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.queue = get_order_queue()
+        self.client = Client(schema)
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(
+            name="Laptop", price=Decimal("999.99"), stock=1
+        )
+        self.phone = Product.objects.create(
+            name="Phone", price=Decimal("499.99"), stock=20
+        )
+
+    def create_order(self, *products):
+        executed = self.client.execute(
+            self.ORDER,
+            variables={
+                "input": {
+                    "customerId": str(self.customer.pk),
+                    "productIds": [str(p.pk) for p in products],
+                }
+            },
+        )
+        return executed["data"]["createOrder"]
+
+    def status(self, provisional_id):
+        executed = self.client.execute(self.STATUS, variables={"id": provisional_id})
+        return executed["data"]["orderStatus"]
+
+    def test_orders_are_queued_then_written_in_one_batch(self):
+        results = [self.create_order(self.phone) for _ in range(3)]
+        self.assertTrue(all(r["order"] is None and r["provisionalId"] for r in results))
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(self.status(results[0]["provisionalId"])["status"], "PENDING")
+
+        self.assertEqual(self.queue.flush(), 3)
+        self.assertEqual(Order.objects.count(), 3)
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 17)
+        self.assertEqual(ProductDailySales.objects.get(product=self.phone).units, 3)
+        self.assertEqual(
+            self.status(results[0]["provisionalId"]),
+            {"status": "COMMITTED", "error": None, "order": {"totalAmount": "499.99"}},
+        )
+
+    def test_orders_that_cannot_be_filled_fail_at_flush(self):
+        first = self.create_order(self.laptop, self.phone)["provisionalId"]
+        second = self.create_order(self.laptop)["provisionalId"]
+        self.queue.flush()
+
+        self.assertEqual(self.status(first)["status"], "COMMITTED")
+        self.assertEqual(
+            self.status(second),
+            {"status": "FAILED", "error": "Insufficient stock: Laptop", "order": None},
+        )
+        # Known to be sold out now, so the next one is turned away up front.
+        self.assertEqual(
+            self.create_order(self.laptop)["errors"], ["Insufficient stock: Laptop"]
+        )
+
+    def test_queueing_an_order_does_not_write_the_database(self):
+        with self.assertNumQueries(0):
+            self.queue.append(self.customer.pk, [self.phone], self.phone.price)
+
+        version = get_data_version(Order)
+        self.queue.flush()
+        self.assertGreater(get_data_version(Order), version)
+
+    def test_reflushed_batch_does_not_duplicate_orders(self):
+        provisional_id = self.create_order(self.phone)["provisionalId"]
+        # A flusher that dies after committing, before marking the queue.
+        write_batch(self.queue.claim(10))
+        self.queue.claim_timeout = 0
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(Order.objects.filter(provisional_id=provisional_id).count(), 1)
+        self.assertEqual(self.queue.status(provisional_id)[0], "committed")
+
+    def test_unknown_provisional_id(self):
+        self.assertIsNone(self.status("0" * 32))
+
+
+class OrderSnapshotTests(TestCase):
+    STATS = (
+        "query ($from: Date!, $to: Date!) { orderStats(from: $from, to: $to, "
+        "topCustomers: 1, percentiles: [0, 100]) { orders revenue "
+        "percentiles { percentile value } byDay { day orders revenue } "
+        "topCustomers { customer { name } orders revenue } } }"
+    )
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        overrides = override_settings(CRM_ORDER_SNAPSHOT={"DIR": self.directory})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal("999.99"))
+        self.phone = Product.objects.create(name="Phone", price=Decimal("499.99"))
+        self.now = timezone.now()
+        self.orders = [
+            self.order(self.alice, [self.laptop], days_ago=800),
+            self.order(self.bob, [self.phone], days_ago=1),
+            self.order(self.alice, [self.laptop, self.phone], days_ago=0),
+        ]
+        archive_orders(horizon_days=365)
+
+    def order(self, customer, products, days_ago):
+        order = Order.objects.create(
+            customer=customer,
+            total_amount=sum(p.price for p in products),
+            order_date=self.now - timedelta(days=days_ago),
+        )
+        order.products.set(products)
+        return order
+
+    def column(self, meta, name):
+        values = array("q")
+        with open(column_path(self.directory, meta, name), "rb") as f:
+            values.frombytes(f.read())
+        return list(values)
+
+    def test_snapshot_holds_live_and_archived_orders(self):
+        meta = refresh_snapshot()
+        self.assertEqual((meta["orders"], meta["links"]), (3, 4))
+        self.assertEqual(self.column(meta, "order_id"), [o.pk for o in self.orders])
+        self.assertEqual(
+            self.column(meta, "customer_id"),
+            [self.alice.pk, self.bob.pk, self.alice.pk],
+        )
+        self.assertEqual(self.column(meta, "total_cents"), [99999, 49999, 149998])
+        self.assertEqual(
+            sorted(
+                zip(
+                    self.column(meta, "link_order_id"),
+                    self.column(meta, "link_product_id"),
+                )
+            ),
+            [
+                (self.orders[0].pk, self.laptop.pk),
+                (self.orders[1].pk, self.phone.pk),
+                (self.orders[2].pk, self.laptop.pk),
+                (self.orders[2].pk, self.phone.pk),
+            ],
+        )
+
+    def test_refresh_appends_past_the_watermark(self):
+        first = refresh_snapshot()
+        self.assertEqual(refresh_snapshot(), first)  # nothing new: untouched
+
+        latest = self.order(self.bob, [self.laptop], days_ago=0)
+        meta = refresh_snapshot()
+        self.assertEqual(meta["generation"], first["generation"])
+        self.assertEqual((meta["orders"], meta["links"]), (4, 5))
+        self.assertEqual(meta["watermark"], latest.pk)
+        self.assertEqual(self.column(meta, "order_id")[-1], latest.pk)
+
+    def test_refresh_without_fcntl(self):
+        with patch("crm.snapshot.fcntl", None):
+            self.assertEqual(refresh_snapshot()["orders"], 3)
+
+    def test_rebuilds_after_orders_are_edited_or_deleted(self):
+        first = refresh_snapshot()
+        archive_orders(horizon_days=1)  # moving orders is not a rewrite
+        self.assertEqual(refresh_snapshot()["generation"], first["generation"])
+
+        Order.objects.update(total_amount=Decimal("1.00"))
+        edited = refresh_snapshot()
+        self.assertNotEqual(edited["generation"], first["generation"])
+        self.assertIn(100, self.column(edited, "total_cents"))
+
+        ArchivedOrder.objects.all().delete()
+        deleted = refresh_snapshot()
+        self.assertNotEqual(deleted["generation"], edited["generation"])
+        self.assertLess(deleted["orders"], edited["orders"])
+
+    def test_rebuilds_for_another_database_or_on_request(self):
+        first = refresh_snapshot()
+        with patch("crm.snapshot._database_name", return_value="other.sqlite3"):
+            moved = refresh_snapshot()
+        self.assertNotEqual(moved["generation"], first["generation"])
+        self.assertEqual(moved["orders"], 3)
+        self.assertFalse((Path(self.directory) / first["generation"]).exists())
+
+        out = StringIO()
+        call_command("snapshot_orders", "--rebuild", stdout=out)
+        self.assertIn("3 order(s) and 4 product link(s)", out.getvalue())
+
+    @skipUnless(analytics.np, "NumPy is not installed")
+    def test_vectorized_analytics_match_the_orders(self):
+        snapshot = analytics.load_snapshot()
+        self.assertEqual(
+            analytics.window_totals(snapshot), (3, Decimal("2999.96"))
+        )
+        self.assertEqual(
+            analytics.window_totals(snapshot, self.now - timedelta(days=2)),
+            (2, Decimal("1999.97")),
+        )
+        self.assertEqual(
+            [row["customer_id"] for row in analytics.customer_totals(snapshot)],
+            [self.alice.pk, self.bob.pk],
+        )
+        self.assertEqual(
+            analytics.order_value_percentiles(snapshot, (0, 50, 100)),
+            {0: Decimal("499.99"), 50: Decimal("999.99"), 100: Decimal("1499.98")},
+        )
+        self.assertEqual(
+            analytics.product_units(snapshot),
+            {self.laptop.pk: 2, self.phone.pk: 2},
+        )
+
+    @skipUnless(analytics.np, "NumPy is not installed")
+    def test_order_stats_query(self):
+        today = timezone.localdate(self.now)
+        executed = Client(schema).execute(
+            self.STATS,
+            variables={
+                "from": (today - timedelta(days=1)).isoformat(),
+                "to": today.isoformat(),
+            },
+        )
+        self.assertNotIn("errors", executed)
+        stats = executed["data"]["orderStats"]
+        self.assertEqual((stats["orders"], stats["revenue"]), (2, "1999.97"))
+        self.assertEqual(
+            stats["percentiles"],
+            [
+                {"percentile": 0.0, "value": "499.99"},
+                {"percentile": 100.0, "value": "1499.98"},
+            ],
+        )
+        self.assertEqual(
+            [(d["orders"], d["revenue"]) for d in stats["byDay"]],
+            [(1, "499.99"), (1, "1499.98")],
+        )
+        self.assertEqual(
+            stats["topCustomers"],
+            [{"customer": {"name": "Alice"}, "orders": 1, "revenue": "1499.98"}],
+        )
+
+    @skipIf(analytics.np, "NumPy is installed")
+    def test_order_stats_needs_numpy(self):
+        today = timezone.localdate(self.now).isoformat()
+        executed = Client(schema).execute(
+            self.STATS, variables={"from": today, "to": today}
+        )
+        self.assertIn("needs NumPy", executed["errors"][0]["message"])
+
+
+class OrderArchiveTests(TestCase):
+    ORDERS = (
+        "query ($filter: OrderFilterInput) { allOrders(filter: $filter, "
+        'orderBy: ["order_date"]) { edges { node { id totalAmount '
+        "customer { name } products { name } } } } }"
+    )
+
+    def setUp(self):
+        cache.clear()
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir, ignore_errors=True)
+        overrides = override_settings(CRM_ORDER_SNAPSHOT={"DIR": snapshot_dir})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client = Client(schema)
+        self.alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price=Decimal("999.99"))
+        self.phone = Product.objects.create(name="Phone", price=Decimal("499.99"))
+        now = timezone.now()
+        self.orders = []
+        history = (
+            (800, [self.laptop]),
+            (400, [self.phone]),
+            (5, [self.laptop, self.phone]),
+        )
+        for days, products in history:
+            order = Order.objects.create(
+                customer=self.alice,
+                total_amount=sum(p.price for p in products),
+                order_date=now - timedelta(days=days),
+            )
+            order.products.set(products)
+            self.orders.append(order)
+
+    def all_orders(self, **filters):
+        with CaptureQueriesContext(connection) as queries:
+            executed = self.client.execute(self.ORDERS, variables={"filter": filters})
+        self.assertNotIn("errors", executed)
+        edges = executed["data"]["allOrders"]["edges"]
+        self.used_archive = any(
+            "UNION" in query["sql"] for query in queries.captured_queries
+        )
+        return [
+            (edge["node"]["totalAmount"], [p["name"] for p in edge["node"]["products"]])
+            for edge in edges
+        ]
+
+    def test_archiving_is_batched_and_resumable(self):
+        self.assertEqual(
+            archive_orders(horizon_days=365, batch_size=1, max_batches=1), 1
+        )
+        self.assertEqual(ArchivedOrder.objects.count(), 1)
+        self.assertEqual(archive_orders(horizon_days=365, batch_size=1), 1)
+        self.assertEqual(archive_orders(horizon_days=365), 0)
+
+        self.assertEqual(list(Order.objects.all()), [self.orders[2]])
+        self.assertEqual(
+            sorted(
+                ArchivedOrderProduct.objects.values_list(
+                    "archived_order_id", "product_id"
+                )
+            ),
+            [(self.orders[0].pk, self.laptop.pk), (self.orders[1].pk, self.phone.pk)],
+        )
+        self.assertFalse(
+            Order.products.through.objects.filter(
+                order_id__in=[self.orders[0].pk, self.orders[1].pk]
+            ).exists()
+        )
+
+    def test_recent_ranges_skip_the_archive(self):
+        archive_orders(horizon_days=365)
+        recent = (timezone.now() - timedelta(days=30)).isoformat()
+        self.assertEqual(
+            self.all_orders(orderDateGte=recent), [("1499.98", ["Laptop", "Phone"])]
+        )
+        self.assertFalse(self.used_archive)
+
+    def test_ranges_reaching_the_archive_include_it(self):
+        archive_orders(horizon_days=365)
+        self.assertEqual(
+            self.all_orders(),
+            [
+                ("999.99", ["Laptop"]),
+                ("499.99", ["Phone"]),
+                ("1499.98", ["Laptop", "Phone"]),
+            ],
+        )
+        self.assertTrue(self.used_archive)
+
+        since = (timezone.now() - timedelta(days=500)).isoformat()
+        self.assertEqual(
+            self.all_orders(orderDateGte=since, productName="lap"),
+            [("1499.98", ["Laptop", "Phone"])],
+        )
+        self.assertEqual(
+            self.all_orders(orderDateGte=since),
+            [("499.99", ["Phone"]), ("1499.98", ["Laptop", "Phone"])],
+        )
+
+    @override_settings(CRM_COUNT_SAMPLE_SIZE=1)
+    def test_totals_count_live_and_archived_orders(self):
+        archive_orders(horizon_days=365)
+        query = (
+            "query ($filter: OrderFilterInput) { allOrders(filter: $filter, "
+            "countMode: %s) { totalCount isEstimate } }"
+        )
+        since = (timezone.now() - timedelta(days=500)).isoformat()
+
+        def total(mode, **filters):
+            executed = self.client.execute(query % mode, variables={"filter": filters})
+            self.assertNotIn("errors", executed)
+            result = executed["data"]["allOrders"]
+            return result["totalCount"], result["isEstimate"]
+
+        self.assertEqual(total("EXACT"), (3, False))
+        self.assertEqual(total("EXACT", orderDateGte=since), (2, False))
+        self.assertEqual(total("CACHED", orderDateGte=since), (2, False))
+        tables = table_row_estimate(Order, "default") + table_row_estimate(
+            ArchivedOrder, "default"
+        )
+        self.assertEqual(total("ESTIMATED"), (tables, True))
+        count, is_estimate = total("ESTIMATED", orderDateGte=since)
+        self.assertTrue(is_estimate)
+        self.assertLessEqual(count, tables)
+
+    def test_archive_union_orders_by_related_fields(self):
+        bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        Order.objects.create(
+            customer=bob,
+            total_amount=Decimal("10.00"),
+            order_date=timezone.now() - timedelta(days=600),
+        )
+        archive_orders(horizon_days=365)
+
+        executed = self.client.execute(
+            '{ allOrders(orderBy: ["-customer__name", "order_date"]) '
+            "{ edges { node { totalAmount customer { name } } } } }"
+        )
+        self.assertNotIn("errors", executed)
+        self.assertEqual(
+            [
+                (edge["node"]["customer"]["name"], edge["node"]["totalAmount"])
+                for edge in executed["data"]["allOrders"]["edges"]
+            ],
+            [
+                ("Bob", "10.00"),
+                ("Alice", "999.99"),
+                ("Alice", "499.99"),
+                ("Alice", "1499.98"),
+            ],
+        )
+
+    def test_archived_orders_keep_counting(self):
+        expected_sales = rebuild_daily_sales()
+        report = aggregate_report_partition(
+            (timezone.now() - timedelta(days=1000)).isoformat(),
+            timezone.now().isoformat(),
+        )
+        archive_orders(horizon_days=365)
+
+        self.assertEqual(rebuild_daily_sales(), expected_sales)
+        self.assertEqual(
+            aggregate_report_partition(report["start"], report["end"]), report
+        )
+
+
+class ProductCatalogTests(TestCase):
+    ORDER = (
+        "mutation ($input: OrderInput!) "
+        "{ createOrder(input: $input) { order { totalAmount } errors } }"
+    )
+
+    def setUp(self):
+        cache.clear()
+        catalog.clear()
+        self.client = Client(schema)
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(
+            name="Laptop", price=Decimal("999.99"), stock=5
+        )
+        self.phone = Product.objects.create(
+            name="Phone", price=Decimal("499.99"), stock=20
+        )
+
+    def create_order(self, *products):
+        executed = self.client.execute(
+            self.ORDER,
+            variables={
+                "input": {
+                    "customerId": str(self.customer.pk),
+                    "productIds": [str(p.pk) for p in products],
+                }
+            },
+        )
+        return executed["data"]["createOrder"]
+
+    def test_reads_are_served_from_memory_once_loaded(self):
+        catalog.refresh()
+        # Only the product data version is read.
+        with self.assertNumQueries(1):
+            entries = catalog.get_many([self.laptop.pk, self.phone.pk, 999999])
+        self.assertEqual(entries[self.laptop.pk], (Decimal("999.99"), 5, "Laptop"))
+        self.assertEqual(len(entries), 2)
+
+    def test_writes_reload_only_the_changed_rows(self):
+        catalog.refresh()
+        self.phone.price = Decimal("450.00")
+        self.phone.save()
+        with CaptureQueriesContext(connection) as queries:
+            entries = catalog.refresh()
+        self.assertEqual(len(queries), 3)  # version, change log, changed rows
+        self.assertIn(" IN ", queries[2]["sql"])
+        self.assertEqual(entries[self.phone.pk].price, Decimal("450.00"))
+
+    def test_gap_in_the_change_log_reloads_everything(self):
+        catalog.refresh()
+        self.phone.delete()
+        ProductChange.objects.filter(version=catalog.version).delete()  # pruned
+        with CaptureQueriesContext(connection) as queries:
+            entries = catalog.refresh()
+        self.assertNotIn(" IN ", queries[-1]["sql"])
+        self.assertEqual(list(entries), [self.laptop.pk])
+
+    def test_change_log_is_trimmed_by_the_nightly_job_not_per_write(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT sql FROM sqlite_master "
+                "WHERE type = 'trigger' AND tbl_name = 'crm_product'"
+            )
+            triggers = [sql for (sql,) in cursor.fetchall()]
+        self.assertEqual(len(triggers), 3)
+        self.assertFalse(any("DELETE FROM crm_productchange" in t for t in triggers))
+        Product.objects.bulk_create(
+            [Product(name=f"Cable {i}", price=Decimal("9.99")) for i in range(5)]
+        )
+        self.assertEqual(ProductChange.objects.count(), 7)  # setUp wrote two
+        with self.settings(CRM_CATALOG_CHANGE_LOG_SIZE=3):
+            pruned = archive_old_orders()["pruned_product_changes"]
+        self.assertEqual(pruned, 4)
+        self.assertEqual(ProductChange.objects.count(), 3)
+
+    def test_orders_see_writes_made_outside_django(self):
+        catalog.refresh()
+        # As another process or program sharing the database would write.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE crm_product SET price = %s WHERE id = %s",
+                ["899.99", self.laptop.pk],
+            )
+            cursor.execute(
+                "INSERT INTO crm_product (name, price, stock) VALUES (%s, %s, %s)",
+                ["Tablet", "299.99", 3],
+            )
+        tablet = Product.objects.get(name="Tablet")
+
+        result = self.create_order(self.laptop, tablet)
+        self.assertEqual(result["errors"], [])
+        self.assertEqual(result["order"]["totalAmount"], "1199.98")
+        names = self.client.execute("{ allProducts { edges { node { name } } } }")
+        self.assertIn(
+            {"node": {"name": "Tablet"}}, names["data"]["allProducts"]["edges"]
+        )
+
+    def test_order_uses_current_price_and_database_stock(self):
+        catalog.refresh()
+        self.laptop.price = Decimal("899.99")
+        self.laptop.save()
+        result = self.create_order(self.laptop, self.phone)
+        self.assertEqual(result["errors"], [])
+        self.assertEqual(result["order"]["totalAmount"], "1399.98")
+        self.assertEqual(catalog.get_many([self.laptop.pk])[self.laptop.pk].stock, 4)
+
+        # Stock written behind the catalog's back is still enforced.
+        Product.objects.filter(pk=self.laptop.pk).update(stock=0)
+        result = self.create_order(self.laptop)
+        self.assertIsNone(result["order"])
+        self.assertEqual(result["errors"], ["Insufficient stock: Laptop"])
+
+    def test_all_products_pages_in_the_database(self):
+        Product.objects.create(name="Tablet", price=Decimal("499.99"), stock=8)
+        query = (
+            "{ allProducts(first: 1, "
+            'filter: { priceLte: 1000, nameIcontains: "T" }, orderBy: ["-price", "name"]) '
+            "{ totalCount edges { node { name stock } } } }"
+        )
+        with patch.object(catalog, "refresh") as refresh:
+            executed = self.client.execute(query)
+        self.assertNotIn("errors", executed)
+        refresh.assert_not_called()
+        self.assertEqual(
+            executed["data"]["allProducts"],
+            {"totalCount": 2, "edges": [{"node": {"name": "Laptop", "stock": 5}}]},
+        )
+
+
+class JobRunTests(TestCase):
+    JOB_RUNS = (
+        "query ($job: String) { jobRuns(job: $job) { job status rowsProcessed "
+        "durationMs error } }"
+    )
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.log_file = os.path.join(self.directory, "job_log.txt")
+
+    def read_log(self, path=None):
+        with open(path or self.log_file) as f:
+            return f.read()
+
+    def test_records_a_run_and_flushes_its_lines(self):
+        with record_job("reminders", self.log_file) as job:
+            for n in range(3):
+                job.log(f"order {n}")
+            job.add_rows(3)
+        run = JobRun.objects.get()
+        self.assertEqual(
+            (run.job, run.status, run.rows_processed),
+            ("reminders", JobRun.SUCCESS, 3),
+        )
+        self.assertGreaterEqual(run.duration_ms, 0)
+        self.assertEqual(self.read_log(), "order 0\norder 1\norder 2\n")
+
+    def test_failed_run_is_recorded_and_reraised(self):
+        with self.assertRaises(RuntimeError):
+            with record_job("reminders") as job:
+                job.add_rows(1)
+                raise RuntimeError("GraphQL endpoint down")
+        run = JobRun.objects.get()
+        self.assertEqual(run.status, JobRun.ERROR)
+        self.assertEqual(run.error, "GraphQL endpoint down")
+        self.assertEqual(run.rows_processed, 1)
+
+    def test_sink_flushes_in_the_background_and_rotates(self):
+        sink = LogSink(
+            self.log_file, max_bytes=100, backup_count=2, flush_interval=0.01
+        )
+        sink.write("first")
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.log_file) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.read_log(), "first\n")
+
+        for n in range(12):
+            sink.write("x" * 39)  # 40 bytes a line: two lines per file
+            sink.flush()
+        self.assertEqual(len(self.read_log()), 80)
+        self.assertEqual(len(self.read_log(f"{self.log_file}.2")), 80)
+        self.assertFalse(os.path.exists(f"{self.log_file}.3"))
+
+    def test_processes_sharing_a_log_rotate_without_losing_lines(self):
+        def write_lines(worker):
+            sink = LogSink(self.log_file, max_bytes=200, backup_count=1000)
+            for n in range(50):
+                sink.write(f"worker {worker} line {n:02}".ljust(39))
+                sink.flush()
+
+        fork = multiprocessing.get_context("fork")
+        workers = [fork.Process(target=write_lines, args=(w,)) for w in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        lines = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".lock"):
+                lines += self.read_log(os.path.join(self.directory, name)).splitlines()
+        self.assertEqual(len(lines), 200)
+        self.assertEqual(len(set(lines)), 200)
+
+    def test_old_runs_are_pruned(self):
+        now = timezone.now()
+        for days in (1, 89, 91, 400):
+            JobRun.objects.create(job="reminders", started_at=now - timedelta(days=days))
+
+        self.assertEqual(prune_job_runs(), 2)
+        self.assertEqual(
+            sorted((now - run.started_at).days for run in JobRun.objects.all()), [1, 89]
+        )
+        self.assertEqual(archive_old_orders()["pruned_job_runs"], 0)
+        with self.settings(CRM_JOB_LOG={"RETAIN_DAYS": 30}):
+            self.assertEqual(archive_old_orders()["pruned_job_runs"], 1)
+
+    def test_tasks_record_runs_and_job_runs_query(self):
+        archive_old_orders()
+        drain_low_stock_task()
+        executed = Client(schema).execute(
+            self.JOB_RUNS, variables={"job": "archive_old_orders"}
+        )
+        self.assertNotIn("errors", executed)
+        runs = executed["data"]["jobRuns"]
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(
+            {k: runs[0][k] for k in ("job", "status", "rowsProcessed", "error")},
+            {
+                "job": "archive_old_orders",
+                "status": "SUCCESS",
+                "rowsProcessed": 0,
+                "error": "",
+            },
+        )
+        self.assertEqual(
+            sorted(JobRun.objects.values_list("job", flat=True)),
+            ["archive_old_orders", "drain_low_stock_queue"],
+        )
+
+
+class HealthEndpointTests(TestCase):
+    def setUp(self):
+        reset_checks()
+
+    def tearDown(self):
+        reset_checks()
+
+    def test_healthz_reports_latency(self):
+        self.client.get("/admin/login/")
+        response = self.client.get("/healthz")
+        self.assertEqual(response.status_code, 200)
+        latency = response.json()["latency_ms"]
+        self.assertGreaterEqual(latency["count"], 1)
+        self.assertLessEqual(latency["p50"], latency["p99"])
+
+    @override_settings(CELERY_BROKER_URL="")
+    def test_readyz_checks_database_once_per_interval(self):
+        with patch.dict(CHECKS, database=Mock(wraps=CHECKS["database"])):
+            for _ in range(3):
+                response = self.client.get("/readyz")
+                self.assertEqual(response.status_code, 200)
+            self.assertEqual(CHECKS["database"].call_count, 1)
+        self.assertTrue(response.json()["checks"]["database"]["ok"])
+        self.assertNotIn("broker", response.json()["checks"])
+
+    @override_settings(CRM_HEALTH_CHECK_TIMEOUT=0.05)
+    def test_readyz_fails_when_database_check_hangs(self):
+        with patch.dict(CHECKS, database=lambda: time.sleep(0.2)):
+            response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("timed out", response.json()["checks"]["database"]["error"])
+
+    def test_readyz_checks_the_project_broker(self):
+        # The broker configured in the project settings, without overrides.
+        with patch.dict(CHECKS, broker=Mock()):
+            response = self.client.get("/readyz")
+            CHECKS["broker"].assert_called_once_with()
+        self.assertTrue(response.json()["checks"]["broker"]["ok"])
+
+    def test_readyz_stays_ready_when_the_broker_is_down(self):
+        def broker_down():
+            raise ConnectionRefusedError("Connection refused")
+
+        with patch.dict(CHECKS, broker=broker_down):
+            response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "degraded")
+        self.assertFalse(response.json()["checks"]["broker"]["ok"])
+        self.assertTrue(response.json()["checks"]["database"]["ok"])
+
+    @override_settings(CELERY_BROKER_URL="memory://")
+    def test_readyz_checks_configured_broker(self):
+        response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["checks"]["broker"]["ok"])
+
+    def test_latency_percentiles(self):
+        recorder = LatencyRecorder(size=100)
+        for duration in range(1, 201):
+            recorder.record(float(duration))
+        self.assertEqual(recorder.summary(), {"count": 100, "p50": 151.0, "p99": 200.0})
+
+
+@override_settings(CRM_READ_REPLICAS=[], ALLOWED_HOSTS=["localhost"])
+class LoadHarnessTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        load.seed(customers=5, products=4, orders=50)
+        counting = load.count_sql()
+        counting.__enter__()
+        self.addCleanup(counting.__exit__, None, None, None)
+
+    def run_mix(self, transport, mix):
+        fixture = load.discover(transport)
+        return load.run_load(
+            transport, fixture, load.parse_mix(mix), concurrency=1, duration=0.3
+        )
+
+    def test_wsgi_run_reports_every_operation(self):
+        results = self.run_mix(
+            load.WSGITransport(),
+            "list_orders=2,deep_page=1,create_order=1,bulk_update_products=1",
+        )
+        operations = results["operations"]
+        self.assertEqual(
+            set(operations),
+            {"list_orders", "deep_page", "create_order", "bulk_update_products"},
+        )
+        total = results["total"]
+        self.assertGreater(total["count"], 0)
+        self.assertEqual(total["errors"], 0, total["error_messages"])
+        self.assertEqual(sum(total["histogram"]), total["count"])
+        self.assertGreaterEqual(total["p99_ms"], total["p50_ms"])
+        self.assertGreater(operations["list_orders"]["sql_per_request"], 0)
+        self.assertEqual(
+            Order.objects.count(), 50 + operations["create_order"]["count"]
+        )
+
+    def test_asgi_run_and_comparison(self):
+        results = self.run_mix(load.ASGITransport(), "list_customers,list_products")
+        self.assertEqual(results["config"]["target"], "asgi")
+        self.assertEqual(results["total"]["errors"], 0)
+        self.assertGreater(results["operations"]["list_products"]["count"], 0)
+
+        out = StringIO()
+        load.print_comparison([{"label": "asgi", **results}], out=out)
+        self.assertIn("list_customers", out.getvalue())
+
+    def test_graphql_errors_count_as_errors(self):
+        self.assertEqual(load._failed(200, b'{"data": {}}'), None)
+        self.assertEqual(
+            load._failed(200, b'{"errors": [{"message": "boom"}]}'), "boom"
+        )
+        self.assertEqual(load._failed(503, b""), "HTTP 503")
+        with self.assertRaises(ValueError):
+            load.parse_mix("list_orders=1,drop_tables=1")
+
+
+@skipUnless(
+    settings.CRM_SQLITE_PROFILE == "production", "SQLite production profile is off"
+)
+class SQLiteProfileTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def test_connections_get_the_profile_pragmas(self):
+        values = pragmas("default")
+        self.assertEqual(values["synchronous"], 1)  # NORMAL
+        self.assertEqual(values["busy_timeout"], 5000)
+        self.assertEqual(values["cache_size"], -65536)
+        self.assertEqual(connection.settings_dict["CONN_MAX_AGE"], 600)
+
+
+class SQLiteTransactionTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def begins(self, block, using="default"):
+        with CaptureQueriesContext(connections[using]) as queries:
+            with block:
+                Product.objects.using(using).exists()
+        return [q["sql"] for q in queries.captured_queries if "BEGIN" in q["sql"]]
+
+    def test_only_write_paths_begin_immediate(self):
+        self.assertEqual(self.begins(write_transaction()), ["BEGIN IMMEDIATE"])
+        self.assertEqual(self.begins(transaction.atomic()), ["BEGIN"])
+        self.assertEqual(self.begins(read_transaction("default")), ["BEGIN"])
+        self.assertEqual(
+            self.begins(transaction.atomic(using="replica"), using="replica"),
+            ["BEGIN"],
+        )
+        self.assertIsNone(connection.transaction_mode)
+
+    def test_order_mutation_begins_immediate(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        phone = Product.objects.create(name="Phone", price=Decimal("499.99"), stock=5)
+        with CaptureQueriesContext(connection) as queries:
+            executed = Client(schema).execute(
+                "mutation ($input: OrderInput!) "
+                "{ createOrder(input: $input) { order { id } errors } }",
+                variables={
+                    "input": {
+                        "customerId": str(customer.pk),
+                        "productIds": [str(phone.pk)],
+                    }
+                },
+            )
+        self.assertEqual(executed["data"]["createOrder"]["errors"], [])
+        begins = [q["sql"] for q in queries.captured_queries if "BEGIN" in q["sql"]]
+        self.assertEqual(begins, ["BEGIN IMMEDIATE"])
+
+
+scheduled_calls = []
+
+
+def scheduled_job(**kwargs):
+    scheduled_calls.append(kwargs)
+    return len(scheduled_calls)
+
+
+def failing_scheduled_job():
+    raise RuntimeError("job failed")
+
+
+class SchedulingTests(TestCase):
+    def setUp(self):
+        scheduled_calls.clear()
+        self._celery_conf = {
+            key: celery_app.conf[key]
+            for key in (
+                "task_always_eager",
+                "CELERY_BROKER_URL",
+                "CELERY_RESULT_BACKEND",
+            )
+        }
+        # The broker and backend come from Django settings, under their prefix.
+        celery_app.conf.update(
+            task_always_eager=True,
+            CELERY_BROKER_URL="memory://",
+            CELERY_RESULT_BACKEND="cache+memory://",
+        )
+        self.addCleanup(celery_app.conf.update, self._celery_conf)
+        self.jobs = {
+            "sweep": {"TASK": "crm.tests.scheduled_job", "SCHEDULE": "*/5 * * * *"},
+            "merge": {
+                "TASK": "crm.tests.scheduled_job",
+                "SCHEDULE": "0 * * * *",
+                "KWARGS": {"full": True},
+                "OVERLAP": "coalesce",
+            },
+            "broken": {
+                "TASK": "crm.tests.failing_scheduled_job",
+                "SCHEDULE": "0 0 * * *",
+            },
+        }
+        overrides = override_settings(CRM_JOBS=self.jobs)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def run_job(self, name):
+        return run_scheduled_job.delay(name).get()
+
+    def test_beat_sends_every_job_through_the_scheduler(self):
+        from crm.celery import beat_schedule
+
+        schedule = beat_schedule()
+        self.assertEqual(set(schedule), {"sweep", "merge", "broken"})
+        entry = schedule["sweep"]
+        self.assertEqual(entry["task"], "crm.tasks.run_scheduled_job")
+        self.assertEqual(entry["args"], ("sweep",))
+        self.assertEqual(entry["schedule"].minute, set(range(0, 60, 5)))
+        self.assertEqual(
+            entry["options"], {"soft_time_limit": 600, "time_limit": 600 + LOCK_GRACE}
+        )
+
+    def test_low_stock_queue_is_drained_every_minute(self):
+        from alx_backend_graphql import settings as project_settings
+        from crm.celery import beat_schedule
+
+        with override_settings(CRM_JOBS=project_settings.CRM_JOBS):
+            entry = beat_schedule()["drain-low-stock-queue"]
+            job = settings.CRM_JOBS["drain_low_stock_queue"]
+        self.assertEqual(job["TASK"], "crm.tasks.drain_low_stock_queue")
+        self.assertEqual(entry["args"], ("drain_low_stock_queue",))
+        self.assertEqual(entry["schedule"].minute, set(range(60)))
+
+    def test_every_project_job_is_importable(self):
+        from django.utils.module_loading import import_string
+
+        for job in settings.CRM_JOBS.values():
+            self.assertTrue(callable(import_string(job["TASK"])), job["TASK"])
+
+    def test_runs_the_job_under_its_lock(self):
+        self.assertEqual(self.run_job("merge"), {"status": "ran", "result": 1})
+        self.assertEqual(scheduled_calls, [{"full": True}])
+        self.assertFalse(JobLock.objects.exists())
+
+    def test_overlapping_run_is_skipped(self):
+        acquire_job_lock("sweep", 60)
+        self.assertEqual(self.run_job("sweep"), {"status": "skipped"})
+        self.assertEqual(scheduled_calls, [])
+
+    def test_overlapping_runs_are_coalesced_into_one_more_run(self):
+        token = acquire_job_lock("merge", 60)
+        for _ in range(3):
+            self.assertEqual(self.run_job("merge"), {"status": "coalesced"})
+        self.assertEqual(scheduled_calls, [])
+
+        finish_scheduled_job("merge", token)
+        self.assertEqual(scheduled_calls, [{"full": True}])
+        self.assertFalse(JobLock.objects.exists())
+
+    def test_expired_lock_is_taken_over(self):
+        stale = acquire_job_lock("sweep", -LOCK_GRACE - 1)
+        self.assertEqual(self.run_job("sweep")["status"], "ran")
+        finish_scheduled_job("sweep", stale)  # the timed-out run ends late
+        self.assertEqual(len(scheduled_calls), 1)
+
+    def test_jitter_defers_the_start(self):
+        self.jobs["sweep"]["JITTER"] = 30
+        result = self.run_job("sweep")
+        self.assertEqual(result["status"], "deferred")
+        self.assertTrue(0 <= result["countdown"] <= 30)
+        self.assertEqual(len(scheduled_calls), 1)  # eager: the deferred run ran
+
+    def test_failed_run_releases_its_lock(self):
+        with self.assertRaises(RuntimeError):
+            run_scheduled_job("broken")
+        self.assertFalse(JobLock.objects.exists())
+
+    def test_report_holds_its_lock_until_the_merge(self):
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir, ignore_errors=True)
+        self.jobs["report"] = {
+            "TASK": "crm.tasks.generate_crm_report",
+            "SCHEDULE": "0 6 * * mon",
+            "HOLDS_LOCK": True,
+        }
+        held = []
+        merge = merge_report_partitions.run
+
+        def tracked_merge(*args, **kwargs):
+            held.append(JobLock.objects.filter(job="report").exists())
+            return merge(*args, **kwargs)
+
+        with (
+            self.settings(CRM_ORDER_SNAPSHOT={"DIR": snapshot_dir}),
+            patch.object(merge_report_partitions, "run", tracked_merge),
+        ):
+            result = self.run_job("report")
+        self.assertEqual(result["result"]["job_lock"], "handed_off")
+        self.assertEqual(held, [True])
+        self.assertFalse(JobLock.objects.exists())
+
+    def test_clean_inactive_customers(self):
+        old = timezone.now() - timedelta(days=400)
+        Customer.objects.create(name="Gone", email="gone@example.com", created_at=old)
+        kept = Customer.objects.create(
+            name="Archived", email="archived@example.com", created_at=old
+        )
+        ArchivedOrder.objects.create(
+            id=1, customer=kept, total_amount=Decimal("1.00"), order_date=old
+        )
+        Customer.objects.create(name="New", email="new@example.com")
+        self.assertEqual(cron.clean_inactive_customers(), 1)
+        self.assertEqual(
+            sorted(Customer.objects.values_list("name", flat=True)), ["Archived", "New"]
+        )
+
+
+class JobStartupTests(SimpleTestCase):
+    def test_job_startup_skips_heavy_imports(self):
+        job = import_time.measure(import_time.JOB_STARTUP)
+        self.assertEqual(import_time.heavy_imports(job["modules"]), [])
+
+    # Wall-clock timings depend on the machine, so the budget is opt-in.
+    @skipUnless(
+        os.environ.get("CRM_CHECK_IMPORT_BUDGET"), "CRM_CHECK_IMPORT_BUDGET is not set"
+    )
+    def test_job_startup_stays_within_import_budget(self):
+        job = import_time.measure(import_time.JOB_STARTUP)
+        self.assertLessEqual(job["total_ms"], import_time.IMPORT_BUDGET_MS)
+
+    def test_job_settings_keep_the_crm_app(self):
+        from alx_backend_graphql import settings_jobs
+
+        self.assertIn("crm", settings_jobs.INSTALLED_APPS)
+        self.assertNotIn("graphene_django", settings_jobs.INSTALLED_APPS)
+        self.assertEqual(settings_jobs.CRM_JOBS, settings.CRM_JOBS)
+
+    def test_runner_only_runs_crm_jobs(self):
+        with self.assertRaises(ValueError):
+            jobs.run("os.getcwd")
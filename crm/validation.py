@@ -0,0 +1,45 @@
+"""
+Field rules shared by the GraphQL mutations and the bulk importer.
+
+Each function returns the list of error messages for its input (empty when it
+is valid), using the wording the mutations have always returned.
+"""
+
+import re
+from decimal import Decimal, InvalidOperation
+
+PHONE_PATTERN = re.compile(r"^\+?\d[\d\-]+$")
+
+
+def customer_errors(phone=None):
+    errors = []
+    if phone and not PHONE_PATTERN.match(phone):
+        errors.append("Invalid phone format")
+    return errors
+
+
+def parse_price(value):
+    """Return ``value`` as a Decimal, or None when it is not a number."""
+    try:
+        price = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    return price if price.is_finite() else None
+
+
+def price_errors(price):
+    if price is None:
+        return ["Invalid price"]
+    if price <= 0:
+        return ["Price must be positive"]
+    return []
+
+
+def stock_errors(stock=None):
+    if stock is not None and stock < 0:
+        return ["Stock cannot be negative"]
+    return []
+
+
+def product_errors(price, stock=None):
+    return price_errors(price) + stock_errors(stock)
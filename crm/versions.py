@@ -0,0 +1,67 @@
+"""
+Data version counters for the CRM models.
+
+Every write to a model bumps its counter, so anything derived from the
+model's rows (cached counts, HTTP validators) can be keyed by the version
+and is invalidated without having to track individual keys.
+
+The counters are ``DataVersion`` rows, bumped by database triggers (see
+migration 0012) in the same transaction as the write. Every process, and
+every write, including bulk updates, raw SQL and other programs sharing the
+database, moves them. The triggers fire per row, so a bulk write of N rows
+bumps the counter N times. ``bump_data_version`` is only needed for answers that
+change without a write to the model's tables (the order queue's state).
+
+``ORDER_REWRITES`` counts only the writes that change stored orders (edits
+and deletes, but not appends or archiving; see migration 0014), for readers
+that follow the orders by id watermark (``crm.snapshot``).
+"""
+
+import time
+
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import DataVersion
+from .routers import PRIMARY_DB
+from .sqlite import write_transaction
+
+ORDER_REWRITES = "crm.order:rewrites"
+
+
+def _now_version():
+    # Versions move to at least the clock, as in the triggers, so one that
+    # was rolled back or deleted is never handed out again.
+    return time.time_ns() // 1000
+
+
+def get_data_version(model, using=None):
+    return get_data_versions([model], using)[model._meta.label_lower]
+
+
+def get_data_versions(models, using=None):
+    """
+    Return {label: version} for several models in one query; 0 for a model
+    that was never written.
+    """
+    return get_versions([model._meta.label_lower for model in models], using)
+
+
+def get_versions(labels, using=None):
+    """Return {label: version} for the given counter labels, in one query."""
+    versions = DataVersion.objects.filter(label__in=labels)
+    if using is not None:
+        versions = versions.using(using)
+    found = dict(versions.values_list("label", "version"))
+    return {label: found.get(label, 0) for label in labels}
+
+
+def bump_data_version(model):
+    label = model._meta.label_lower
+    now = _now_version()
+    with write_transaction(using=PRIMARY_DB):
+        bumped = DataVersion.objects.filter(label=label).update(
+            version=Greatest(F("version") + 1, Value(now))
+        )
+        if not bumped:
+            DataVersion.objects.get_or_create(label=label, defaults={"version": now})
@@ -1,3 +1,299 @@
-from django.shortcuts import render
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-# Create your views here.
+from django.conf import settings
+from django.db import close_old_connections
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import force_bytes
+from django.views.decorators.http import require_GET
+from graphene_django.views import GraphQLView, HttpError
+from graphql import get_operation_ast, parse
+
+from .admission import Rejected, get_admission_controller, retry_after_header
+from .encoding import get_encoder, iter_encode, should_stream
+from .health import readiness, request_latency
+from .http_cache import cache_control_for, compress_response, operation_etag
+from .profiling import capture_path, list_captures, profile_request
+from .routers import is_client_pinned, pin_client_to_primary, use_primary
+
+
+PROFILE_ID_HEADER = "X-CRM-Profile-Id"
+
+
+@lru_cache(maxsize=256)
+def get_operation_type(query, operation_name=None):
+    """
+    Return "query", "mutation" or "subscription" for the operation that would
+    run, or None when the document cannot be parsed.
+    """
+    try:
+        document = parse(query)
+    except Exception:
+        return None
+    operation_ast = get_operation_ast(document, operation_name)
+    if operation_ast is None:
+        return None
+    return operation_ast.operation.value
+
+
+def get_client_key(request):
+    """Identify the calling client by API key, falling back to its IP address."""
+    return request.headers.get("X-Api-Key") or request.META.get("REMOTE_ADDR", "")
+
+
+_batch_executor = None
+
+
+def get_batch_executor():
+    global _batch_executor
+    if _batch_executor is None:
+        _batch_executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "CRM_GRAPHQL_BATCH_WORKERS", 4),
+            thread_name_prefix="crm-graphql-batch",
+        )
+    return _batch_executor
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQL endpoint that routes query operations to the read replicas and
+    mutations (plus reads that follow them) to the primary database.
+
+    A POST whose JSON body is an array runs as a batch: every operation gets
+    the same request as its context (sharing loader caches and the DB
+    connection), and a batch made only of queries may run in parallel.
+
+    Requests pass admission control first (``crm.admission``): over their
+    client's rate limit, or with no pool slot free in time, they get a 429.
+    Admitted requests may be profiled on demand (``crm.profiling``).
+
+    Results are encoded by the ``crm.encoding`` encoder; a large result of a
+    single operation is streamed rather than returned as one string.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        self.batch = self.is_batch_request(request)
+        self.stream = None
+        try:
+            with get_admission_controller().admit(
+                self.get_request_operation(request), get_client_key(request)
+            ):
+                with profile_request(request) as capture:
+                    if self.batch:
+                        response = self.dispatch_batch(request)
+                    else:
+                        response = self.dispatch_cached(request, *args, **kwargs)
+                if capture is not None:
+                    response[PROFILE_ID_HEADER] = capture.id
+                if getattr(request, "crm_wrote", False):
+                    pin_client_to_primary(response, get_client_key(request))
+        except Rejected as e:
+            response = JsonResponse({"errors": [{"message": str(e)}]}, status=429)
+            response["Retry-After"] = retry_after_header(e.retry_after)
+            return response
+        return compress_response(request, response)
+
+    def dispatch_cached(self, request, *args, **kwargs):
+        """
+        Serve a request, adding validators to GET queries and answering a
+        matching If-None-Match with a 304 before anything executes.
+        """
+        etag = None
+        if request.method == "GET" and not self.request_wants_html(request):
+            etag = operation_etag(
+                self.schema,
+                request.GET.get("query"),
+                request.GET.get("variables"),
+                request.GET.get("operationName"),
+            )
+        if etag is None:
+            return self.dispatch_single(request, *args, **kwargs)
+
+        cache_control = cache_control_for(request.GET.get("operationName"))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = self.dispatch_single(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            response["Cache-Control"] = cache_control
+        return response
+
+    def dispatch_single(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if self.stream is None:
+            return response
+        return StreamingHttpResponse(
+            self.stream,
+            status=response.status_code,
+            content_type=response["Content-Type"],
+        )
+
+    def json_encode(self, request, d, pretty=False):
+        if self.pretty or pretty or request.GET.get("pretty"):
+            return super().json_encode(request, d, pretty=True)
+        if not self.batch and should_stream(d):
+            # Picked up by dispatch_single once graphene returns its response.
+            self.stream = iter_encode(d)
+            return b""
+        return get_encoder().dumps(d)
+
+    def get_request_operation(self, request):
+        """The operation type deciding the pool: any mutation makes it "mutation"."""
+        if request.method != "POST":
+            query = request.GET.get("query") or ""
+            return get_operation_type(query, request.GET.get("operationName"))
+        try:
+            data = self.parse_body(request)
+        except HttpError:
+            return None
+        entries = data if isinstance(data, list) else [data]
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            query = entry.get("query") or request.GET.get("query") or ""
+            if get_operation_type(query, entry.get("operationName")) == "mutation":
+                return "mutation"
+        return "query"
+
+    def dispatch_batch(self, request):
+        try:
+            data = self.parse_body(request)
+            responses = self.execute_batch(request, data)
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(
+                request, {"errors": [self.format_error(e)]}
+            )
+            return response
+
+        result = b"[%s]" % b",".join(
+            force_bytes(response[0]) for response in responses
+        )
+        status_code = max(response[1] for response in responses)
+        return HttpResponse(
+            status=status_code, content=result, content_type="application/json"
+        )
+
+    def is_batch_request(self, request):
+        return (
+            request.method == "POST"
+            and self.get_content_type(request) == "application/json"
+            and request.body.lstrip()[:1] == b"["
+        )
+
+    def execute_batch(self, request, entries):
+        max_size = getattr(settings, "CRM_GRAPHQL_MAX_BATCH_SIZE", 10)
+        if len(entries) > max_size:
+            message = f"Batch of {len(entries)} operations exceeds the limit of {max_size}"
+            raise HttpError(HttpResponseBadRequest(message))
+        if not all(isinstance(entry, dict) for entry in entries):
+            raise HttpError(
+                HttpResponseBadRequest("Every batch entry must be a JSON object.")
+            )
+
+        read_only = all(
+            get_operation_type(entry.get("query") or "", entry.get("operationName"))
+            == "query"
+            for entry in entries
+        )
+        if (
+            len(entries) > 1
+            and read_only
+            and getattr(settings, "CRM_GRAPHQL_BATCH_PARALLEL", False)
+        ):
+            return list(
+                get_batch_executor().map(
+                    lambda entry: contextvars.copy_context().run(
+                        self.get_parallel_response, request, entry
+                    ),
+                    entries,
+                )
+            )
+        # Mutations run one after another, in the order they were sent.
+        return [self.get_response(request, entry) for entry in entries]
+
+    def get_parallel_response(self, request, entry):
+        close_old_connections()
+        return self.get_response(request, entry)
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        operation = get_operation_type(query, operation_name) if query else None
+        client_key = get_client_key(request)
+
+        if operation == "mutation" or is_client_pinned(request, client_key):
+            with use_primary():
+                result = super().execute_graphql_request(
+                    request, data, query, variables, operation_name, show_graphiql
+                )
+            if operation == "mutation":
+                # Picked up by dispatch, which pins the client on the response.
+                request.crm_wrote = True
+            return result
+
+        return super().execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+
+@require_GET
+def healthz(request):
+    """Liveness: the process is up and serving requests."""
+    return JsonResponse({"status": "ok", "latency_ms": request_latency.summary()})
+
+
+@require_GET
+def readyz(request):
+    """
+    Readiness: the database can be reached. A broker that cannot be reached
+    (when configured) is reported as "degraded" but does not fail the probe.
+    """
+    status, checks = readiness()
+    return JsonResponse(
+        {
+            "status": status,
+            "checks": checks,
+            "latency_ms": request_latency.summary(),
+        },
+        status=503 if status == "unavailable" else 200,
+    )
+
+
+@require_GET
+def metrics(request):
+    """Admission-control pool usage, in the Prometheus text format."""
+    return HttpResponse(
+        get_admission_controller().metrics(),
+        content_type="text/plain; version=0.0.4",
+    )
+
+
+@staff_member_required
+@require_GET
+def profile_captures(request):
+    """List the stored profiling captures, newest first (staff only)."""
+    return JsonResponse({"captures": list_captures()})
+
+
+@staff_member_required
+@require_GET
+def profile_capture_download(request, capture_id, kind):
+    """Download a capture as its JSON report or its cProfile dump (staff only)."""
+    path = capture_path(capture_id, kind)
+    if path is None:
+        raise Http404("No such capture")
+    return FileResponse(
+        open(path, "rb"), as_attachment=True, filename=f"{capture_id}.{kind}"
+    )
@@ -0,0 +1,152 @@
+"""
+GraphQL subscriptions over WebSockets for the ASGI application.
+
+Implements the ``graphql-transport-ws`` protocol on top of plain ASGI, so no
+extra server-side dependency is needed. Each connection may run a bounded
+number of subscriptions; every subscription reads from its own bounded
+pub/sub queue and only pulls the next event once the previous one has been
+sent, which gives slow clients natural backpressure.
+"""
+
+import asyncio
+import json
+
+from django.conf import settings
+from graphql import ExecutionResult
+
+PROTOCOL = "graphql-transport-ws"
+
+
+class GraphQLWebSocketApp:
+    """ASGI app serving subscriptions on ``path`` and passing on everything else."""
+
+    def __init__(self, app, schema, path="/graphql"):
+        self.app = app
+        self.schema = schema
+        self.path = path.rstrip("/")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket" and scope["path"].rstrip("/") == self.path:
+            await GraphQLWebSocketConnection(self.schema, scope, receive, send).run()
+        else:
+            await self.app(scope, receive, send)
+
+
+class GraphQLWebSocketConnection:
+    def __init__(self, schema, scope, receive, send):
+        self.schema = schema
+        self.scope = scope
+        self.receive = receive
+        self._send = send
+        self.send_lock = asyncio.Lock()
+        self.acknowledged = False
+        self.operations = {}
+        self.max_operations = getattr(settings, "CRM_SUBSCRIPTIONS_PER_CONNECTION", 10)
+
+    async def send(self, message):
+        async with self.send_lock:
+            await self._send(message)
+
+    async def send_json(self, data):
+        await self.send({"type": "websocket.send", "text": json.dumps(data)})
+
+    async def close(self, code, reason=""):
+        await self.send({"type": "websocket.close", "code": code, "reason": reason})
+
+    async def run(self):
+        message = await self.receive()
+        if message["type"] != "websocket.connect":
+            return
+        if PROTOCOL not in self.scope.get("subprotocols", []):
+            await self.close(4406, "Subprotocol not acceptable")
+            return
+        await self.send({"type": "websocket.accept", "subprotocol": PROTOCOL})
+
+        try:
+            while True:
+                message = await self.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message["type"] != "websocket.receive":
+                    continue
+                try:
+                    data = json.loads(message.get("text") or message.get("bytes"))
+                    handled = await self.handle(data)
+                except (TypeError, ValueError, KeyError):
+                    handled = False
+                if not handled:
+                    await self.close(4400, "Invalid message")
+                    break
+        finally:
+            tasks = list(self.operations.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def handle(self, data):
+        message_type = data["type"]
+        if message_type == "connection_init":
+            if self.acknowledged:
+                await self.close(4429, "Too many initialisation requests")
+            else:
+                self.acknowledged = True
+                await self.send_json({"type": "connection_ack"})
+        elif message_type == "ping":
+            await self.send_json({"type": "pong"})
+        elif message_type == "pong":
+            pass
+        elif message_type == "subscribe":
+            await self.subscribe(data["id"], data["payload"])
+        elif message_type == "complete":
+            task = self.operations.pop(data["id"], None)
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        else:
+            return False
+        return True
+
+    async def subscribe(self, operation_id, payload):
+        if not self.acknowledged:
+            await self.close(4401, "Unauthorized")
+            return
+        if operation_id in self.operations:
+            await self.close(4409, f"Subscriber for {operation_id} already exists")
+            return
+        if len(self.operations) >= self.max_operations:
+            await self.send_json(
+                {
+                    "type": "error",
+                    "id": operation_id,
+                    "payload": [{"message": "Too many active subscriptions"}],
+                }
+            )
+            return
+
+        result = await self.schema.subscribe(
+            payload.get("query", ""),
+            variable_values=payload.get("variables"),
+            operation_name=payload.get("operationName"),
+            context_value=self.scope,
+        )
+        if isinstance(result, ExecutionResult):
+            errors = [error.formatted for error in result.errors or []]
+            await self.send_json(
+                {"type": "error", "id": operation_id, "payload": errors}
+            )
+            return
+
+        self.operations[operation_id] = asyncio.create_task(
+            self.stream(operation_id, result)
+        )
+
+    async def stream(self, operation_id, results):
+        try:
+            async for result in results:
+                await self.send_json(
+                    {"type": "next", "id": operation_id, "payload": result.formatted}
+                )
+            await self.send_json({"type": "complete", "id": operation_id})
+        finally:
+            await results.aclose()
+            self.operations.pop(operation_id, None)